@@ -0,0 +1,185 @@
+import random
+
+import lib
+
+
+# bits of every IV mask as a tuple, so picking braces doesn't build lists
+_MASK_BITS = [tuple(lib.mask_bits(mask)) for mask in range(lib.FULL_MASK + 1)]
+
+
+class ArenaTree():
+    """
+    A breeding tree stored flat: slot 0 is the target and the parents of slot
+    i are slots 2i+1 (male) and 2i+2 (female), same layout as batch.py. The
+    IV masks, braces, genders and which slots are used live in four
+    bytearrays, so a tree is a handful of Python objects whatever its size,
+    and walking it is a loop over indexes. A slot without parents is a wild
+    (or bank) poke. Node ids are built from one counter based id per tree,
+    bank_ids holds the slots matched to bank pokes.
+    """
+    __slots__ = ('levels', 'iv', 'braced', 'gender', 'present', 'has_nature', 'id_base', 'bank_ids')
+
+    def __init__(self, levels):
+        size = (1 << levels) - 1
+        self.levels = levels
+        self.iv = bytearray(size)
+        self.braced = bytearray(size)
+        self.gender = bytearray(size)
+        self.present = bytearray(size)
+        self.has_nature = False
+        self.id_base = lib.new_id()
+        self.bank_ids = None
+
+    @property
+    def size(self):
+        return len(self.iv)
+
+    def key(self, slot):
+        return self.iv[slot] | self.gender[slot] << lib.STAT_COUNT
+
+    def has_parents(self, slot):
+        male = 2 * slot + 1
+        return male < len(self.present) and self.present[male]
+
+    def node_id(self, slot):
+        if self.bank_ids and slot in self.bank_ids:
+            return self.bank_ids[slot]
+        return f"{self.id_base}.{slot}"
+
+    def slots(self):
+        """The used slots, offspring before parents (level by level)."""
+        present = self.present
+        return (slot for slot in range(len(present)) if present[slot])
+
+    def wild_slots(self):
+        return [slot for slot in self.slots() if not self.has_parents(slot)]
+
+    def node_count(self):
+        return sum(self.present)
+
+    @classmethod
+    def from_arrays(cls, iv_row, braced_row, gender_row):
+        """A full tree from one row of batch.generate_trees."""
+        tree = cls((len(iv_row) + 1).bit_length() - 1)
+        tree.iv[:] = bytes(iv_row)
+        tree.braced[:] = bytes(braced_row)
+        tree.gender[:] = bytes(gender_row)
+        tree.present[:] = b'\x01' * len(iv_row)
+        return tree
+
+    @classmethod
+    def from_poke(cls, poke):
+        """Packs a linked lib.Poke tree (any shape where pokes have 0 or 2 parents)."""
+        depth = 0
+        pending = [(poke, 0)]
+        while pending:
+            node, level = pending.pop()
+            depth = max(depth, level)
+            if node.parent_male is not None and node.parent_female is not None:
+                pending.append((node.parent_male, level + 1))
+                pending.append((node.parent_female, level + 1))
+
+        tree = cls(depth + 1)
+        tree.has_nature = poke.has_nature
+        pending = [(poke, 0)]
+        while pending:
+            node, slot = pending.pop()
+            tree.iv[slot] = node.iv_mask
+            tree.braced[slot] = node.braced_mask
+            tree.gender[slot] = node.gender_code
+            tree.present[slot] = 1
+            if node.parent_male is not None and node.parent_female is not None:
+                pending.append((node.parent_male, 2 * slot + 1))
+                pending.append((node.parent_female, 2 * slot + 2))
+        return tree
+
+    def to_poke(self):
+        """The linked lib.Poke version of the tree (for drawing and the old API)."""
+        pokes = {}
+        for slot in self.slots():
+            poke = lib.Poke()
+            poke.id = self.node_id(slot)
+            poke.iv_mask = self.iv[slot]
+            poke.braced_mask = self.braced[slot]
+            poke.gender_code = self.gender[slot]
+            pokes[slot] = poke
+            if slot:
+                offspring = pokes[(slot - 1) // 2]
+                poke.offspring = offspring
+                if slot % 2:
+                    offspring.parent_male = poke
+                else:
+                    offspring.parent_female = poke
+        root = pokes[0]
+        root.has_nature = self.has_nature
+        return root
+
+
+def generate_tree(target, rng=None):
+    """
+    A random full breeding tree for the target, the same way
+    Poke.generate_random_parents does, filled level by level with no
+    recursion and no Poke objects. rng is an optional random.Random.
+    """
+    rng = rng if rng is not None else random
+    levels = max(lib.popcount(target.iv_mask), 1)
+    tree = ArenaTree(levels)
+    tree.has_nature = target.has_nature
+    iv, braced, gender, present = tree.iv, tree.braced, tree.gender, tree.present
+    iv[0] = target.iv_mask
+    gender[0] = target.gender_code
+    present[0] = 1
+
+    for slot in range((1 << (levels - 1)) - 1):
+        bits = _MASK_BITS[iv[slot]]
+        n = len(bits)
+        # two different stats, picked with one draw
+        first, second = divmod(rng.randrange(n * (n - 1)), n - 1)
+        if second >= first:
+            second += 1
+        brace_1, brace_2 = 1 << bits[first], 1 << bits[second]
+        common = iv[slot] & ~(brace_1 | brace_2)
+        male, female = 2 * slot + 1, 2 * slot + 2
+        if rng.random() < 0.5:
+            brace_1, brace_2 = brace_2, brace_1
+        iv[male], braced[male], gender[male] = common | brace_1, brace_1, lib.GENDER_MALE
+        iv[female], braced[female], gender[female] = common | brace_2, brace_2, lib.GENDER_FEMALE
+        present[male] = present[female] = 1
+    return tree
+
+
+def similarity_score(tree, poke_bank):
+    """lib.similarity_score on an arena tree: percentage of its pokes (the target excluded) found in the bank."""
+    bank = lib.as_poke_base(poke_bank)
+    total = matching = 0
+    for slot in tree.slots():
+        if slot:
+            total += 1
+            if bank.count(tree.key(slot)):
+                matching += 1
+    if not total:
+        return 0
+    return matching / total * 100
+
+
+def match_tree_with_pokebank(tree, poke_bank, optimal=False):
+    """
+    lib.match_tree_with_pokebank on an arena tree: matched slots get their
+    bank id in tree.bank_ids, the bank is left as it was. Returns the
+    number of bank pokes used.
+    """
+    bank = lib.as_poke_base(poke_bank)
+    slots = list(tree.slots())
+    keys = [tree.key(slot) for slot in slots]
+    if optimal:
+        keys = lib.optimal_assignment(keys, bank)
+
+    matching = lib.BankMatching(bank)
+    tree.bank_ids = {}
+    for slot, key in zip(slots, keys):
+        if key is None:
+            continue
+        matched_id = matching.consume(key)
+        if matched_id is not None:
+            tree.bank_ids[slot] = matched_id
+    return len(tree.bank_ids)
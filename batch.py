@@ -0,0 +1,210 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import arena
+import instrument
+import lib
+import snapshot
+
+
+# trees are stored as perfect binary trees, one row per tree and one column
+# per node slot: the root is slot 0 and the parents of slot i are 2i+1 (male)
+# and 2i+2 (female). Wild pokes (1 IV) sit on the last level.
+CHUNK_SIZE = 8192
+
+# how far the packed (IV mask, gender) keys go, see lib.poke_key
+KEY_COUNT = (lib.GENDER_UNKNOWN + 1) << lib.STAT_COUNT
+
+_BITS = (1 << np.arange(lib.STAT_COUNT)).astype(np.uint8)
+
+
+def tree_size(target):
+    """Number of node slots in the tree of the target (a k IV poke needs 2^k - 1)."""
+    return (1 << max(lib.popcount(target.iv_mask), 1)) - 1
+
+
+def generate_trees(target, n, rng=None):
+    """
+    Generates n random breeding trees for the target at once, the same way
+    Poke.generate_random_parents does. Returns the (n, slots) uint8 arrays of
+    IV masks, braced masks and gender codes.
+    """
+    rng = rng if rng is not None else np.random.default_rng()
+    levels = max(lib.popcount(target.iv_mask), 1)
+    slots = (1 << levels) - 1
+    iv = np.zeros((n, slots), dtype=np.uint8)
+    braced = np.zeros((n, slots), dtype=np.uint8)
+    gender = np.zeros((n, slots), dtype=np.uint8)
+    iv[:, 0] = target.iv_mask
+    gender[:, 0] = target.gender_code
+
+    for depth in range(levels - 1):
+        start, end = (1 << depth) - 1, (1 << (depth + 1)) - 1
+        mask = iv[:, start:end]
+        # a random order of the stats, stats that are not 31 go last, so the
+        # first two are a random pair of the ones to brace
+        keys = rng.random((n, end - start, lib.STAT_COUNT), dtype=np.float32)
+        keys[(mask[..., None] & _BITS) == 0] = 2
+        order = np.argsort(keys, axis=-1)
+        brace_1 = _BITS[order[..., 0]]
+        brace_2 = _BITS[order[..., 1]]
+        p1 = mask & ~brace_2
+        p2 = mask & ~brace_1
+        # randomize which one of them is the male
+        p1_male = rng.random((n, end - start)) < 0.5
+        male_slots = slice(2 * start + 1, 2 * end + 1, 2)
+        female_slots = slice(2 * start + 2, 2 * end + 1, 2)
+        iv[:, male_slots] = np.where(p1_male, p1, p2)
+        iv[:, female_slots] = np.where(p1_male, p2, p1)
+        braced[:, male_slots] = np.where(p1_male, brace_1, brace_2)
+        braced[:, female_slots] = np.where(p1_male, brace_2, brace_1)
+        gender[:, male_slots] = lib.GENDER_MALE
+        gender[:, female_slots] = lib.GENDER_FEMALE
+
+    return iv, braced, gender
+
+
+def bank_table(poke_bank):
+    """Boolean table telling which packed (IV mask, gender) keys are in the bank."""
+    table = np.zeros(KEY_COUNT, dtype=bool)
+    for key in lib.bank_stock(poke_bank):
+        table[key] = True
+    return table
+
+
+def score_trees(iv, gender, table):
+    """
+    Vectorized similarity_score: percentage of the pokes of each tree (the
+    target itself excluded) that have a match in the bank.
+    """
+    if iv.shape[1] <= 1:
+        return np.zeros(iv.shape[0])
+    keys = iv[:, 1:].astype(np.intp) | gender[:, 1:].astype(np.intp) << lib.STAT_COUNT
+    return table[keys].mean(axis=1) * 100
+
+
+def top_k(scores, k, order=None):
+    """
+    Indexes of the k best scores, best first. Ties go to the lowest order value
+    (the generation order when not given).
+    """
+    order = order if order is not None else np.arange(len(scores))
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.arange(0)
+    # everything tied with the k-th score is a candidate, the order decides
+    kth = np.partition(-scores, k - 1)[k - 1]
+    best = np.flatnonzero(-scores <= kth)
+    return best[np.lexsort((order[best], -scores[best]))][:k]
+
+
+def top_k_unique(iv, braced, gender, scores, k, order):
+    """
+    top_k without repeated trees: of equal trees (same IVs, braces and
+    genders in every slot) only the first generated one counts.
+    """
+    wanted = min(2 * k, len(scores))
+    while True:
+        candidates = top_k(scores, wanted, order)
+        packed = (iv[candidates].astype(np.uint32) | braced[candidates].astype(np.uint32) << 6
+                  | gender[candidates].astype(np.uint32) << 12)
+        by_order = np.argsort(order[candidates], kind="stable")
+        _, first = np.unique(packed[by_order], axis=0, return_index=True)
+        unique = candidates[by_order[first]]
+        if len(unique) >= k or wanted >= len(scores):
+            return unique[np.lexsort((order[unique], -scores[unique]))][:k]
+        wanted = min(4 * wanted, len(scores))
+
+
+def tree_from_arrays(iv_row, braced_row, gender_row):
+    """Builds the linked lib.Poke tree of one row of the arrays."""
+    return arena.ArenaTree.from_arrays(iv_row, braced_row, gender_row).to_poke()
+
+
+def _chunk_rng(seed, chunk):
+    # every chunk has its own stream derived from the seed, so the trees of a
+    # chunk don't depend on which worker generates it
+    return np.random.default_rng([seed, chunk])
+
+
+def _search_chunks(target_spec, table, chunks, n, k, seed, chunk_size):
+    """
+    Worker side of the search: generates and scores the given chunks, keeping
+    the local k best. Rows are numbered globally (chunk * chunk_size + row) so
+    the merge breaks ties the same way whatever the worker count.
+    """
+    target = lib.Poke()
+    target.iv_mask, target.gender_code = target_spec
+    best = None
+    for chunk in chunks:
+        size = min(chunk_size, n - chunk * chunk_size)
+        with instrument.phase("generate"):
+            iv, braced, gender = generate_trees(target, size, _chunk_rng(seed, chunk))
+        with instrument.phase("score"):
+            scores = score_trees(iv, gender, table)
+        order = np.arange(size, dtype=np.int64) + chunk * chunk_size
+        if best is not None:
+            iv = np.concatenate((best[0], iv))
+            braced = np.concatenate((best[1], braced))
+            gender = np.concatenate((best[2], gender))
+            scores = np.concatenate((best[3], scores))
+            order = np.concatenate((best[4], order))
+        with instrument.phase("sort"):
+            keep = top_k_unique(iv, braced, gender, scores, k, order)
+        best = (iv[keep], braced[keep], gender[keep], scores[keep], order[keep])
+    return best
+
+
+def search_random_trees(target, poke_bank, n=100000, k=20, seed=None, workers=1, chunk_size=CHUNK_SIZE):
+    """
+    Generates and scores n random trees in chunks, keeping the k best ones.
+    With workers > 1 the chunks are spread over a process pool (None uses
+    every core); each worker sends back its local top k and they are merged
+    here. The same seed gives the same trees whatever the worker count, and
+    a tree generated more than once is kept once.
+    Returns the tree_data dicts (best first) with the trees as lib.Poke and
+    their canonical "hash".
+    """
+    if seed is None:
+        seed = np.random.SeedSequence().entropy
+    table = bank_table(poke_bank)
+    target_spec = (target.iv_mask, target.gender_code)
+    chunks = list(range((n + chunk_size - 1) // chunk_size))
+    workers = min(workers or os.cpu_count() or 1, max(len(chunks), 1))
+
+    instrument.count("trees_generated", n)
+    if workers <= 1:
+        results = [_search_chunks(target_spec, table, chunks, n, k, seed, chunk_size)]
+    else:
+        # the workers' phases are not traced, the whole pool counts as one
+        with instrument.phase("pool"), ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                pool.submit(_search_chunks, target_spec, table, chunks[w::workers], n, k, seed, chunk_size)
+                for w in range(workers)
+            ]
+            results = [future.result() for future in futures]
+
+    # merge the local tops into the global one
+    results = [result for result in results if result is not None]
+    if not results:
+        return []
+    iv, braced, gender, scores, order = (np.concatenate(column) for column in zip(*results))
+    with instrument.phase("sort"):
+        top = snapshot.TopTrees(k)
+        # the heap does the selection, rows go in by generation order so equal
+        # scores keep the first generated tree, and the ones that can't get in
+        # are skipped before their snapshot is built
+        for row in np.argsort(order, kind="stable"):
+            score = float(scores[row])
+            if not top.accepts(score):
+                continue
+            tree = arena.ArenaTree.from_arrays(iv[row], braced[row], gender[row])
+            tree.has_nature = target.has_nature
+            top.push(score, snapshot.freeze_arena(tree))
+
+    return [
+        {"poke": snapshot.thaw(tree), "score": score, "graph": None, "hash": tree.hexdigest}
+        for score, tree in top.best()
+    ]
@@ -0,0 +1,346 @@
+"""
+Benchmarks of the breeding engine hot paths (the linked Poke trees and the
+arena ones side by side).
+
+    python -m benchmarks.run                       # full run, compared to benchmarks/baseline.json
+    python -m benchmarks.run --quick               # smaller matrix, for a quick check
+    python -m benchmarks.run --save-baseline       # store this run as the new baseline
+    python -m benchmarks.run --runs 3              # median of 3 runs per case, steadier on a busy machine
+    python -m benchmarks.run --filter similarity   # only the cases with that in the name
+
+Every case runs with fixed seeds, its time is the median/p95 of the samples
+(per call) and the memory is the tracemalloc peak of one extra call. Results
+are written as JSON, and cases slower than the baseline by more than
+--threshold are reported as regressions (exit code 1).
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import arena
+import batch
+import lib
+import plan_codec
+import render
+import replan
+import templates
+from subtree_cache import SubtreeCache
+
+
+SEED = 1234
+BASELINE_FILE = os.path.join(os.path.dirname(__file__), "baseline.json")
+
+IV_COUNTS = [2, 3, 4, 5, 6]
+BANK_SIZES = [10, 100, 1000, 10000, 100000]
+QUICK_IV_COUNTS = [2, 4, 6]
+QUICK_BANK_SIZES = [10, 1000]
+
+# each sample runs for about this long (the call is repeated to get there)
+SAMPLE_TIME = 0.005
+SAMPLES = 15
+QUICK_SAMPLES = 5
+
+
+# the plans kept by the replan case
+REPLAN_TARGETS = ["+ + + + + + (f)", "+ + + + + - (m)", "- + + + + + (f) [Nat]", "+ + + - - - (f)"]
+
+
+def make_target(ivs, nature, rng):
+    """A random female target with that many IVs."""
+    poke = lib.Poke()
+    poke.iv_mask = sum(1 << i for i in rng.sample(range(lib.STAT_COUNT), ivs))
+    poke.gender_code = lib.GENDER_FEMALE
+    poke.has_nature = nature
+    return poke
+
+
+def make_bank(size, rng):
+    """A random indexed bank, mostly pokes with few IVs like real banks."""
+    bank = lib.PokeBase()
+    for _ in range(size):
+        poke = lib.Poke()
+        ivs = rng.choice([1, 1, 1, 2, 2, 3, 4])
+        poke.iv_mask = sum(1 << i for i in rng.sample(range(lib.STAT_COUNT), ivs))
+        poke.gender_code = rng.randint(0, 1)
+        bank.add_poke(poke)
+    return bank
+
+
+def make_tree(target, rng):
+    tree = lib.Poke()
+    tree.iv_mask, tree.gender_code, tree.has_nature = target.iv_mask, target.gender_code, target.has_nature
+    tree.generate_random_parents(recursive=True, rng=rng)
+    return tree
+
+
+def target_label(ivs, nature):
+    return f"{ivs}iv" + ("+nature" if nature else "")
+
+
+def cases(iv_counts, bank_sizes):
+    """Yields (name, params, setup), setup() gives the function to time."""
+    rng = random.Random(SEED)
+    banks = {}
+
+    def bank_of(size):
+        if size not in banks:
+            banks[size] = make_bank(size, random.Random(SEED + size))
+        return banks[size]
+
+    for ivs in iv_counts:
+        for nature in (False, True):
+            label = target_label(ivs, nature)
+            params = {"ivs": ivs, "nature": nature}
+            target = make_target(ivs, nature, rng)
+            code = lib.stats_to_str(target.iv_mask, 0) + " (f)" + (" [Nat]" if nature else "")
+
+            def setup_str_to_stats(code=code):
+                poke = lib.Poke()
+                return lambda: poke.str_to_stats(code)
+            yield f"str_to_stats/{label}", params, setup_str_to_stats
+
+            def setup_generate(target=target):
+                tree_rng = random.Random(SEED)
+
+                def run():
+                    make_tree(target, tree_rng)
+                return run
+            yield f"generate_random_parents/{label}", params, setup_generate
+
+            def setup_arena_generate(target=target):
+                tree_rng = random.Random(SEED)
+                return lambda: arena.generate_tree(target, tree_rng)
+            yield f"arena_generate_tree/{label}", params, setup_arena_generate
+
+            def setup_visualize(target=target):
+                tree = make_tree(target, random.Random(SEED))
+                return lambda: render.visualize_breeding_tree(tree)
+            yield f"visualize_breeding_tree/{label}", params, setup_visualize
+
+            for size in bank_sizes:
+                bank_params = dict(params, bank=size)
+
+                def setup_match(target=target, size=size, optimal=False):
+                    tree = make_tree(target, random.Random(SEED))
+                    bank = bank_of(size)
+                    return lambda: lib.match_tree_with_pokebank(tree, bank, optimal=optimal)
+                yield f"match_tree_with_pokebank/{label}/bank{size}", bank_params, setup_match
+
+                def setup_match_optimal(target=target, size=size):
+                    return setup_match(target, size, optimal=True)
+                yield f"match_tree_with_pokebank_optimal/{label}/bank{size}", bank_params, setup_match_optimal
+
+                def setup_similarity(target=target, size=size):
+                    tree = make_tree(target, random.Random(SEED))
+                    bank = bank_of(size)
+                    root_parents = [tree.parent_male, tree.parent_female]
+                    return lambda: lib.similarity_score(bank, root_parents)
+                yield f"similarity_score/{label}/bank{size}", bank_params, setup_similarity
+
+                def setup_arena_match(target=target, size=size):
+                    tree = arena.generate_tree(target, random.Random(SEED))
+                    bank = bank_of(size)
+                    return lambda: arena.match_tree_with_pokebank(tree, bank)
+                yield f"arena_match_tree_with_pokebank/{label}/bank{size}", bank_params, setup_arena_match
+
+                def setup_arena_similarity(target=target, size=size):
+                    tree = arena.generate_tree(target, random.Random(SEED))
+                    bank = bank_of(size)
+                    return lambda: arena.similarity_score(tree, bank)
+                yield f"arena_similarity_score/{label}/bank{size}", bank_params, setup_arena_similarity
+
+                def setup_template(target=target, size=size):
+                    bank = bank_of(size)
+                    table = templates.open_table()
+                    return lambda: templates.template_plan(target, bank, table)
+                yield f"template_plan/{label}/bank{size}", bank_params, setup_template
+
+                def setup_solver(target=target, size=size):
+                    bank = bank_of(size)
+                    # a new cache for every call, so each one is a cold search
+                    return lambda: lib.find_best_tree(target, bank, cache=SubtreeCache())
+                yield f"find_best_tree/{label}/bank{size}", bank_params, setup_solver
+
+            def setup_encode(target=target):
+                result = lib.find_best_tree(target, bank_of(bank_sizes[0]))
+                return lambda: plan_codec.encode(result, bank_of(bank_sizes[0]))
+            yield f"plan_encode/{label}", params, setup_encode
+
+            def setup_decode(target=target):
+                data = plan_codec.encode(lib.find_best_tree(target, bank_of(bank_sizes[0])), bank_of(bank_sizes[0]))
+                return lambda: plan_codec.decode(data)
+            yield f"plan_decode/{label}", params, setup_decode
+
+            def setup_batch(target=target):
+                bank = bank_of(bank_sizes[-1])
+                return lambda: batch.search_random_trees(target, bank, n=10000, k=20, seed=SEED)
+            yield f"search_random_trees_10k/{label}", params, setup_batch
+
+    for size in bank_sizes:
+        def setup_replan(size=size):
+            # the plans of a few targets kept up to date while a poke comes and goes
+            planner = replan.IncrementalPlanner(lib.PokeBase(list(bank_of(size))), cache=SubtreeCache())
+            for code in REPLAN_TARGETS:
+                planner.plan(lib.Poke(code))
+            poke_rng = random.Random(SEED)
+
+            def run():
+                poke = make_bank(1, poke_rng).pokes[0]
+                planner.apply(added=[poke])
+                planner.apply(removed=[poke.id])
+            return run
+        yield f"replan_add_remove/bank{size}", {"bank": size}, setup_replan
+
+    def setup_breed():
+        pair_rng = random.Random(SEED)
+        pairs = []
+        for _ in range(256):
+            p1, p2 = lib.Poke(), lib.Poke()
+            p1.iv_mask, p2.iv_mask = pair_rng.randrange(64), pair_rng.randrange(64)
+            p1.braced_mask = 1 << pair_rng.choice(lib.mask_bits(p1.iv_mask) or [0]) & p1.iv_mask
+            p2.braced_mask = 1 << pair_rng.choice(lib.mask_bits(p2.iv_mask) or [0]) & p2.iv_mask
+            p1.gender_code, p2.gender_code = lib.GENDER_MALE, lib.GENDER_FEMALE
+            pairs.append((p1, p2))
+        index = [0]
+
+        def run():
+            p1, p2 = pairs[index[0] & 255]
+            index[0] += 1
+            lib.breed(p1, p2)
+        return run
+    yield "breed", {}, setup_breed
+
+
+def measure(func, samples):
+    """Median and p95 seconds per call, and the peak bytes allocated by one call."""
+    # warm up and find how many calls make a sample
+    start = time.perf_counter()
+    func()
+    once = time.perf_counter() - start
+    number = max(1, int(SAMPLE_TIME / once)) if once > 0 else 1000
+
+    times = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        times.append((time.perf_counter() - start) / number)
+    times.sort()
+
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "median_us": statistics.median(times) * 1e6,
+        "p95_us": times[min(len(times) - 1, int(round(0.95 * (len(times) - 1))))] * 1e6,
+        "peak_kib": peak / 1024,
+        "samples": samples,
+        "number": number,
+    }
+
+
+def compare(results, baseline, threshold):
+    """Prints how each case did against the baseline, returns the regressed case names."""
+    regressions = []
+    for name, result in results.items():
+        base = baseline.get(name)
+        if base is None:
+            print(f"{name:<60} {result['median_us']:>12.1f} us   (new)")
+            continue
+        ratio = result["median_us"] / base["median_us"] if base["median_us"] else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{name:<60} {result['median_us']:>12.1f} us   x{ratio:.2f}{flag}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks of the breeding engine")
+    parser.add_argument("--quick", action="store_true", help="smaller matrix and fewer samples")
+    parser.add_argument("--filter", default="", help="only run the cases with this in their name")
+    parser.add_argument("--output", default=None, help="where to write the JSON results")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline JSON to compare with")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--runs", type=int, default=1,
+                        help="run the matrix this many times and keep the median run of each case")
+    parser.add_argument("--threshold", type=float, default=1.25,
+                        help="median slower than baseline by this ratio is a regression")
+    args = parser.parse_args(argv)
+
+    iv_counts = QUICK_IV_COUNTS if args.quick else IV_COUNTS
+    bank_sizes = QUICK_BANK_SIZES if args.quick else BANK_SIZES
+    samples = QUICK_SAMPLES if args.quick else SAMPLES
+
+    runs = {}
+    params = {}
+    for _ in range(args.runs):
+        random.seed(SEED)
+        np.random.seed(SEED)
+        for name, case_params, setup in cases(iv_counts, bank_sizes):
+            if args.filter not in name:
+                continue
+            # generate_random_parents prints about the wild pokes, keep that out
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = measure(setup(), samples)
+            runs.setdefault(name, []).append(result)
+            params[name] = case_params
+            print(f"{name:<60} {result['median_us']:>12.1f} us  p95 {result['p95_us']:>10.1f} us  "
+                  f"peak {result['peak_kib']:>9.1f} KiB", file=sys.stderr)
+    # the run with the median time of each case, a slow or fast spell of the machine doesn't count
+    results = {}
+    for name, measured in runs.items():
+        measured.sort(key=lambda result: result["median_us"])
+        results[name] = measured[len(measured) // 2]
+
+    report = {
+        "meta": {
+            "seed": SEED,
+            "quick": args.quick,
+            "runs": args.runs,
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        },
+        "results": {name: dict(result, params=params[name]) for name, result in results.items()},
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+    regressions = []
+    if os.path.exists(args.baseline) and not args.save_baseline:
+        with open(args.baseline, "r") as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        print(f"\n{len(regressions)} regression(s) over x{args.threshold}")
+    elif not args.output and not args.save_baseline:
+        print(json.dumps(report, indent=2))
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump(report, file, indent=2)
+        print(f"baseline saved to {args.baseline}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,206 @@
+import importlib
+import io
+import json
+import logging
+import sys
+import threading
+import tracemalloc
+from time import perf_counter
+
+
+logger = logging.getLogger("pkmmo.requests")
+
+_local = threading.local()
+# cProfile and tracemalloc are process wide, one request is profiled at a time
+_profiling = threading.Lock()
+
+
+class _NoPhase():
+    # what phase() gives when nothing is traced, costs a thread-local lookup
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+
+class _Phase():
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.blocks = sys.getallocatedblocks()
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = perf_counter() - self.start
+        trace = self.trace
+        trace.phases[self.name] = trace.phases.get(self.name, 0.0) + elapsed
+        trace.calls[self.name] = trace.calls.get(self.name, 0) + 1
+        # net memory blocks the phase left allocated, a cheap stand in for tracemalloc
+        blocks = sys.getallocatedblocks() - self.blocks
+        trace.allocations[self.name] = trace.allocations.get(self.name, 0) + blocks
+        return False
+
+
+class RequestTrace():
+    """
+    Timings and counters of one request. Phases nest (a phase inside another
+    is counted in both), counters are free form: nodes built, bank lookups,
+    states expanded... With profile=True the request runs under cProfile, and
+    with memory=True under tracemalloc, both are off by default since they
+    slow everything down. Only one request of the process is profiled at a
+    time, one asking while another is profiled runs without (profiled False).
+    """
+    def __init__(self, name, profile=False, memory=False, **fields):
+        self.name = name
+        self.fields = fields
+        self.phases = {}
+        self.calls = {}
+        self.allocations = {}
+        self.counters = {}
+        self.total = None
+        self.profile_text = None
+        self.memory_top = None
+        self._profile = None
+        if profile:
+            # imported here, the profiler is only loaded by the requests that use it
+            import cProfile
+            self._profile = cProfile.Profile()
+        self._memory = memory
+        self.profiled = False
+        self._previous = None
+
+    def phase(self, name):
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def __enter__(self):
+        self._previous = getattr(_local, "trace", None)
+        _local.trace = self
+        if (self._memory or self._profile is not None) and _profiling.acquire(blocking=False):
+            # tracemalloc may have been started outside of the traces
+            if self._memory and tracemalloc.is_tracing():
+                _profiling.release()
+            else:
+                self.profiled = True
+                if self._memory:
+                    tracemalloc.start()
+                if self._profile is not None:
+                    self._profile.enable()
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.total = perf_counter() - self._start
+        if self.profiled:
+            try:
+                if self._profile is not None:
+                    self._profile.disable()
+                    import pstats
+                    out = io.StringIO()
+                    pstats.Stats(self._profile, stream=out).sort_stats("cumulative").print_stats(25)
+                    self.profile_text = out.getvalue()
+                if self._memory:
+                    snapshot = tracemalloc.take_snapshot()
+                    _, peak = tracemalloc.get_traced_memory()
+                    tracemalloc.stop()
+                    self.memory_top = {
+                        "peak_kib": round(peak / 1024, 1),
+                        "top": [str(stat) for stat in snapshot.statistics("lineno")[:10]],
+                    }
+            finally:
+                _profiling.release()
+        _local.trace = self._previous
+        return False
+
+    def to_dict(self):
+        data = {
+            "request": self.name,
+            **self.fields,
+            "total_ms": round((self.total or 0) * 1000, 3),
+            "phases_ms": {name: round(seconds * 1000, 3) for name, seconds in self.phases.items()},
+            "phase_calls": dict(self.calls),
+            "allocated_blocks": dict(self.allocations),
+            "counters": dict(self.counters),
+        }
+        if self._memory or self._profile is not None:
+            data["profiled"] = self.profiled
+        if self.memory_top is not None:
+            data["memory"] = self.memory_top
+        return data
+
+    def log(self):
+        """Writes the trace as one JSON line on the pkmmo.requests logger."""
+        logger.info(json.dumps(self.to_dict(), sort_keys=True))
+
+
+def current():
+    """The trace of the request running in this thread, None when nothing is traced."""
+    return getattr(_local, "trace", None)
+
+
+def phase(name):
+    """Times a block as a phase of the current request (does nothing when not traced)."""
+    trace = getattr(_local, "trace", None)
+    if trace is None:
+        return _NO_PHASE
+    return _Phase(trace, name)
+
+
+def count(name, n=1):
+    """Adds n to a counter of the current request."""
+    trace = getattr(_local, "trace", None)
+    if trace is not None:
+        trace.counters[name] = trace.counters.get(name, 0) + n
+
+
+# seconds the modules loaded through timed_import took, for the startup report
+import_times = {}
+
+
+def timed_import(name):
+    """Imports a module by name, the first import (not already loaded) is timed in import_times."""
+    module = sys.modules.get(name)
+    if module is None:
+        start = perf_counter()
+        module = importlib.import_module(name)
+        import_times[name] = perf_counter() - start
+    return module
+
+
+# upper bounds (ms) of the latency histogram buckets, the last one takes the rest
+LATENCY_BUCKETS_MS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+
+class Histogram():
+    """Durations counted per bucket, to_dict gives them cumulative. Not thread safe."""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        ms = seconds * 1000
+        self.count += 1
+        self.total += ms
+        for i, bound in enumerate(self.buckets):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+
+    def to_dict(self):
+        running = 0
+        cumulative = {}
+        for bound, n in zip(self.buckets, self.counts):
+            running += n
+            cumulative["+Inf" if bound == float("inf") else str(bound)] = running
+        return {"count": self.count, "sum_ms": round(self.total, 3), "le_ms": cumulative}
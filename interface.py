@@ -1,176 +1,176 @@
+import time
+run_start = time.perf_counter()
 import streamlit as st
-import lib
-from graphviz import Digraph
+import instrument
 import json
+import logging
 import os
+import sys
+import threading
+
+# The bank page only needs the Poke model and the store, the tree search and
+# drawing modules (graphviz, the template table) are imported by the page
+# that uses them, the first time it does
+lib = instrument.timed_import("lib")
+storage = instrument.timed_import("storage")
+import subtree_cache
 
 # Global variables
+POKE_BANK_DB = "poke_bank.db"
+# the old storage, imported into the database the first time and still
+# available as an export
 POKE_BANK_FILE = "poke_bank.json"
-poke_bank = []
-
-# Load Poké Bank from JSON
-def load_poke_bank():
-    if os.path.exists(POKE_BANK_FILE):
-        with open(POKE_BANK_FILE, "r") as file:
-            data = json.load(file)
-            pokes = []
-            for entry in data:
-                poke = lib.Poke()
-                poke.id = entry["id"]
-                poke.str_to_stats(entry["stats"])
-                # Ensure gender is properly set
-                if "(m)" in entry["gender"].lower():
-                    poke.gender.is_male = True
-                elif "(f)" in entry["gender"].lower():
-                    poke.gender.is_male = False
-                else:
-                    poke.gender.is_male = None
-                pokes.append(poke)
-            return pokes
-    return []
-
-# Save Poké Bank to JSON
-def save_poke_bank():
-    with open(POKE_BANK_FILE, "w") as file:
-        json.dump(
-            [
-                {
-                    "id": poke.id,
-                    "stats": poke.get_stats(),
-                    "gender": "(m)" if poke.gender.is_male else "(f)" if poke.gender.is_male is False else "(?)"
-                }
-                for poke in poke_bank
-            ],
-            file,
-            indent=4
-        )
-
-# Reset parents recursively
-def reset_parents(poke):
-    """Recursively reset parents for a Pokémon."""
-    if poke.parent_male:
-        reset_parents(poke.parent_male)
-    if poke.parent_female:
-        reset_parents(poke.parent_female)
-    poke.parent_male = None
-    poke.parent_female = None
-
-# Similarity score calculation remains the same
-def similarity_score(poke_base, root_parents):
-    """
-    Calculate the percentage of Pokémon in the tree that are present in the Poké Bank.
-    """
-    def collect_tree_pokemon(poke, collected):
-        """Recursively collect all Pokémon in the tree."""
-        if poke is None or poke in collected:
-            return
-        collected.add(poke)
-        collect_tree_pokemon(poke.parent_male, collected)
-        collect_tree_pokemon(poke.parent_female, collected)
-
-    # Collect all Pokémon in the breeding tree
-    tree_pokemon = set()
-    for parent in root_parents:
-        collect_tree_pokemon(parent, tree_pokemon)
-
-    # Compare with Poké Bank
-    matching_count = 0
-    for poke in tree_pokemon:
-        if any(
-            poke.get_stats() == pb_poke.get_stats() and poke.gender.is_male == pb_poke.gender.is_male
-            for pb_poke in poke_base
-        ):
-            matching_count += 1
-
-    # Calculate percentage
-    if not tree_pokemon:
-        return 0  # Avoid division by zero
-    return (matching_count / len(tree_pokemon)) * 100
-
-# Function to match the breeding tree with the Poké Bank
-def match_tree_with_pokebank(poke, pokebank):
-    """Traverse the tree and match Pokémon with those in the Poké Bank."""
-    # Create a copy of the Poké Bank to remove used Pokémon
-    pokebank_copy = pokebank.copy()
-
-    def normalize_stats(stats_str):
-        """Normalize stats string by replacing '*' with '+' and stripping extra spaces."""
-        return ' '.join(stats_str.replace('*', '+').split())
-
-    def traverse_and_match(poke):
-        if poke is None:
-            return
-
-        # Attempt to match this Pokémon with one in the Poké Bank
-        poke_stats = normalize_stats(poke.get_stats())
-        poke_gender = poke.gender.is_male
-
-        matched_poke = None
-        for pb_poke in pokebank_copy:
-            pb_poke_stats = normalize_stats(pb_poke.get_stats())
-            pb_poke_gender = pb_poke.gender.is_male
-
-            if poke_stats == pb_poke_stats and poke_gender == pb_poke_gender:
-                # Found a match
-                matched_poke = pb_poke
-                break
-
-        if matched_poke:
-            # Update the Pokémon's ID to match the Poké Bank Pokémon's ID
-            poke.id = matched_poke.id
-            # Remove the matched Pokémon from the Poké Bank copy to prevent reuse
-            pokebank_copy.remove(matched_poke)
-
-        # Recursively process parents
-        traverse_and_match(poke.parent_male)
-        traverse_and_match(poke.parent_female)
-
-    traverse_and_match(poke)
-
-# Visualization function updated to reflect IDs from the Poké Bank
-def visualize_breeding_tree(poke, graph=None, wild_pokes=None, poke_bank=None):
-    if graph is None:
-        graph = Digraph(format="png", graph_attr={"rankdir": "TB"})
-        wild_pokes = set()
-        # Create a set of Poké Bank IDs for quick lookup
-        pokebank_ids = set(pb_poke.id for pb_poke in poke_bank) if poke_bank else set()
-
-    def traverse(poke):
-        if poke is None:
-            return
-
-        # Check if the Pokémon's ID is in the Poké Bank IDs
-        in_bank = poke.id in pokebank_ids
-
-        # Create a label for the node
-        poke_label = f"{poke.id}\\nStats: {poke.get_stats()}\\nGender: {poke.gender}"
-        #if in_bank:
-        #    poke_label += f"\\nIn Bank: {poke.id}"
-
-        # Set node border color based on presence in Poké Bank
-        node_color = "green" if in_bank else "black"
-        node_style = "filled" if in_bank else "solid"
-        fill_color = "lightblue" if in_bank else "white"
-
-        graph.node(poke.id, poke_label, style=node_style, fillcolor=fill_color, color=node_color)
-
-        if poke.parent_male and poke.parent_female:
-            # Recursively process parents
-            traverse(poke.parent_male)
-            traverse(poke.parent_female)
-            # Add edges after ensuring parents are processed
-            graph.edge(poke.parent_male.id, poke.id)
-            graph.edge(poke.parent_female.id, poke.id)
-        else:
-            # Wild Pokémon (no parents)
-            wild_pokes.add((poke, in_bank))
-
-    traverse(poke)
-    return graph, wild_pokes
+poke_bank = lib.PokeBase()
+# import times and time to first paint in the sidebar and the log:
+# streamlit run interface.py -- --startup-report
+STARTUP_REPORT = "--startup-report" in sys.argv[1:]
+# the live search stops after this many seconds or at a perfect similarity
+# score, the best tree so far stays on screen
+STREAM_TIME_BUDGET = 10.0
+STREAM_TARGET_SCORE = 100
+
+# names of the cached steps that had to run in this rerun, the others came
+# from the Streamlit cache (the cached bodies only run on a miss)
+_computed = threading.local()
+
+def mark_computed(name):
+    if not hasattr(_computed, "names"):
+        _computed.names = set()
+    _computed.names.add(name)
+
+def reset_computed():
+    _computed.names = set()
+
+def was_computed(name):
+    return name in getattr(_computed, "names", ())
+
+# Open the Poké Bank database, importing the old JSON bank into a new one
+@st.cache_resource
+def open_poke_store():
+    store = storage.open_store(POKE_BANK_DB)
+    if store.version() == 0 and os.path.exists(POKE_BANK_FILE):
+        store.import_json(POKE_BANK_FILE)
+    return store
+
+# The table of precomputed trees, memory-mapped once per process
+@st.cache_resource
+def open_template_table():
+    return instrument.timed_import("templates").open_table()
+
+# Version stamp of the bank, every add or remove changes it
+def bank_version():
+    return open_poke_store().version()
+
+# Load Poké Bank, once per bank version (shared by every session, read only)
+@st.cache_resource(max_entries=4)
+def load_poke_bank(version):
+    mark_computed("bank")
+    return open_poke_store().load()
+
+# Search the cheapest tree for a target, bank Pokémon are used as free leaves
+@st.cache_data(max_entries=128, show_spinner="Searching the best tree...")
+def search_best_tree(target_poke_stats, version):
+    mark_computed("search")
+    poke_bank = load_poke_bank(version)
+    target_poke = lib.Poke()
+    target_poke.str_to_stats(target_poke_stats)
+    result = lib.find_best_tree(target_poke, poke_bank)
+    root_parents = [result["poke"].parent_male, result["poke"].parent_female]
+    result["score"] = lib.similarity_score(poke_bank, root_parents)
+    return result
+
+# Start drawing the tree of a search on the render pool (render caches the
+# bytes by tree hash, so equal trees are drawn once), with the wild Pokémon it
+# needs. Returns the future of the drawing and the wild Pokémon
+def submit_best_tree_render(result, poke_bank, style):
+    render = instrument.timed_import("render")
+    future = render.submit_render(result["poke"], poke_bank, style)
+    names = render.node_names(result["poke"], poke_bank)
+    wild = [
+        (names[id(poke)], poke.get_stats(), str(poke.gender), poke.id in poke_bank)
+        for poke in lib.tree_pokes(result["poke"]) if poke.parent_male is None
+    ]
+    return future, wild
+
+# Best tree each live search ended on, by (target, bank version) and shared by
+# the sessions: the final tree is the one the stream found, even when it
+# stopped on its time budget or score, not a second search
+@st.cache_resource
+def streamed_results():
+    return subtree_cache.SubtreeCache(maxsize=128)
+
+# Show every better tree while the search runs, the best one is kept in
+# streamed_results for show_best_tree
+def stream_best_tree(target_poke_stats, placeholder):
+    version = bank_version()
+    poke_bank = load_poke_bank(version)
+    target_poke = lib.Poke()
+    target_poke.str_to_stats(target_poke_stats)
+    start = time.perf_counter()
+    # the first answer is a lookup: the precomputed tree with the bank matched in
+    with instrument.phase("template"):
+        first = instrument.timed_import("templates").template_plan(target_poke, poke_bank, open_template_table())
+    show_progress(first, poke_bank, placeholder, "template", time.perf_counter() - start)
+    best = first
+    for result in lib.iter_best_trees(target_poke, poke_bank, time_budget=STREAM_TIME_BUDGET,
+                                       target_score=STREAM_TARGET_SCORE):
+        if result["cost"] >= best["cost"] and not result["exact"]:
+            continue
+        best = result
+        status = "optimal" if result["exact"] else "searching..."
+        show_progress(result, poke_bank, placeholder, status, result["elapsed"])
+    streamed_results().put((target_poke_stats, version), best)
+
+# One step of the live progress: the tree found so far and how
+def show_progress(result, poke_bank, placeholder, status, elapsed):
+    render = instrument.timed_import("render")
+    graph, _ = render.visualize_breeding_tree(result["poke"], poke_bank)
+    with placeholder.container():
+        st.write(f"Cost {result['cost']} ({status}, {elapsed * 1000:.0f} ms), "
+                 f"similarity score {result['score']:.1f}%")
+        # drawn by the browser, no dot process for the intermediate trees
+        st.graphviz_chart(graph)
+
+# What the bank edits made since a target was last shown changed in its tree,
+# from a planner kept per session that only re-plans the targets an edit touches
+def bank_changes(target_poke_stats, version):
+    replan = instrument.timed_import("replan")
+    state = st.session_state
+    if "planner" not in state:
+        state["planner"] = replan.IncrementalPlanner(load_poke_bank(version))
+        state["planner_version"] = version
+        state["bank_diffs"] = {}
+    planner = state["planner"]
+    if state["planner_version"] != version:
+        for name, update in planner.sync(load_poke_bank(version)).items():
+            state["bank_diffs"][name] = update["diff"]
+        state["planner_version"] = version
+    target_poke = lib.Poke(target_poke_stats)
+    name = replan.target_name(target_poke)
+    if name not in planner.targets:
+        planner.plan(target_poke)
+    return state["bank_diffs"].get(name, [])
+
+# One side of a changed node, ex: "+ + - * - - (m) (bred)"
+def describe_slot(slot):
+    return f"{slot['poke']} ({slot['source']})" if slot else "-"
+
+# Drop the cached bank and results, called after this session changed the bank.
+# Other sessions' writes change the version, so their entries just stop matching
+def invalidate_bank_caches():
+    load_poke_bank.clear()
+    search_best_tree.clear()
+    streamed_results().clear()
+
+# Export the Poké Bank in the JSON format
+def export_poke_bank():
+    return json.dumps(open_poke_store().export_json(), indent=4)
 
 # Page 1: Manage the Poke Bank
 def page_manage_poke_bank():
+    global poke_bank
     st.title("Poke Bank Management")
+    poke_bank = load_poke_bank(bank_version())  # Cached until the bank changes
 
     # Add Pokémon
     st.subheader("Add Pokémon")
@@ -189,37 +189,55 @@ def page_manage_poke_bank():
         try:
             new_poke = lib.Poke()
             new_poke.str_to_stats(poke_stats)
-            poke_bank.append(new_poke)
-            save_poke_bank()  # Persist the bank
+            open_poke_store().add(new_poke)  # Persist the bank
+            invalidate_bank_caches()
+            poke_bank = load_poke_bank(bank_version())
             st.success(f"Added Pokémon: {poke_stats}")
         except Exception as e:
             st.error(f"Error: {e}")
 
+    # Import a whole bank export at once
+    st.subheader("Import Pokémon")
+    upload = st.file_uploader("Bank export: JSON, CSV or one IV code per line", type=["json", "jsonl", "csv", "txt"])
+    if upload is not None and st.button("Import Pokémon to Bank"):
+        try:
+            added = open_poke_store().import_file(upload, storage.bank_file_format(upload.name))
+            invalidate_bank_caches()
+            poke_bank = load_poke_bank(bank_version())
+            st.success(f"Imported {added} Pokémon")
+        except Exception as e:
+            # the chunks before a bad entry are in the bank
+            invalidate_bank_caches()
+            poke_bank = load_poke_bank(bank_version())
+            st.error(f"Error: {e}")
+
     # Display current Pokémon in the bank
     st.subheader("Current Poke Bank")
     for poke in poke_bank:
         st.write(f"ID: {poke.id}")
         cols = st.columns(7)
-        for i, stat in enumerate(poke.stats):
+        for i in range(6):
             cols[i].button(
                 stat_labels[i],
                 key=f"bank_{poke.id}_stat_{i}",
-                disabled=not stat.is_31,
+                disabled=not poke.iv_mask >> i & 1,
                 use_container_width=True,
             )
-        cols[6].write(f"Gender: {'Male' if poke.gender.is_male else 'Female'}")
+        cols[6].write(f"Gender: {'Male' if poke.is_male else 'Female'}")
 
     # Remove Pokémon
     if poke_bank:
         poke_to_remove = st.selectbox("Select Pokémon to Remove", options=[poke.id for poke in poke_bank])
         if st.button("Remove Pokémon"):
-            poke_bank[:] = [poke for poke in poke_bank if poke.id != poke_to_remove]
-            save_poke_bank()  # Persist the bank
+            open_poke_store().remove(poke_to_remove)  # Persist the bank
+            invalidate_bank_caches()
+            poke_bank = load_poke_bank(bank_version())
             st.success(f"Removed Pokémon with ID: {poke_to_remove}")
 
 # Page 2: Find Best Tree for a Target Pokémon
 def page_find_best_tree():
     st.title("Find Best Breeding Tree")
+    render = instrument.timed_import("render")
 
     # Target Pokémon settings
     st.subheader("Target Pokémon Stats")
@@ -232,57 +250,152 @@ def page_find_best_tree():
     target_gender = cols[6].selectbox("Gender", ["Male", "Female"], key="target_gender", label_visibility="collapsed")
     target_gender_code = "(m)" if target_gender == "Male" else "(f)"
 
-    if st.button("Generate Best Tree"):
-        target_poke_stats = " ".join(target_stats) + f" {target_gender_code}"
-        try:
-            target_poke = lib.Poke()
-            target_poke.str_to_stats(target_poke_stats)
-
-            # Reset parents before generating new ones
-            reset_parents(target_poke)
-
-            best_trees = []
-
-            for _ in range(100):
-                # Ensure a clean state for each attempt
-                reset_parents(target_poke)
-                target_poke.generate_random_parents(recursive=True)
-
-                # After generating the tree, match with Poké Bank
-                match_tree_with_pokebank(target_poke, poke_bank)
-
-                # Root parents
-                root_parents = [target_poke.parent_male, target_poke.parent_female]
-                score = similarity_score(poke_bank, root_parents)
-
-                # Save the tree and score
-                tree_data = {
-                    "poke": target_poke,
-                    "score": score,
-                    "graph": None
-                }
-                best_trees.append(tree_data)
-                best_trees = sorted(best_trees, key=lambda x: x['score'], reverse=True)[:20]
-
-            # Display the best tree
-            best_tree = best_trees[0]
-            best_graph, wild_pokes = visualize_breeding_tree(best_tree["poke"], poke_bank=poke_bank)
-            best_graph.render("breeding_tree", format="png", cleanup=True)
-            st.image("breeding_tree.png")
-            st.write(f"Best Tree Similarity Score: {best_tree['score']}%")
+    target_poke_stats = " ".join(target_stats) + f" {target_gender_code}"
+    # the built in drawings don't run graphviz, better for the big 6 IV trees
+    st.radio("Tree drawing", [render.STYLE_GRAPHVIZ, render.STYLE_SVG, render.STYLE_TEXT], key="tree_style",
+             format_func={render.STYLE_GRAPHVIZ: "Graphviz", render.STYLE_SVG: "Built-in SVG",
+                          render.STYLE_TEXT: "Text"}.get, horizontal=True)
+    generate = st.button("Generate Best Tree")
+    placeholder = st.empty()
+    if generate:
+        st.session_state["shown_target"] = target_poke_stats
+    # keep showing the tree on the other reruns while the target is the same,
+    # the cache makes it free
+    if st.session_state.get("shown_target") != target_poke_stats:
+        return
+
+    profile_mode = st.session_state.get("profile_mode", "Off")
+    trace = instrument.RequestTrace("find_best_tree", profile=profile_mode == "cProfile",
+                                    memory=profile_mode == "tracemalloc", target=target_poke_stats,
+                                    generate=generate)
+    with trace:
+        if generate:
+            try:
+                with instrument.phase("stream"):
+                    stream_best_tree(target_poke_stats, placeholder)
+            except Exception as e:
+                st.error(f"Error: {e}")
+        show_best_tree(target_poke_stats, placeholder)
+    trace.log()
+    if st.session_state.get("show_timings"):
+        show_request_trace(trace)
+
+# Show the final tree of a target (replaces the live progress)
+def show_best_tree(target_poke_stats, placeholder):
+    render = instrument.timed_import("render")
+    try:
+        version = bank_version()
+        with instrument.phase("search_cached"):
+            result = streamed_results().get((target_poke_stats, version))
+            streamed = result is not None
+            if not streamed:
+                result = search_best_tree(target_poke_stats, version)
+        style = st.session_state.get("tree_style", render.STYLE_GRAPHVIZ)
+        poke_bank = load_poke_bank(version)
+        with instrument.phase("render"):
+            future, wild_pokes = submit_best_tree_render(result, poke_bank, style)
+        drawn = future.done()
+
+        # Display the best tree
+        with instrument.phase("display"), placeholder.container():
+            drawing_slot = st.empty()
+            if not drawn:
+                # drawn by the browser until the render is done, the rest of the page doesn't wait for it
+                graph, _ = render.visualize_breeding_tree(result["poke"], poke_bank)
+                drawing_slot.graphviz_chart(graph)
+            st.write(f"Best Tree Similarity Score: {result['score']}%")
+            st.write(f"Breeds: {result['breeds']}, Wild Pokémon: {result['wild']}, "
+                     f"From Poké Bank: {result['bank_used']} (states expanded: {result['expanded']})")
+            if not result["exact"]:
+                st.warning("Search budget ran out, this is the best tree found but it may not be optimal.")
+            changes = bank_changes(target_poke_stats, version)
+            if changes:
+                st.info(f"The bank changed since this tree was first shown, {len(changes)} node(s) changed:")
+                st.table([
+                    {"slot": change["slot"], "before": describe_slot(change["before"]),
+                     "after": describe_slot(change["after"])}
+                    for change in changes
+                ])
+            if streamed:
+                search_source = "from the live search"
+            else:
+                search_source = "computed" if was_computed("search") else "from cache"
+            render_source = "from cache" if drawn else "computed"
+            st.caption(f"Search {search_source}, graph {render_source} (bank version {version})")
+            cache_stats = subtree_cache.shared_cache.stats()
+            st.caption(f"Subtree cache: {cache_stats['size']}/{cache_stats['maxsize']} entries, "
+                       f"{cache_stats['hits']} hits, {cache_stats['misses']} misses, "
+                       f"{cache_stats['evictions']} evictions")
 
             st.subheader("Wild Pokémon Required:")
-            for wild_poke, in_bank in wild_pokes:
+            for wild_id, wild_stats, wild_gender, in_bank in wild_pokes:
                 bank_status = "[in Poké Bank]" if in_bank else ""
-                st.write(f"ID: {wild_poke.id}, Stats: {wild_poke.get_stats()}, Gender: {wild_poke.gender} {bank_status}")
-            
-        except Exception as e:
-            st.error(f"Error: {e}")
+                st.write(f"ID: {wild_id}, Stats: {wild_stats}, Gender: {wild_gender} {bank_status}")
+
+        with instrument.phase("render_wait"):
+            show_drawing(drawing_slot, future.result(), style)
+
+    except Exception as e:
+        st.error(f"Error: {e}")
+
+# Put the rendered tree in its place on the page
+def show_drawing(drawing_slot, drawing, style):
+    render = instrument.timed_import("render")
+    if style == render.STYLE_GRAPHVIZ:
+        drawing_slot.image(drawing)
+    elif style == render.STYLE_SVG:
+        drawing_slot.markdown(drawing.decode(), unsafe_allow_html=True)
+    else:
+        drawing_slot.code(drawing.decode(), language=None)
+
+# Sidebar panel with the timings and counters of the last request
+def show_request_trace(trace):
+    with st.sidebar.expander("Request timings", expanded=True):
+        data = trace.to_dict()
+        st.write(f"Total: {data['total_ms']:.1f} ms")
+        st.table([
+            {"phase": name, "ms": ms, "calls": data["phase_calls"][name],
+             "allocated blocks": data["allocated_blocks"][name]}
+            for name, ms in sorted(data["phases_ms"].items(), key=lambda item: -item[1])
+        ])
+        st.json(data["counters"])
+        if data.get("profiled") is False:
+            st.write("Not profiled, the profiler was busy with another request")
+        if trace.profile_text:
+            st.code(trace.profile_text, language=None)
+        if trace.memory_top:
+            st.json(trace.memory_top)
+
+# Time the first run of the script took in this process, once per process
+@st.cache_resource
+def first_paint():
+    return {}
+
+# Sidebar panel of the startup report: lazy imports and time to first paint
+def show_startup_report(first_paint_ms):
+    with st.sidebar.expander("Startup report"):
+        st.write(f"First paint: {first_paint_ms:.1f} ms")
+        st.table([
+            {"module": name, "import ms": round(seconds * 1000, 1)}
+            for name, seconds in sorted(instrument.import_times.items(), key=lambda item: -item[1])
+        ])
 
 # Main Application
-poke_bank = load_poke_bank()  # Load the bank at startup
+# one JSON line per request on the console (added once, the script reruns)
+if not instrument.logger.handlers:
+    log_handler = logging.StreamHandler()
+    log_handler.setFormatter(logging.Formatter("%(message)s"))
+    instrument.logger.addHandler(log_handler)
+    instrument.logger.setLevel(logging.INFO)
+reset_computed()
 st.sidebar.title("Poke Breeding Simulator")
 page = st.sidebar.radio("Navigate", ["Manage Poke Bank", "Find Best Tree for Target Poke"])
+if st.sidebar.button("Export Poke Bank (JSON)"):
+    st.sidebar.download_button("Download", export_poke_bank(), file_name=POKE_BANK_FILE, mime="application/json")
+
+st.sidebar.checkbox("Show request timings", key="show_timings")
+st.sidebar.selectbox("Profile requests", ["Off", "cProfile", "tracemalloc"], key="profile_mode",
+                     help="Slows the request down, only for looking into slow ones")
 
 st.sidebar.markdown("---")  # Adds a horizontal line for separation
 st.sidebar.markdown("Liked this application? Send a gift in-game to <Moriarttie> :D")
@@ -290,5 +403,17 @@ st.sidebar.markdown("Liked this application? Send a gift in-game to <Moriarttie>
 if page == "Manage Poke Bank":
     page_manage_poke_bank()
 elif page == "Find Best Tree for Target Poke":
+    open_template_table()
     page_find_best_tree()
 
+if STARTUP_REPORT:
+    startup = first_paint()
+    if "ms" not in startup:
+        startup["ms"] = (time.perf_counter() - run_start) * 1000
+        instrument.logger.info(json.dumps({
+            "startup": {"first_paint_ms": round(startup["ms"], 3),
+                        "imports_ms": {name: round(seconds * 1000, 3)
+                                       for name, seconds in instrument.import_times.items()}},
+        }, sort_keys=True))
+    show_startup_report(startup["ms"])
+
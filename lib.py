@@ -1,21 +1,222 @@
 from uuid import uuid4 as uid
+from itertools import count as counter
 from random import randint, sample
-import re
+from heapq import heappush, heappop
+from threading import RLock
+from time import perf_counter
+
+import instrument
+import subtree_cache
+
+
+# gender codes, small ints so they can be packed next to the iv mask
+GENDER_FEMALE = 0
+GENDER_MALE = 1
+GENDER_UNKNOWN = 2
+
+STAT_COUNT = 6
+FULL_MASK = (1 << STAT_COUNT) - 1
+
+
+# ids are a random per process prefix plus a counter, without a uuid4 per
+# poke. `poke.id in bank` tells bank pokes from the others, so an id must not
+# come out again in another process: 48 random bits (12 hex) make a prefix
+# collision with the processes that filled a bank very unlikely, 20 didn't
+_ID_PREFIX = uid().hex[:12]
+_id_counter = counter()
+
+
+def new_id():
+    return f"{_ID_PREFIX}{next(_id_counter):x}"
+
+
+def popcount(mask):
+    return bin(mask).count('1')
+
+
+# popcount of every IV mask, for the solver's hot loops
+_MASK_BITS = [popcount(mask) for mask in range(FULL_MASK + 1)]
+
+
+def mask_bits(mask):
+    """Indexes of the stats set in an IV mask, ex: 0b100001 -> [0, 5]"""
+    return [i for i in range(STAT_COUNT) if mask >> i & 1]
+
+
+def poke_key(iv_mask, gender_code):
+    """Packs an (IV mask, gender) pair into a single int, braced stats are not part of it."""
+    return iv_mask | gender_code << STAT_COUNT
+
+
+def stats_to_str(iv_mask, braced_mask):
+    return ' '.join(
+        '*' if braced_mask >> i & 1 else '+' if iv_mask >> i & 1 else '-'
+        for i in range(STAT_COUNT)
+    )
+
+
+# display strings for every (iv, braced) combination, so get_stats is a lookup
+_STATS_STR = {}
+for _iv in range(FULL_MASK + 1):
+    for _braced in range(FULL_MASK + 1):
+        if _braced & ~_iv == 0:
+            _STATS_STR[(_iv, _braced)] = stats_to_str(_iv, _braced)
+
+# and back: the masks of every stats code without its spaces ("++-*--")
+_CODE_MASKS = {code.replace(' ', ''): masks for masks, code in _STATS_STR.items()}
+_GENDER_CHARS = {'m': GENDER_MALE, 'f': GENDER_FEMALE}
+
+
+def parse_code(code):
+    """
+    (iv_mask, braced_mask, gender_code, has_nature) of an IV code like
+    "+ * - - + - (f) [Nat]", gender_code is None when the code has no gender.
+    A table lookup, fast enough for bank files of 100k+ lines.
+    """
+    code = code.replace(' ', '').strip()
+    masks = _CODE_MASKS.get(code[:STAT_COUNT])
+    if masks is None:
+        # other characters than + and * read as -
+        iv_mask = braced_mask = 0
+        for i, c in enumerate(code[:STAT_COUNT]):
+            if c == '*':
+                braced_mask |= 1 << i
+            if c in '+*':
+                iv_mask |= 1 << i
+        masks = iv_mask, braced_mask
+    gender_code = None
+    start = code.find('(')
+    if start >= 0 and code[start + 2:start + 3] == ')':
+        gender_code = _GENDER_CHARS.get(code[start + 1].lower(), GENDER_UNKNOWN)
+    return masks[0], masks[1], gender_code, "[Nat]" in code
 
 
 class PokeBase():
-    def __init__(self):
-        self.pokes = []
-    
+    """
+    The bank, indexed by (IV mask, gender) key: each key maps to the ids of
+    the bank pokes that have it (a multiset of interchangeable pokes), so
+    lookups are O(1) whatever the size of the bank. Braced stats are not part
+    of the key. A poke must not change its IVs or gender while it is in the
+    bank. Matching a tree never edits the bank (see BankMatching), so one
+    bank can be read by several threads at once.
+    """
+    def __init__(self, pokes=()):
+        self._by_id = {}
+        # key -> {id: None}, an ordered set so the first added poke goes first
+        self._ids = {}
+        # key -> number of bank pokes with it
+        self._counts = {}
+        self.add_pokes(pokes)
+
+    @property
+    def pokes(self):
+        return list(self._by_id.values())
+
+    def __iter__(self):
+        return iter(self._by_id.values())
+
+    def __len__(self):
+        return len(self._by_id)
+
     def add_poke(self, poke):
-        if poke not in self.pokes:
-            self.pokes.append(poke)
-             
+        return self.add_pokes((poke,))
+
+    def add_pokes(self, pokes):
+        """Adds pokes from any iterable, ids already in the bank are skipped. Returns how many were added."""
+        by_id, by_key, counts = self._by_id, self._ids, self._counts
+        added = 0
+        for poke in pokes:
+            poke_id = poke.id
+            if poke_id in by_id:
+                continue
+            key = poke.iv_mask | poke.gender_code << STAT_COUNT
+            by_id[poke_id] = poke
+            ids = by_key.get(key)
+            if ids is None:
+                ids = by_key[key] = {}
+            ids[poke_id] = None
+            counts[key] = counts.get(key, 0) + 1
+            added += 1
+        return added
+
+    def remove_poke(self, poke_id):
+        """Removes a poke (or the poke with that id) from the bank."""
+        poke_id = getattr(poke_id, 'id', poke_id)
+        poke = self._by_id.pop(poke_id, None)
+        if poke is None:
+            return None
+        self._ids.get(poke.key, {}).pop(poke_id, None)
+        self._counts[poke.key] -= 1
+        if not self._counts[poke.key]:
+            del self._counts[poke.key]
+            self._ids.pop(poke.key, None)
+        return poke
+
+    def remove_pokes(self, poke_ids):
+        """Removes pokes (or ids), returns how many were in the bank."""
+        return sum(1 for poke_id in poke_ids if self.remove_poke(poke_id) is not None)
+
+    def __contains__(self, poke_id):
+        """`poke_id in bank`, a poke can be given instead of its id"""
+        return getattr(poke_id, 'id', poke_id) in self._by_id
+
+    def get(self, poke_id):
+        return self._by_id.get(poke_id)
+
+    def ids(self, key):
+        """Ids of the bank pokes with that key, in the order they were added."""
+        return list(self._ids.get(key, ()))
+
+    def iter_ids(self, key):
+        """ids() without the copy, the bank must not change while it is read."""
+        return iter(self._ids.get(key, ()))
+
+    def count(self, key):
+        """How many bank pokes have that key."""
+        return self._counts.get(key, 0)
+
+    def counts(self):
+        """key -> number of bank pokes with it"""
+        return dict(self._counts)
+
+
+class BankMatching():
+    """
+    The bank pokes taken by one matching of a tree, kept apart from the bank:
+    the bank is only read, so matchings on a shared bank (like the ones
+    PokeStore.load gives) don't see each other. Use one per matching and
+    drop it after. Taking a poke is O(1) whatever the size of the bank.
+    There is no release: a tree is matched in one pass, matching it again
+    (after a bank edit, say) is a new BankMatching, which costs nothing.
+    """
+    def __init__(self, poke_bank):
+        self.bank = as_poke_base(poke_bank)
+        # key -> how many of its bank pokes this matching took
+        self._taken = {}
+        # key -> iterator on the bank's ids of the key, the next one taken comes from it
+        self._next = {}
+
+    def available(self, key):
+        """How many bank pokes with that key this matching hasn't taken."""
+        return self.bank.count(key) - self._taken.get(key, 0)
+
+    def consume(self, key):
+        """Takes a bank poke with that key, returns its id (None if there is none left)."""
+        taken = self._taken.get(key, 0)
+        if taken >= self.bank.count(key):
+            return None
+        ids = self._next.get(key)
+        if ids is None:
+            # the first added poke is the first taken
+            ids = self._next[key] = self.bank.iter_ids(key)
+        self._taken[key] = taken + 1
+        return next(ids)
+
 
 class Stat():
     def __init__(self, is_31=False, braced=False):
-        self.is_31 = False
-        self.is_braced = False
+        self.is_31 = is_31 or braced
+        self.is_braced = braced
 
     def str_to_stat(self, stat_str):
         is_braced = stat_str == '*'
@@ -45,9 +246,7 @@ class Gender():
         self.is_male = is_male
 
     def str_to_gender(self, gender_code):
-        gender_code.replace('(','')
-        gender_code.replace(')','')
-        gender_code.replace(' ','')
+        gender_code = gender_code.replace('(','').replace(')','').replace(' ','')
         if gender_code == 'm':
             self.is_male = True
         elif gender_code == 'f':
@@ -61,137 +260,1016 @@ class Gender():
             g = 'm'
         elif self.is_male == False:
             g = 'f'
-        elif self.is_genderless == None:
-            g = '*'
         return f"({g})"
 
 
+class _PokeStat(Stat):
+    # stat i of a poke, reading and setting it goes to the poke's masks
+    def __init__(self, poke, i):
+        self._poke = poke
+        self._bit = 1 << i
+
+    @property
+    def is_31(self):
+        return bool(self._poke.iv_mask & self._bit)
+
+    @is_31.setter
+    def is_31(self, value):
+        if value:
+            self._poke.iv_mask |= self._bit
+        else:
+            # a stat that isn't 31 can't be braced
+            self._poke.iv_mask &= ~self._bit
+            self._poke.braced_mask &= ~self._bit
+
+    @property
+    def is_braced(self):
+        return bool(self._poke.braced_mask & self._bit)
+
+    @is_braced.setter
+    def is_braced(self, value):
+        if value:
+            # a braced stat is 31, like Stat(braced=True)
+            self._poke.iv_mask |= self._bit
+            self._poke.braced_mask |= self._bit
+        else:
+            self._poke.braced_mask &= ~self._bit
+
+
+class _PokeNature(Nature):
+    # the nature of a poke, setting it sets the poke's
+    def __init__(self, poke):
+        self._poke = poke
+
+    @property
+    def has_nature(self):
+        return self._poke.has_nature
+
+    @has_nature.setter
+    def has_nature(self, value):
+        self._poke.has_nature = bool(value)
+
+
+class _PokeGender(Gender):
+    # the gender of a poke, setting it sets the poke's
+    def __init__(self, poke):
+        self._poke = poke
+
+    @property
+    def is_male(self):
+        return self._poke.is_male
+
+    @is_male.setter
+    def is_male(self, value):
+        self._poke.is_male = value
+
+
 class Poke():
+    # the whole IV state lives in two 6 bit masks: bit i is set in iv_mask when
+    # stat i is 31 and in braced_mask when it also holds a brace for breeding.
+    # Stat/Gender/Nature objects are views on them, built on demand
+    __slots__ = ('id', 'iv_mask', 'braced_mask', 'gender_code', 'has_nature',
+                 'parent_male', 'parent_female', 'offspring')
+
     def __init__(self, stats=None):
-        self.id = uid().hex[:7]
-        self.stats = [Stat() for i in range(6)]
-        self.gender = Gender(None)
-        self.nature = Nature()
+        self.id = new_id()
+        self.iv_mask = 0
+        self.braced_mask = 0
+        self.gender_code = GENDER_UNKNOWN
+        self.has_nature = False
         self.parent_male = None
         self.parent_female = None
         self.offspring = None
         if stats:
             self.str_to_stats(stats)
 
+    @property
+    def key(self):
+        return self.iv_mask | self.gender_code << STAT_COUNT
+
+    @property
+    def is_male(self):
+        if self.gender_code == GENDER_MALE:
+            return True
+        if self.gender_code == GENDER_FEMALE:
+            return False
+        return None
+
+    @is_male.setter
+    def is_male(self, value):
+        if value is None:
+            self.gender_code = GENDER_UNKNOWN
+        else:
+            self.gender_code = GENDER_MALE if value else GENDER_FEMALE
+
+    # views on the masks, so the old idioms (poke.stats[i].is_31 = True,
+    # poke.gender.is_male = False) still edit the poke. The stats are a tuple,
+    # a stat can be edited but not replaced
+    @property
+    def stats(self):
+        return tuple(_PokeStat(self, i) for i in range(STAT_COUNT))
+
+    @property
+    def gender(self):
+        return _PokeGender(self)
+
+    @property
+    def nature(self):
+        return _PokeNature(self)
+
     def str_to_stats(self, stats_code):
-        stats_code = stats_code.replace(' ','').strip()
-        new_stats = []
-        for i in range(6):
-            s = Stat()
-            s.str_to_stat(stats_code[i])
-            new_stats.append(s)
-        self.stats = new_stats
+        self.iv_mask, self.braced_mask, gender_code, has_nature = parse_code(stats_code)
         # getting the gender
-        pattern = r'\((.)\)'
-        match = re.search(pattern, stats_code)
-        if match:
-            g = match.group(1)
-            gender = Gender()
-            gender.str_to_gender(g)
-            self.gender = gender
+        if gender_code is not None:
+            self.gender_code = gender_code
         # getting the nature
-        if "[Nat]" in stats_code:
-            self.nature = True
+        if has_nature:
+            self.has_nature = True
 
     def get_stats(self):
-        return ' '.join([str(s) for s in self.stats])
+        return _STATS_STR[(self.iv_mask, self.braced_mask)]
 
-    def generate_random_parents(self, recursive=False):
+    def generate_random_parents(self, recursive=False, rng=None):
+        # rng is an optional random.Random, so a tree can be reproduced from a seed
+        rng_sample = rng.sample if rng is not None else sample
+        rng_randint = rng.randint if rng is not None else randint
         # checking if there is not parents already
         assert (self.parent_male == None) and (self.parent_female == None), "pkmn already has parents"
-        # check if the pokemon has 1 or less IV in 31
-        if sum([int(s.is_31) for s in self.stats])<=1:
-            print("this pkmn doesnt need a parent")
-            return None, None
-        # make a list of stats that needs to be inherited (save only the index, ex: [0,5] is to save HP and Speed
-        stats_to_inherit = []
-        for i, stat in enumerate(self.stats):
-            if stat.is_31:
-                stats_to_inherit.append(i)
-        # now, randomly select 2 of those stats to pass on
-        stats_to_brace = sample(stats_to_inherit, min(len(stats_to_inherit),2))
-        # now select the stats that both mom and dad should have in commom, so neither should brace
-        stats_to_inherit = [v for v in stats_to_inherit if v not in stats_to_brace]
-        # creates the instances of both parents
-        p1, p2 = Poke(), Poke()
-        # apply to both mom and dad the stats that both should have in commom
-        for stat in stats_to_inherit:
-            p1.stats[stat].is_31 = True
-            p2.stats[stat].is_31 = True
-        # also apply one stat to be braced in one of the parents
-        p1.stats[stats_to_brace[0]].is_braced = True
-        p1.stats[stats_to_brace[0]].is_31 = True
-        # if there's 2 stats to brace, also apply it to the other parent
-        if len(stats_to_brace) == 2:
-            p2.stats[stats_to_brace[1]].is_braced = True
-            p2.stats[stats_to_brace[1]].is_31 = True
-        # randomize the gender for each parent (assuring one is opposite of the other)
-        gender_seed = bool(randint(0,1))
-        gender_pair = [gender_seed, not gender_seed]
-        p1.gender.is_male = gender_pair[0]
-        p2.gender.is_male = gender_pair[1]
-        p_male, p_female = [p1,p2] if p1.gender.is_male else [p2,p1]
-        # make a temporary variable for storing the male and female parent
-        self.parent_male = p_male
-        self.parent_female = p_female
-        # add the address of the son on each parent "offspring" attribute
-        p_male.offspring = self
-        p_female.offspring = self
-        # now the magic, apply this same code recursively on each parent
-        if recursive:
-            p_male.generate_random_parents(recursive=True)
-            p_female.generate_random_parents(recursive=True)
-        return p1, p2
+        first = None, None
+        # the pokes still to give parents to, walked in the order a recursion
+        # would (male side first) so a seed gives the same tree
+        pending = [self]
+        while pending:
+            poke = pending.pop()
+            # check if the pokemon has 1 or less IV in 31
+            stats_to_inherit = mask_bits(poke.iv_mask)
+            if len(stats_to_inherit) <= 1:
+                print("this pkmn doesnt need a parent")
+                continue
+            # now, randomly select 2 of those stats to pass on
+            brace_1, brace_2 = rng_sample(stats_to_inherit, 2)
+            # the stats that both mom and dad should have in commom, so neither should brace
+            common = poke.iv_mask & ~(1 << brace_1 | 1 << brace_2)
+            # creates both parents, each one bracing one of the selected stats
+            p1, p2 = Poke(), Poke()
+            p1.iv_mask = common | 1 << brace_1
+            p1.braced_mask = 1 << brace_1
+            p2.iv_mask = common | 1 << brace_2
+            p2.braced_mask = 1 << brace_2
+            # randomize the gender for each parent (assuring one is opposite of the other)
+            if rng_randint(0,1):
+                p1.gender_code, p2.gender_code = GENDER_MALE, GENDER_FEMALE
+                p_male, p_female = p1, p2
+            else:
+                p1.gender_code, p2.gender_code = GENDER_FEMALE, GENDER_MALE
+                p_male, p_female = p2, p1
+            poke.parent_male = p_male
+            poke.parent_female = p_female
+            # add the address of the son on each parent "offspring" attribute
+            p_male.offspring = poke
+            p_female.offspring = poke
+            if poke is self:
+                first = p1, p2
+            # now the magic, do the same on each parent
+            if recursive:
+                pending.append(p_female)
+                pending.append(p_male)
+        return first
 
     def __str__(self):
-        s = self.get_stats()
-        g = str(self.gender)
-        n = str(self.nature)
-        if self.gender == True:
-            g = 'm'
-        if self.gender == False:
-            g = 'f'
-        return f"{self.id}: {s} {g} {n}"
+        return f"{self.id}: {self.get_stats()} {self.gender} {self.nature}"
+
+def reset_parents(poke):
+    """Unlinks every poke of a tree from its parents and offspring (no recursion)."""
+    pending = [poke]
+    while pending:
+        poke = pending.pop()
+        if poke.parent_male is not None:
+            pending.append(poke.parent_male)
+        if poke.parent_female is not None:
+            pending.append(poke.parent_female)
+        poke.parent_male = None
+        poke.parent_female = None
+        poke.offspring = None
+
 
 def breed(p1, p2):
-    p1, p2 = (p1,p2) if p1.gender.is_male else (p2,p1)
-
-    p1t = str(p1)
-    p1o = p1
-
-    p2t = str(p2)
-    p2o = p2
-    
-    nature = "[Nat]" if "[Nat]" in p1t or "[Nat]" in p2t else ""
-    p1_stats = p1t.split(':')[-1].split('(')[0].replace(' ','').strip()
-    p2_stats = p2t.split(':')[-1].split('(')[0].replace(' ','').strip()
-    new_stats = list('------')
-
-    new_gender = ['m','f'][randint(0,1)]
-    for i in range(6):
-        p1_stat = p1_stats[i]
-        p2_stat = p2_stats[i]
-        
-        if p1_stat == p2_stat:
-            new_stats[i] = p1_stat
-
-        if (p1_stat == '*') or (p2_stat == '*'):
-            new_stats[i] = '+'
+    p1, p2 = (p1,p2) if p1.is_male else (p2,p1)
+
+    # a stat is kept when both parents share it, or when any of them braces it
     offspring = Poke()
-    s = f"{' '.join(new_stats)} ({new_gender}) {hold_nature}"
-    print(s)
-    offspring.str_to_stats(s)
-    offspring.parent_male = p1o
-    offspring.parent_female = p2o
-    p1o.offspring = offspring
-    p2o.offspring = offspring
+    offspring.iv_mask = (p1.iv_mask & p2.iv_mask) | p1.braced_mask | p2.braced_mask
+    offspring.gender_code = randint(0,1)
+    offspring.has_nature = p1.has_nature or p2.has_nature
+    offspring.parent_male = p1
+    offspring.parent_female = p2
+    p1.offspring = offspring
+    p2.offspring = offspring
     return offspring
 
+
+def as_poke_base(poke_bank):
+    """The bank as an indexed PokeBase (a list of pokes gets indexed once)."""
+    if isinstance(poke_bank, PokeBase):
+        return poke_bank
+    return PokeBase(poke_bank or ())
+
+
+def tree_pokes(poke):
+    """Every poke of a tree, offspring before parents and male before female."""
+    pokes = []
+    seen = set()
+    stack = [poke]
+    while stack:
+        poke = stack.pop()
+        if poke is None or id(poke) in seen:
+            continue
+        seen.add(id(poke))
+        pokes.append(poke)
+        stack.append(poke.parent_female)
+        stack.append(poke.parent_male)
+    return pokes
+
+
+def similarity_score(poke_bank, root_parents):
+    """
+    Calculate the percentage of Pokémon in the tree that are present in the Poké Bank.
+    """
+    with instrument.phase("score"):
+        bank = as_poke_base(poke_bank)
+        tree_pokemon = {}
+        for parent in root_parents:
+            for poke in tree_pokes(parent):
+                tree_pokemon[id(poke)] = poke
+        if not tree_pokemon:
+            return 0  # Avoid division by zero
+        matching_count = sum(1 for poke in tree_pokemon.values() if bank.count(poke.key))
+        instrument.count("bank_lookups", len(tree_pokemon))
+        return (matching_count / len(tree_pokemon)) * 100
+
+
+def _fitting_keys(key, bank):
+    # bank keys that can stand in for a poke: same gender and at least its
+    # IVs, the exact key first and then the ones with the fewest extra IVs
+    mask, gender = key & FULL_MASK, key >> STAT_COUNT
+    extra = FULL_MASK & ~mask
+    keys = []
+    sub = extra
+    while True:
+        bank_key = poke_key(mask | sub, gender)
+        if bank.count(bank_key):
+            keys.append(bank_key)
+        if not sub:
+            break
+        sub = (sub - 1) & extra
+    keys.sort(key=lambda k: popcount(k & FULL_MASK))
+    return keys
+
+
+def optimal_assignment(keys, bank):
+    """
+    Maximum matching of tree pokes (given by key) to bank keys, each bank key
+    takes as many pokes as it has free bank pokes and a poke can take a bank
+    key with extra IVs. Returns the bank key given to each poke (None when
+    it gets none), grown one augmenting path at a time.
+    """
+    fitting = [_fitting_keys(key, bank) for key in keys]
+    assigned = {}
+    node_key = [None] * len(keys)
+
+    def augment(i, visited):
+        for key in fitting[i]:
+            if key in visited:
+                continue
+            visited.add(key)
+            holders = assigned.setdefault(key, [])
+            if len(holders) < bank.count(key):
+                holders.append(i)
+                node_key[i] = key
+                return True
+            for j in list(holders):
+                if augment(j, visited):
+                    holders.remove(j)
+                    holders.append(i)
+                    node_key[i] = key
+                    return True
+        return False
+
+    for i in range(len(keys)):
+        augment(i, set())
+    return node_key
+
+
+def match_tree_with_pokebank(poke, pokebank, optimal=False):
+    """
+    Traverse the tree and give the tree pokes the ids of the bank pokes they
+    match, each bank poke is used once. By default a tree poke takes the first
+    free bank poke with the same IVs and gender. With optimal=True a bank poke
+    with extra IVs can stand in too, and the assignment uses as many bank pokes
+    as possible (where first-match could waste one on the wrong node).
+    The bank is left as it was. Returns the number of bank pokes used.
+    """
+    with instrument.phase("match"):
+        bank = as_poke_base(pokebank)
+        nodes = tree_pokes(poke)
+        if optimal:
+            keys = optimal_assignment([node.key for node in nodes], bank)
+        else:
+            keys = [node.key for node in nodes]
+
+        matching = BankMatching(bank)
+        used = 0
+        for node, key in zip(nodes, keys):
+            if key is None:
+                continue
+            matched_id = matching.consume(key)
+            if matched_id is not None:
+                node.id = matched_id
+                used += 1
+        instrument.count("bank_lookups", len(nodes))
+        return used
+
+
+# costs used by the optimal tree solver, bank pokes are always free
+BREED_COST = 1
+WILD_COST = 1
+
+
+def _mask_splits(mask):
+    # every way of breeding a poke with this IV mask: the male parent braces
+    # stat a and lacks b, the female parent braces b and lacks a
+    splits = []
+    for a in mask_bits(mask):
+        for b in mask_bits(mask):
+            if a != b:
+                male = poke_key(mask & ~(1 << b), GENDER_MALE)
+                female = poke_key(mask & ~(1 << a), GENDER_FEMALE)
+                splits.append((a, b, male, female))
+    return splits
+
+_SPLITS = [_mask_splits(mask) for mask in range(FULL_MASK + 1)]
+
+
+def bank_stock(poke_bank):
+    """Counts the bank pokes available for each (IV mask, gender) key."""
+    if isinstance(poke_bank, PokeBase):
+        return poke_bank.counts()
+    stock = {}
+    for poke in poke_bank:
+        stock[poke.key] = stock.get(poke.key, 0) + 1
+    return stock
+
+
+# stock count for bank keys that can never run out in a given search
+UNLIMITED = -1
+# how many options the solver may look at before settling for the best one found
+MAX_SOLVER_STEPS = 100000
+# steps of each slice of the anytime search, around 20ms
+SOLVER_SLICE_STEPS = 1000
+# steps the joint search of several targets gets before they are planned in turn
+JOINT_SOLVER_STEPS = 10000
+
+
+class _SearchBudgetExceeded(Exception):
+    pass
+
+
+def _add_usage(usage_1, usage_2, stock):
+    # sums two bank usages (sorted (key, count) tuples), clipped to the stock
+    if not usage_1:
+        return usage_2
+    if not usage_2:
+        return usage_1
+    merged = dict(usage_1)
+    for key, count in usage_2:
+        merged[key] = min(merged.get(key, 0) + count, stock[key])
+    return tuple(sorted(merged.items()))
+
+
+class _Options():
+    """
+    Lazy list of the ways of getting one (IV mask, gender) state, sorted by
+    cost. Each option is (cost, base, usage, how): `usage` counts the scarce
+    bank pokes it takes and `base` is what it would cost breeding those
+    instead, pairs of parent options are only generated when asked for.
+    The lists live in the subtree cache, so they get the solver that is
+    working on them on each call instead of keeping one, and each list has
+    its own lock: searches of several sessions can share them. A list only
+    ever asks its parents' lists (fewer IVs) for options, so the locks are
+    always taken in the same order.
+    """
+    def __init__(self, solver, key, stock):
+        self._start(solver, key, stock, solver.breed_cost)
+        mask = key & FULL_MASK
+        count = self.stock.get(key, 0)
+        if count == UNLIMITED:
+            self._push(0, 0, (), ('bank',))
+            return
+        if count:
+            self._push(0, self.savings[key], ((key, 1),), ('bank',))
+        if popcount(mask) <= 1:
+            self._push(solver.wild_cost, solver.wild_cost, (), ('wild',))
+            return
+        for split, (_, _, male, female) in enumerate(_SPLITS[mask]):
+            male_stock = solver._restrict_stock(male, self.stock)
+            female_stock = solver._restrict_stock(female, self.stock)
+            self.children.append((
+                solver._options(male, male_stock), male_stock,
+                solver._options(female, female_stock), female_stock,
+            ))
+            self._waiting.append((split, 0, 0))
+
+    def _start(self, solver, key, stock, breed_cost):
+        self.lock = RLock()
+        self.items = []
+        self.best = None
+        self.key = key
+        self.stock = dict(stock)
+        self.breed_cost = breed_cost
+        self.children = []
+        self._heap = []
+        self._count = 0
+        self._seen = set()
+        self._waiting = []
+        self._kept = []
+        # bank key -> bitset of the positions in _kept of the options using it
+        self._kept_by_key = {}
+        # what a bank poke of each scarce key saves here over breeding it
+        free_keys = frozenset(k for k, count in stock if count == UNLIMITED)
+        self.savings = {k: solver._free_cost(k, free_keys) for k, count in stock if count != UNLIMITED}
+
+    def _push(self, cost, base, usage, how):
+        # heap entries are (cost, kind, count, payload), kind 0 for options, 1
+        # for pairs of parent options and 2 for pairs whose parents' options
+        # aren't there yet (the cost is then a bound from the parents' lists)
+        self._count += 1
+        heappush(self._heap, (cost, 0, self._count, (base, usage, how)))
+        # cheapest option seen so far, even if the list didn't get to it yet
+        if self.best is None or cost < self.best[0]:
+            self.best = (cost, base, usage, how)
+
+    @staticmethod
+    def _lower_cost(options, index, solver):
+        # cost of an option of a list, or a bound on it when the list didn't get there yet
+        if index < len(options.items):
+            return options.items[index][0]
+        return options.bound(solver)
+
+    def _push_waiting(self, solver):
+        # a pair goes in with a lower bound and is resolved when it reaches the
+        # top, the parents' lists are only worked on for the pairs that get
+        # there (bound() doesn't take steps, so running out of them halfway
+        # never loses a pair)
+        while self._waiting:
+            split, i, j = self._waiting.pop()
+            if (split, i, j) in self._seen:
+                continue
+            male_options, _, female_options, _ = self.children[split]
+            male_cost = self._lower_cost(male_options, i, solver)
+            female_cost = self._lower_cost(female_options, j, solver)
+            if male_cost == float('inf') or female_cost == float('inf'):
+                continue
+            self._seen.add((split, i, j))
+            self._count += 1
+            ready = i < len(male_options.items) and j < len(female_options.items)
+            heappush(self._heap, (self.breed_cost + male_cost + female_cost, 1 if ready else 2, self._count,
+                                  (split, i, j)))
+
+    def bound(self, solver):
+        # no option that isn't in items yet can cost less than this
+        with self.lock:
+            self._push_waiting(solver)
+            return self._heap[0][0] if self._heap else float('inf')
+
+    def step(self, solver):
+        with self.lock:
+            self._step(solver)
+
+    def _step(self, solver):
+        self._push_waiting(solver)
+        if not self._heap:
+            return
+        solver._step()
+        if self._heap[0][1] == 2:
+            # the pair is needed now, its parents' options are got before it
+            # leaves the heap
+            split, i, j = self._heap[0][3]
+            male_options, _, female_options, _ = self.children[split]
+            male, female = male_options.get(i, solver), female_options.get(j, solver)
+            heappop(self._heap)
+            if male is not None and female is not None:
+                self._count += 1
+                heappush(self._heap, (self.breed_cost + male[0] + female[0], 1, self._count, (split, i, j)))
+            return
+        cost, kind, _, payload = heappop(self._heap)
+        if kind:
+            split, i, j = payload
+            male_options, male_stock, female_options, female_stock = self.children[split]
+            male, female = male_options.items[i], female_options.items[j]
+            base = self.breed_cost + male[1] + female[1]
+            usage = _add_usage(male[2], female[2], self.stock)
+            savings = self.savings
+            self._push(base - sum(count * savings[k] for k, count in usage), base, usage,
+                       (split, male_stock, male[3], female_stock, female[3]))
+            self._waiting.append((split, i + 1, j))
+            self._waiting.append((split, i, j + 1))
+            return
+        base, usage, how = payload
+        # skip options that another one already beats, even if this one
+        # keeps all of its bank pokes and the other loses the ones it has on top.
+        # a kept option with a key this one doesn't use, worth more than it can
+        # be cheaper by, never does: those are left out by key, not one by one
+        counts = dict(usage)
+        savings = self.savings
+        slack = cost - self.items[0][0] if self.items else 0
+        skip = 0
+        for key, positions in self._kept_by_key.items():
+            if key not in counts and savings[key] > slack:
+                skip |= positions
+        candidates = ((1 << len(self._kept)) - 1) & ~skip
+        while candidates:
+            low = candidates & -candidates
+            candidates ^= low
+            kept_base, kept_usage = self._kept[low.bit_length() - 1]
+            if base - kept_base >= sum(
+                savings[key] * (count - kept_usage.get(key, 0))
+                for key, count in usage if count > kept_usage.get(key, 0)
+            ):
+                return
+        position = 1 << len(self._kept)
+        for key in counts:
+            self._kept_by_key[key] = self._kept_by_key.get(key, 0) | position
+        self._kept.append((base, counts))
+        self.items.append((cost, base, usage, how))
+
+    def get(self, index, solver):
+        # items only grow, one that is there already needs no lock
+        if index < len(self.items):
+            return self.items[index]
+        with self.lock:
+            while len(self.items) <= index and (self._heap or self._waiting):
+                self._step(solver)
+            if index < len(self.items):
+                return self.items[index]
+        return None
+
+
+class _JointOptions(_Options):
+    """
+    Options of planning a group of targets together: the options of the two
+    halves of the group paired like the parents of a breed, without a breed
+    cost, so a bank poke both halves want is only counted once.
+    """
+    def __init__(self, solver, keys, stock):
+        self._start(solver, keys, stock, 0)
+        half = len(keys) // 2
+        left_stock = solver._group_stock(keys[:half], self.stock)
+        right_stock = solver._group_stock(keys[half:], self.stock)
+        self.children.append((
+            solver._group_options(keys[:half], left_stock), left_stock,
+            solver._group_options(keys[half:], right_stock), right_stock,
+        ))
+        self._waiting.append((0, 0, 0))
+
+
+def key_label(key):
+    """The IV code of a (IV mask, gender) key, ex: "+ + - - - - (f)" """
+    poke = Poke()
+    poke.iv_mask, poke.gender_code = key & FULL_MASK, key >> STAT_COUNT
+    return f"{poke.get_stats()} {poke.gender}"
+
+
+class TreeSolver():
+    """
+    Finds the minimum cost breeding tree for a target.
+
+    A bank poke saves exactly what breeding its node would cost, so the cost
+    of a tree only depends on which bank pokes it uses, and a tree can always
+    give one back by breeding that node instead. Each (IV mask, gender) state
+    gets a lazy, cost sorted list of the ways of getting it (best-first, the
+    cost of an option is a lower bound for every option built on top of it),
+    parents' bank usage is merged clipping it to the stock so no bank poke is
+    used twice, and the first option of the root is the exact optimum (or
+    the best one found, when max_steps runs out first).
+    Bank keys with more stock than the tree could ever ask for are free and
+    left out of the usage, which keeps the option lists short.
+    """
+    def __init__(self, poke_bank=None, breed_cost=BREED_COST, wild_cost=WILD_COST, max_steps=MAX_SOLVER_STEPS,
+                 cache=None):
+        self.poke_bank = as_poke_base(poke_bank)
+        self.stock = bank_stock(self.poke_bank)
+        self.breed_cost = breed_cost
+        self.wild_cost = wild_cost
+        self.max_steps = max_steps
+        self.cache = cache if cache is not None else subtree_cache.shared_cache
+        self.expanded = 0
+        self.steps = 0
+        self._free = {}
+
+    def _step(self):
+        self.steps += 1
+        if self.max_steps and self.steps > self.max_steps:
+            raise _SearchBudgetExceeded()
+
+    @staticmethod
+    def _restrict_stock(key, stock):
+        # keep only the bank keys that can show up in the tree of `key`, capped
+        # at how many times they could be needed there, so equal states share memo
+        mask = key & FULL_MASK
+        bits = _MASK_BITS[mask]
+        restricted = []
+        for bank_key, count in stock.items():
+            bank_mask = bank_key & FULL_MASK
+            if not count or bank_mask & ~mask:
+                continue
+            bank_bits = _MASK_BITS[bank_mask]
+            if bank_bits < bits:
+                # a poke with n IVs has 2^(n-k) ancestors with k IVs in its tree
+                demand = 1 << (bits - bank_bits)
+            elif bank_key == key:
+                demand = 1
+            else:
+                continue
+            if count != UNLIMITED:
+                count = min(count, demand)
+            restricted.append((bank_key, count))
+        return tuple(sorted(restricted))
+
+    def _free_cost(self, key, free_keys):
+        # cheapest tree for the key using only the bank keys that can't run out
+        state = (key, free_keys)
+        cost = self._free.get(state)
+        if cost is None:
+            mask = key & FULL_MASK
+            if key in free_keys:
+                cost = 0
+            elif popcount(mask) <= 1:
+                cost = self.wild_cost
+            else:
+                cost = self.breed_cost + min(
+                    self._free_cost(male, free_keys) + self._free_cost(female, free_keys)
+                    for _, _, male, female in _SPLITS[mask]
+                )
+            self._free[state] = cost
+        return cost
+
+    def _options(self, key, stock):
+        def create():
+            self.expanded += 1
+            return _Options(self, key, stock)
+        return self.cache.get_or_create(("tree", self.breed_cost, self.wild_cost, key, stock), create)
+
+    def _group_options(self, keys, stock):
+        # options of planning a tuple of target keys together
+        if len(keys) == 1:
+            return self._options(keys[0], stock)
+
+        def create():
+            self.expanded += 1
+            return _JointOptions(self, keys, stock)
+        return self.cache.get_or_create(("group", self.breed_cost, self.wild_cost, keys, stock), create)
+
+    def _group_stock(self, keys, stock):
+        # _restrict_stock for a group of targets, counts capped at what all of them could need
+        merged = {}
+        for key in keys:
+            for bank_key, count in self._restrict_stock(key, stock):
+                if count == UNLIMITED or merged.get(bank_key) == UNLIMITED:
+                    merged[bank_key] = UNLIMITED
+                else:
+                    merged[bank_key] = min(merged.get(bank_key, 0) + count, stock[bank_key])
+        return tuple(sorted(merged.items()))
+
+    def _root_stock(self, key):
+        return self._group_root_stock((key,))
+
+    def _group_root_stock(self, keys):
+        # scarce keys keep their count, the ones that can't run out (even with
+        # every target asking for them) are UNLIMITED
+        demands = {}
+        for key in keys:
+            for bank_key, demand in self._restrict_stock(key, {k: 1 << STAT_COUNT for k in self.stock}):
+                demands[bank_key] = demands.get(bank_key, 0) + demand
+        return {
+            bank_key: UNLIMITED if self.stock[bank_key] >= demand else self.stock[bank_key]
+            for bank_key, demand in demands.items()
+        }
+
+    def _build(self, key, stock, how, bank_left, bank_ids, counters):
+        if how[0] == 'bank' and not bank_left.get(key):
+            # the stock ran out on another branch, breed this one without scarce pokes
+            stock = tuple((k, count) for k, count in stock if count == UNLIMITED)
+            how = self._options(key, stock).get(0, self)[3]
+        poke = Poke()
+        poke.iv_mask = key & FULL_MASK
+        poke.gender_code = key >> STAT_COUNT
+        if how[0] == 'bank':
+            if bank_left[key] != UNLIMITED:
+                bank_left[key] -= 1
+            poke.id = bank_ids[key].pop(0)
+            counters['bank_used'] += 1
+        elif how[0] == 'wild':
+            counters['wild'] += 1
+        else:
+            split, male_stock, male_how, female_stock, female_how = how
+            a, b, male, female = _SPLITS[poke.iv_mask][split]
+            p_male = self._build(male, male_stock, male_how, bank_left, bank_ids, counters)
+            p_female = self._build(female, female_stock, female_how, bank_left, bank_ids, counters)
+            p_male.braced_mask = 1 << a
+            p_female.braced_mask = 1 << b
+            poke.parent_male, poke.parent_female = p_male, p_female
+            p_male.offspring = p_female.offspring = poke
+            counters['breeds'] += 1
+        return poke
+
+    def _build_group(self, keys, stock, how, bank_left, bank_ids, counters, roots):
+        # builds the trees of a group plan, appended to roots in the keys order
+        if len(keys) == 1:
+            roots.append(self._build(keys[0], stock, how, bank_left, bank_ids, counters))
+            return
+        _, left_stock, left_how, right_stock, right_how = how
+        half = len(keys) // 2
+        self._build_group(keys[:half], left_stock, left_how, bank_left, bank_ids, counters, roots)
+        self._build_group(keys[half:], right_stock, right_how, bank_left, bank_ids, counters, roots)
+
+    def _search(self, keys, stock, upper=None):
+        # with an upper cost (of a plan found some other way) only cheaper plans
+        # are searched, when there are none the how is None
+        options = self._group_options(keys, stock)
+        limit = float('inf') if upper is None else upper
+        exact = True
+        try:
+            while options.bound(self) < min(limit, float('inf') if options.best is None else options.best[0]):
+                options.step(self)
+        except _SearchBudgetExceeded:
+            exact = False
+        self.steps = 0
+        if upper is not None and (options.best is None or options.best[0] >= upper):
+            return upper, None, exact
+        if options.best is None:
+            free_stock = tuple((k, count) for k, count in stock if count == UNLIMITED)
+            options = self._group_options(keys, free_stock)
+            # without scarce pokes the first option is cheap to get, it gets
+            # no budget so a small max_steps still gives a tree
+            max_steps, self.max_steps = self.max_steps, 0
+            try:
+                options.get(0, self)
+            finally:
+                self.max_steps = max_steps
+        cost, _, _, how = options.best
+        return cost, how, exact
+
+    def solve(self, target):
+        """
+        Builds the cheapest tree for the target, bank pokes used in it get the
+        bank ids (same as match_tree_with_pokebank does).
+        Returns a dict with the tree root and the plan stats, "exact" is False
+        when max_steps ran out before the best tree found could be proven optimal.
+        """
+        self.expanded = 0
+        self.steps = 0
+        bank_left = self._root_stock(target.key)
+        stock = tuple(sorted(bank_left.items()))
+        with instrument.phase("search"):
+            cost, how, exact = self._plan((target.key,), stock)
+        instrument.count("states_expanded", self.expanded)
+        return self._result(target, stock, cost, how, exact)
+
+    def _plan_key(self, keys, stock, upper=None):
+        return ("plan", self.breed_cost, self.wild_cost, self.max_steps, keys, stock, upper)
+
+    def _plan(self, keys, stock, upper=None):
+        # (cost, how, exact) of the plan of these target keys, the same
+        # targets against the same bank stock are just a lookup
+        # only the lookup and the insert touch the cache, two sessions planning
+        # the same targets at once share the option lists they step
+        plan_key = self._plan_key(keys, stock, upper)
+        plan = self.cache.get(plan_key)
+        if plan is None:
+            plan = self._search(keys, stock, upper)
+            self.cache.put(plan_key, plan)
+        else:
+            instrument.count("plan_cache_hits")
+        return plan
+
+    def _result(self, target, stock, cost, how, exact):
+        bank_left = self._root_stock(target.key)
+        bank_ids = {key: self.poke_bank.ids(key) for key in self.stock}
+        counters = {'breeds': 0, 'wild': 0, 'bank_used': 0}
+        with instrument.phase("build"):
+            self.steps = 0
+            root = self._build(target.key, stock, how, bank_left, bank_ids, counters)
+        root.has_nature = target.has_nature
+        instrument.count("nodes", counters['breeds'] + counters['wild'] + counters['bank_used'])
+
+        return {
+            "poke": root,
+            "cost": cost,
+            "exact": exact,
+            "breeds": counters['breeds'],
+            "wild": counters['wild'],
+            "bank_used": counters['bank_used'],
+            "expanded": self.expanded,
+        }
+
+    def solve_many(self, targets, joint_steps=JOINT_SOLVER_STEPS):
+        """
+        Plans several targets together: their trees share the bank stock (no
+        bank poke is used twice) and the cheapest plan for all of them is
+        searched, not the cheapest tree of each one on its own. Subtrees the
+        targets have in common are searched once.
+        The targets are first planned in turn, each one with the bank pokes
+        the previous ones left. When that costs what the targets cost on
+        their own (they don't compete for bank pokes) it is the plan,
+        otherwise a joint search looks for a cheaper one, with joint_steps
+        (at most max_steps): when they run out first the plan is the best
+        found.
+        Returns a dict with the trees ("pokes", in the targets order), the
+        plan totals, the wild pokes to catch ("wild_needed", IV code -> count)
+        and the pokes bred for more than one target ("shared", IV code ->
+        how many to breed).
+        """
+        targets = list(targets)
+        self.expanded = 0
+        self.steps = 0
+        keys = tuple(target.key for target in targets)
+        with instrument.phase("search"):
+            in_turn, alone_cost = self._plan_in_turn(keys)
+            cost = sum(plan[0] for plan in in_turn)
+            # the targets can't cost less together than each one on its own
+            exact = alone_cost == cost
+            if not exact and len(keys) > 1:
+                # the in turn plan bounds the joint search, it only has to
+                # look at the plans that could be cheaper
+                bank_left = self._group_root_stock(keys)
+                stock = self._group_stock(keys, bank_left)
+                max_steps = self.max_steps
+                self.max_steps = min(max_steps, joint_steps) if max_steps else joint_steps
+                try:
+                    cost, how, exact = self._plan(keys, stock, cost)
+                finally:
+                    self.max_steps = max_steps
+                if how is not None:
+                    in_turn = None
+        instrument.count("states_expanded", self.expanded)
+
+        roots = []
+        counters = {'breeds': 0, 'wild': 0, 'bank_used': 0}
+        bank_ids = {key: self.poke_bank.ids(key) for key in self.stock}
+        with instrument.phase("build"):
+            self.steps = 0
+            if in_turn is not None:
+                # bank_ids is shared, so a tree only gets the pokes the previous ones left
+                for key, (_, plan_stock, plan_how) in zip(keys, in_turn):
+                    roots.append(self._build(key, plan_stock, plan_how, dict(plan_stock), bank_ids, counters))
+            else:
+                self._build_group(keys, stock, how, bank_left, bank_ids, counters, roots)
+        instrument.count("nodes", counters['breeds'] + counters['wild'] + counters['bank_used'])
+
+        wild_needed = {}
+        bred = {}
+        bred_for = {}
+        for index, (target, root) in enumerate(zip(targets, roots)):
+            root.has_nature = target.has_nature
+            for poke in tree_pokes(root):
+                if poke is root:
+                    continue
+                if poke.parent_male is not None:
+                    bred[poke.key] = bred.get(poke.key, 0) + 1
+                    bred_for.setdefault(poke.key, set()).add(index)
+                elif poke.id not in self.poke_bank:
+                    label = key_label(poke.key)
+                    wild_needed[label] = wild_needed.get(label, 0) + 1
+
+        return {
+            "pokes": roots,
+            "cost": cost,
+            "exact": exact,
+            "breeds": counters['breeds'],
+            "wild": counters['wild'],
+            "bank_used": counters['bank_used'],
+            "expanded": self.expanded,
+            "wild_needed": wild_needed,
+            "shared": {key_label(key): bred[key] for key in sorted(bred) if len(bred_for[key]) > 1},
+        }
+
+    def _plan_used(self, key):
+        # (cost, stock, how, used, exact) of the plan of a target with
+        # self.stock, used counts the bank pokes of each key its tree takes
+        bank_left = self._root_stock(key)
+        plan_stock = tuple(sorted(bank_left.items()))
+        cost, how, exact = self._plan((key,), plan_stock)
+        used = {}
+        counters = {'breeds': 0, 'wild': 0, 'bank_used': 0}
+        self.steps = 0
+        tree = self._build(key, plan_stock, how, bank_left, {k: self.poke_bank.ids(k) for k in self.stock}, counters)
+        for poke in tree_pokes(tree):
+            if poke.parent_male is None and poke.id in self.poke_bank:
+                used[poke.key] = used.get(poke.key, 0) + 1
+        return cost, plan_stock, how, used, exact
+
+    def _plan_in_turn(self, keys):
+        # ([(cost, stock, how)] of planning each target with the stock the
+        # previous ones left, what the targets cost each on its own with the
+        # whole bank or None when those plans aren't proven optimal). a target
+        # keeps its plan with the whole bank when the pokes it uses are still
+        # there, with less stock it can't do better
+        stock = self.stock
+        alone = {key: self._plan_used(key) for key in dict.fromkeys(keys)}
+        plans = []
+        try:
+            for key in keys:
+                cost, plan_stock, how, used, _ = alone[key]
+                if any(self.stock.get(k, 0) < count for k, count in used.items()):
+                    cost, plan_stock, how, used, _ = self._plan_used(key)
+                plans.append((cost, plan_stock, how))
+                self.stock = {k: count - used.get(k, 0) for k, count in self.stock.items() if count > used.get(k, 0)}
+        finally:
+            self.stock = stock
+        alone_cost = None
+        if all(plan[4] for plan in alone.values()):
+            alone_cost = sum(alone[key][0] for key in keys)
+        return plans, alone_cost
+
+    def iter_solve(self, target, time_budget=None, target_score=None, slice_steps=SOLVER_SLICE_STEPS):
+        """
+        Anytime version of solve: yields the result dict of every better tree
+        as soon as the search finds it, with its similarity "score" to the
+        bank and the "elapsed" seconds. The search runs in slices of
+        slice_steps and stops when the tree is proven optimal, max_steps are
+        spent, time_budget (seconds) is over or a tree reaches target_score.
+        The last result yielded is the best tree found. Stopping the
+        generator early is fine, the work done stays in the cache.
+        """
+        start = perf_counter()
+        self.expanded = 0
+        bank_left = self._root_stock(target.key)
+        stock = tuple(sorted(bank_left.items()))
+        plan_key = self._plan_key((target.key,), stock)
+        options = self._options(target.key, stock)
+        max_steps = self.max_steps
+        spent = 0
+        best_cost = None
+
+        while True:
+            exact = True
+            with instrument.phase("search"):
+                plan = self.cache.get(plan_key)
+                if plan is not None:
+                    cost, how, exact = plan
+                    spent = max_steps
+                else:
+                    self.steps = 0
+                    self.max_steps = slice_steps if not max_steps else min(slice_steps, max_steps - spent)
+                    try:
+                        while options.best is None or options.bound(self) < options.best[0]:
+                            options.step(self)
+                    except _SearchBudgetExceeded:
+                        exact = False
+                    finally:
+                        self.max_steps = max_steps
+                    spent += self.steps
+                    instrument.count("solver_steps", self.steps)
+                    if options.best is not None:
+                        cost, _, _, how = options.best
+                    else:
+                        # nothing complete yet, start from the tree without scarce bank pokes
+                        free_stock = tuple((k, count) for k, count in stock if count == UNLIMITED)
+                        cost, _, _, how = self._options(target.key, free_stock).get(0, self)
+                    if exact or (max_steps and spent >= max_steps):
+                        self.cache.put(plan_key, (cost, how, exact))
+
+            done = exact or (max_steps and spent >= max_steps)
+            if best_cost is None or cost < best_cost or done:
+                best_cost = cost
+                result = self._result(target, stock, cost, how, exact)
+                root_parents = [result["poke"].parent_male, result["poke"].parent_female]
+                result["score"] = similarity_score(self.poke_bank, root_parents)
+                result["elapsed"] = perf_counter() - start
+                yield result
+                if target_score is not None and result["score"] >= target_score:
+                    return
+            if done or (time_budget is not None and perf_counter() - start >= time_budget):
+                return
+
+
+def find_best_tree(target, poke_bank=None, breed_cost=BREED_COST, wild_cost=WILD_COST, max_steps=MAX_SOLVER_STEPS,
+                   cache=None):
+    return TreeSolver(poke_bank, breed_cost, wild_cost, max_steps, cache).solve(target)
+
+
+def plan_targets(targets, poke_bank=None, breed_cost=BREED_COST, wild_cost=WILD_COST, max_steps=MAX_SOLVER_STEPS,
+                 cache=None, joint_steps=JOINT_SOLVER_STEPS):
+    """One plan for several targets sharing the bank, see TreeSolver.solve_many."""
+    return TreeSolver(poke_bank, breed_cost, wild_cost, max_steps, cache).solve_many(targets, joint_steps)
+
+
+def iter_best_trees(target, poke_bank=None, time_budget=None, target_score=None, breed_cost=BREED_COST,
+                    wild_cost=WILD_COST, max_steps=MAX_SOLVER_STEPS, cache=None):
+    """Yields better and better trees for the target, see TreeSolver.iter_solve."""
+    solver = TreeSolver(poke_bank, breed_cost, wild_cost, max_steps, cache)
+    return solver.iter_solve(target, time_budget, target_score)
+
 if __name__=="__main__":
     p1 = Poke()
     p2 = Poke()
@@ -210,4 +1288,3 @@ if __name__=="__main__":
     c.str_to_stats('+ + - - + - (f)')
     a,b = c.generate_random_parents(recursive=True)
     print(f"a: {a}\nb: {b}")
-
@@ -1,20 +1,37 @@
+"""
+Breeding plans from the command line.
+
+    python main.py targets.txt --bank poke_bank.json > plans.jsonl
+    python main.py targets.txt --bank poke_bank.db --workers 4 --method random --seed 7
+
+The targets file has one IV code per line, the same ones the app takes
+("+ + - - + - (f)", "[Nat]" for the nature), blank lines and lines starting
+with # are skipped. Each target gives one JSON line (in file order) with
+the tree, its score, the wild Pokémon it needs and the plan hash (see
+plan_codec), --plans-dir also stores each plan as <hash>.plan so equal
+plans are written once. Without arguments the old demo runs.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 from graphviz import Digraph
 import lib
+import batch
 import random
+import plan_codec
+import storage
+from subtree_cache import SubtreeCache
 
+METHOD_EXACT = "exact"
+METHOD_RANDOM = "random"
+
+# targets sent to a worker at once
+TARGETS_PER_TASK = 16
 
-def similarity_score(poke_base, root_parents):
-    score = 0
-    for parent in root_parents:
-        for pb_poke in poke_base:
-            # Compare stats
-            for stat1, stat2 in zip(parent.stats, pb_poke.stats):
-                if stat1.is_31 and stat2.is_31:
-                    score += 1
-            # Compare gender
-            if parent.gender.is_male == pb_poke.gender.is_male:
-                score += 1
-    return score
 
 def visualize_breeding_tree(poke, graph=None, wild_pokes=None):
     if graph is None:
@@ -36,7 +53,136 @@ def visualize_breeding_tree(poke, graph=None, wild_pokes=None):
 
     return graph, wild_pokes
 
-if __name__ == "__main__":
+def read_targets(path):
+    """The target codes of a targets file, in order."""
+    with open(path, "r") as file:
+        lines = [line.strip() for line in file]
+    return [line for line in lines if line and not line.startswith("#")]
+
+
+def tree_to_dict(poke):
+    """A linked tree as nested dicts (parents under "male"/"female"), for JSON."""
+    root = None
+    pending = [(poke, None, None)]
+    while pending:
+        node, offspring, side = pending.pop()
+        data = {"id": node.id, "stats": node.get_stats(), "gender": str(node.gender)}
+        if node.has_nature:
+            data["nature"] = True
+        if offspring is None:
+            root = data
+        else:
+            offspring[side] = data
+        if node.parent_male is not None and node.parent_female is not None:
+            pending.append((node.parent_female, data, "female"))
+            pending.append((node.parent_male, data, "male"))
+    return root
+
+
+# what every planning process keeps between targets: the bank, loaded once,
+# and one solver cache so subplans found for a target are reused by the next
+_worker = {}
+
+
+def _init_worker(bank_path, method, seed, plans_dir=None):
+    _worker["bank"] = storage.load_bank_file(bank_path) if bank_path else lib.PokeBase()
+    _worker["cache"] = SubtreeCache()
+    _worker["method"] = method
+    _worker["seed"] = seed
+    _worker["plans_dir"] = plans_dir
+
+
+def plan(code, poke_bank, method=METHOD_EXACT, seed=0, cache=None, plans_dir=None):
+    """Plans one target with a bank, gives its JSON line as a dict."""
+    target = lib.Poke(code)
+    line = {"target": code}
+    if method == METHOD_RANDOM:
+        # the same seed for every target, so a plan doesn't depend on where its target is in the file
+        best = batch.search_random_trees(target, poke_bank, seed=seed)[0]
+        tree = result = best["poke"]
+        lib.match_tree_with_pokebank(tree, poke_bank)
+        line["score"] = best["score"]
+    else:
+        result = lib.find_best_tree(target, poke_bank, cache=cache)
+        tree = result["poke"]
+        line["score"] = lib.similarity_score(poke_bank, [tree.parent_male, tree.parent_female])
+        line.update(cost=result["cost"], exact=result["exact"], breeds=result["breeds"])
+    line["hash"] = plan_codec.plan_hash(result, poke_bank)
+    if plans_dir:
+        # named by hash, a plan found again is already there
+        path = os.path.join(plans_dir, line["hash"] + ".plan")
+        if not os.path.exists(path):
+            plan_codec.save(path, result, poke_bank)
+
+    leaves = [poke for poke in lib.tree_pokes(tree) if poke.parent_male is None]
+    line["wild"] = [
+        {"stats": poke.get_stats(), "gender": str(poke.gender)} for poke in leaves if poke.id not in poke_bank
+    ]
+    line["bank_used"] = [poke.id for poke in leaves if poke.id in poke_bank]
+    line["tree"] = tree_to_dict(tree)
+    return line
+
+
+def plan_target(code):
+    """Plans one target with the bank loaded by this process."""
+    return plan(code, _worker["bank"], _worker["method"], _worker["seed"], _worker["cache"], _worker["plans_dir"])
+
+
+def _plan_targets(codes):
+    return [plan_target(code) for code in codes]
+
+
+def plan_targets(codes, bank_path=None, method=METHOD_EXACT, seed=0, workers=1, plans_dir=None):
+    """
+    Yields the plan of every target, in order, as soon as it's ready. With
+    workers > 1 (None: every core) the targets are split between processes,
+    each loading the bank once.
+    """
+    if workers == 1:
+        _init_worker(bank_path, method, seed, plans_dir)
+        for code in codes:
+            yield plan_target(code)
+        return
+
+    tasks = [codes[i:i + TARGETS_PER_TASK] for i in range(0, len(codes), TARGETS_PER_TASK)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(bank_path, method, seed, plans_dir)) as pool:
+        for lines in pool.map(_plan_targets, tasks):
+            yield from lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Breeding plans for a file of targets, as JSON lines")
+    parser.add_argument("targets", help="file with one target IV code per line")
+    parser.add_argument("--bank", default=None, help="bank export (json, jsonl, csv or txt) or .db bank file")
+    parser.add_argument("--output", default=None, help="JSON lines file to write (default: stdout)")
+    parser.add_argument("--method", choices=[METHOD_EXACT, METHOD_RANDOM], default=METHOD_EXACT,
+                        help="cheapest tree search, or the best of random trees")
+    parser.add_argument("--workers", type=int, default=1, help="planning processes, 0 for every core")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random trees")
+    parser.add_argument("--plans-dir", default=None, help="directory to store the plans in, as <hash>.plan")
+    args = parser.parse_args(argv)
+
+    codes = read_targets(args.targets)
+    if args.plans_dir:
+        os.makedirs(args.plans_dir, exist_ok=True)
+    out = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        for index, line in enumerate(plan_targets(codes, args.bank, args.method, args.seed, args.workers or None,
+                                                        args.plans_dir)):
+            out.write(json.dumps(dict(line, index=index)) + "\n")
+            out.flush()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    elapsed = time.perf_counter() - start
+    rate = len(codes) / elapsed if elapsed > 0 else float("inf")
+    print(f"{len(codes)} targets in {elapsed:.2f} s ({rate:.1f} targets/s)", file=sys.stderr)
+    return 0
+
+
+def demo():
     target = '+ + - - + - (f)'
     pb = lib.PokeBase()
     pb.add_poke(lib.Poke('- - - - + - (m)'))
@@ -45,35 +191,24 @@ if __name__ == "__main__":
     pb.add_poke(lib.Poke('- - - - - + (f)'))
 
     poke_base = pb.pokes  # Assuming PokeBase has a list of pokemons
-    best_trees = []
-
-    for _ in range(100):  # Iterate to generate 20 trees, repeatedly replacing the worst
-        target_poke = lib.Poke(target)  # Generate a random target Pokémon
-        target_poke.generate_random_parents(recursive=True)
-
-        # Root parents
-        root_parents = [target_poke.parent_male, target_poke.parent_female]
-        score = similarity_score(poke_base, root_parents)
 
-        # Save the tree and score
-        tree_data = {
-            "poke": target_poke,
-            "score": score,
-            "graph": None  # Graphviz tree will be generated when needed
-        }
-        best_trees.append(tree_data)
-        best_trees = sorted(best_trees, key=lambda x: x['score'], reverse=True)[:20]
-
-        # Replace the worst tree if necessary
-        if len(best_trees) > 20:
-            best_trees.pop()
+    # Generate and score 100k random trees on every core, keeping the 20 best
+    best_trees = batch.search_random_trees(lib.Poke(target), poke_base, n=100000, k=20, seed=0, workers=None)
 
     # Visualize the best tree
     best_tree = best_trees[0]
     best_graph, wild_pokes = visualize_breeding_tree(best_tree["poke"])
     best_graph.render("best_breeding_tree")
+    # the plan itself, plan_codec.load gives it back
+    plan_codec.save("best_breeding_tree.plan", best_tree["poke"], pb)
 
     print("\nBest tree similarity score:", best_tree["score"])
     print("\nWild Pokémon required for the best tree:")
     for wild_poke in wild_pokes:
-        print(f"ID: {wild_poke.id}, Stats: {wild_poke.get_stats()}, Gender: {wild_poke.gender}")
\ No newline at end of file
+        print(f"ID: {wild_poke.id}, Stats: {wild_poke.get_stats()}, Gender: {wild_poke.gender}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    demo()
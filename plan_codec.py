@@ -0,0 +1,281 @@
+"""
+Canonical encoding of breeding plans, in a compact binary form and a JSON
+one. The random ids of bred and wild pokes are left out, so the same plan
+always gives the same bytes and the same content hash, whatever process
+found it: plans can be cached, compared by hash, sent between processes
+and stored without running the search again.
+
+Binary layout, little endian:
+    header   magic b"PLAN", format version (u16), blake2b-16 of the payload (the content hash)
+    payload  levels (u8), flags (u8: 1 nature, 2 exact), cost (u32)
+             2 bytes per slot of the arena layout (the parents of slot i
+             are 2i+1 and 2i+2): IV mask | gender << 6, braced mask | used << 6
+             number of bank pokes (u16), then for each, by slot: slot (u16),
+             id length (u16) and the utf-8 id
+
+The JSON form holds the same fields, readable, and the same hash.
+"""
+import json
+import operator
+import struct
+from hashlib import blake2b
+
+import arena
+import lib
+
+
+# bump when the layout changes, older plans are refused
+FORMAT_VERSION = 1
+FORMAT_NAME = "pkmmo-plan"
+
+_MAGIC = b"PLAN"
+_HEADER = struct.Struct("<4sH16s")
+_PLAN = struct.Struct("<BBI")
+_COUNT = struct.Struct("<H")
+_BANK_ENTRY = struct.Struct("<HH")
+_NATURE = 1
+_EXACT = 2
+_USED = 1 << lib.STAT_COUNT
+# the cost is a u32
+_MAX_COST = (1 << 32) - 1
+# deeper than any plan (6 IVs take 6 levels), keeps a bad file from asking for a huge tree
+MAX_LEVELS = 16
+
+# byte -> its low 6 bits / its top 2 bits, to split the slot bytes with translate
+_LOW = bytes(byte & lib.FULL_MASK for byte in range(256))
+_HIGH = bytes(byte >> lib.STAT_COUNT for byte in range(256))
+
+_GENDERS = ("(f)", "(m)", "(?)")
+
+
+class PlanFormatError(ValueError):
+    pass
+
+
+def _plan_fields(plan):
+    # (root, cost, exact) of a result dict (lib.find_best_tree's) or a bare tree
+    if isinstance(plan, dict):
+        return plan["poke"], plan.get("cost"), bool(plan.get("exact"))
+    return plan, None, False
+
+
+def _payload(root, cost, exact, poke_bank):
+    bank = lib.as_poke_base(poke_bank)
+    nodes = []
+    bank_ids = []
+    breeds = wild = 0
+    pending = [(root, 0)]
+    while pending:
+        poke, slot = pending.pop()
+        nodes.append((slot, poke))
+        if poke.parent_male is not None and poke.parent_female is not None:
+            breeds += 1
+            pending.append((poke.parent_male, 2 * slot + 1))
+            pending.append((poke.parent_female, 2 * slot + 2))
+        elif poke.id in bank:
+            bank_ids.append((slot, poke.id))
+        else:
+            wild += 1
+    levels = (max(slot for slot, _ in nodes) + 1).bit_length()
+    slots = bytearray(2 * ((1 << levels) - 1))
+    for slot, poke in nodes:
+        slots[2 * slot] = poke.iv_mask | poke.gender_code << lib.STAT_COUNT
+        slots[2 * slot + 1] = poke.braced_mask | _USED
+    if cost is None:
+        cost = breeds * lib.BREED_COST + wild * lib.WILD_COST
+    return _pack(levels, root.has_nature, exact, cost, slots, bank_ids)
+
+
+def _pack(levels, has_nature, exact, cost, slots, bank_ids):
+    try:
+        cost = operator.index(cost)
+    except TypeError:
+        raise ValueError(f"plan cost {cost!r} isn't an int") from None
+    if not 0 <= cost <= _MAX_COST:
+        raise ValueError(f"plan cost {cost} outside 0..{_MAX_COST}")
+    flags = (_NATURE if has_nature else 0) | (_EXACT if exact else 0)
+    parts = [_PLAN.pack(levels, flags, cost), bytes(slots), _COUNT.pack(len(bank_ids))]
+    for slot, poke_id in sorted(bank_ids):
+        encoded = poke_id.encode()
+        parts.append(_BANK_ENTRY.pack(slot, len(encoded)))
+        parts.append(encoded)
+    return b"".join(parts)
+
+
+def _digest(payload):
+    return blake2b(payload, digest_size=16).digest()
+
+
+def encode(plan, poke_bank=None):
+    """
+    The binary form of a plan: a result dict (its "poke", "cost" and
+    "exact") or a bare lib.Poke tree, costed with lib.BREED_COST and
+    lib.WILD_COST. Leaves whose id is in poke_bank are kept as bank pokes.
+    """
+    root, cost, exact = _plan_fields(plan)
+    payload = _payload(root, cost, exact, poke_bank)
+    return _HEADER.pack(_MAGIC, FORMAT_VERSION, _digest(payload)) + payload
+
+
+def plan_hash(plan, poke_bank=None):
+    """Content hash of a plan (hex), equal plans give the same one."""
+    root, cost, exact = _plan_fields(plan)
+    return _digest(_payload(root, cost, exact, poke_bank)).hex()
+
+
+def _unpack(payload):
+    # (arena tree with its bank_ids, cost, exact) of a payload
+    try:
+        levels, flags, cost = _PLAN.unpack_from(payload, 0)
+        if not 0 < levels <= MAX_LEVELS:
+            raise PlanFormatError(f"plan with {levels} levels")
+        size = (1 << levels) - 1
+        start = _PLAN.size
+        slots = payload[start:start + 2 * size]
+        if len(slots) != 2 * size:
+            raise PlanFormatError("plan cut short")
+        offset = start + 2 * size
+        (count,) = _COUNT.unpack_from(payload, offset)
+        offset += _COUNT.size
+        bank_ids = {}
+        for _ in range(count):
+            slot, length = _BANK_ENTRY.unpack_from(payload, offset)
+            offset += _BANK_ENTRY.size
+            bank_ids[slot] = bytes(payload[offset:offset + length]).decode()
+            offset += length
+    except struct.error:
+        raise PlanFormatError("plan cut short")
+    if offset > len(payload):
+        raise PlanFormatError("plan cut short")
+    if offset < len(payload):
+        raise PlanFormatError("bytes left after the plan")
+    tree = arena.ArenaTree(levels)
+    keys, braces = bytes(slots[0::2]), bytes(slots[1::2])
+    tree.iv[:] = keys.translate(_LOW)
+    tree.gender[:] = keys.translate(_HIGH)
+    tree.braced[:] = braces.translate(_LOW)
+    tree.present[:] = braces.translate(_HIGH)
+    tree.has_nature = bool(flags & _NATURE)
+    tree.bank_ids = bank_ids
+    return tree, cost, bool(flags & _EXACT)
+
+
+def _result(tree, cost, exact, digest):
+    breeds = sum(1 for slot in tree.slots() if tree.has_parents(slot))
+    return {
+        "poke": tree.to_poke(),
+        "cost": cost,
+        "exact": exact,
+        "breeds": breeds,
+        "wild": sum(1 for slot in tree.wild_slots() if slot not in tree.bank_ids),
+        "bank_used": len(tree.bank_ids),
+        "expanded": 0,
+        "hash": digest.hex(),
+    }
+
+
+def decode_arena(data):
+    """(arena.ArenaTree with its bank_ids, cost, exact, hash) of a binary plan, checked against its hash."""
+    view = memoryview(data)
+    if len(view) < _HEADER.size:
+        raise PlanFormatError("plan too short")
+    magic, version, digest = _HEADER.unpack_from(view, 0)
+    if magic != _MAGIC:
+        raise PlanFormatError("not a plan")
+    if version != FORMAT_VERSION:
+        raise PlanFormatError(f"plan format version {version}, this code reads {FORMAT_VERSION}")
+    payload = view[_HEADER.size:]
+    if _digest(payload) != digest:
+        raise PlanFormatError("plan hash doesn't match")
+    tree, cost, exact = _unpack(payload)
+    return tree, cost, exact, digest.hex()
+
+
+def decode(data):
+    """
+    A result dict like lib.find_best_tree's (with new ids for the bred and
+    wild pokes) and its "hash" from a binary plan.
+    """
+    tree, cost, exact, digest = decode_arena(data)
+    return _result(tree, cost, exact, bytes.fromhex(digest))
+
+
+def to_json(plan, poke_bank=None):
+    """The JSON form of a plan (a dict), same arguments as encode."""
+    tree, cost, exact, digest = decode_arena(encode(plan, poke_bank))
+    return {
+        "format": FORMAT_NAME,
+        "version": FORMAT_VERSION,
+        "hash": digest,
+        "nature": tree.has_nature,
+        "exact": exact,
+        "cost": cost,
+        "levels": tree.levels,
+        "nodes": [
+            [slot, f"{lib.stats_to_str(tree.iv[slot], tree.braced[slot])} {_GENDERS[tree.gender[slot]]}"]
+            for slot in tree.slots()
+        ],
+        "bank": [[slot, poke_id] for slot, poke_id in sorted(tree.bank_ids.items())],
+    }
+
+
+def _check_slot(slot, size):
+    # a negative slot would index the node bytes from the end
+    if not isinstance(slot, int) or not 0 <= slot < size:
+        raise PlanFormatError(f"slot {slot!r} outside the plan")
+
+
+def from_json(data):
+    """A result dict (see decode) from the JSON form, a dict or its text."""
+    if isinstance(data, (str, bytes)):
+        data = json.loads(data)
+    if not isinstance(data, dict) or data.get("format") != FORMAT_NAME:
+        raise PlanFormatError("not a plan")
+    if data.get("version") != FORMAT_VERSION:
+        raise PlanFormatError(f"plan format version {data.get('version')}, this code reads {FORMAT_VERSION}")
+    try:
+        levels = data["levels"]
+        if not 0 < levels <= MAX_LEVELS:
+            raise PlanFormatError(f"plan with {levels} levels")
+        size = (1 << levels) - 1
+        slots = bytearray(2 * size)
+        for slot, code in data["nodes"]:
+            _check_slot(slot, size)
+            iv_mask, braced_mask, gender_code, _ = lib.parse_code(code)
+            gender_code = lib.GENDER_UNKNOWN if gender_code is None else gender_code
+            slots[2 * slot] = iv_mask | gender_code << lib.STAT_COUNT
+            slots[2 * slot + 1] = braced_mask | _USED
+        bank_ids = []
+        for slot, poke_id in data["bank"]:
+            _check_slot(slot, size)
+            bank_ids.append((slot, poke_id))
+        payload = _pack(levels, data["nature"], data["exact"], data["cost"], slots, bank_ids)
+    except (KeyError, TypeError, ValueError, IndexError, struct.error) as error:
+        raise PlanFormatError(f"malformed plan: {error}")
+    digest = _digest(payload)
+    if digest.hex() != data.get("hash"):
+        raise PlanFormatError("plan hash doesn't match")
+    tree, cost, exact = _unpack(payload)
+    return _result(tree, cost, exact, digest)
+
+
+def save(path, plan, poke_bank=None):
+    """Writes a plan to a file, the JSON form when the name ends in .json. Returns its hash."""
+    if path.endswith(".json"):
+        data = to_json(plan, poke_bank)
+        with open(path, "w") as file:
+            json.dump(data, file, indent=1)
+        return data["hash"]
+    data = encode(plan, poke_bank)
+    with open(path, "wb") as file:
+        file.write(data)
+    return _HEADER.unpack_from(data)[2].hex()
+
+
+def load(path):
+    """The result dict (see decode) of a plan file written by save."""
+    if path.endswith(".json"):
+        with open(path, "r") as file:
+            return from_json(json.load(file))
+    with open(path, "rb") as file:
+        return decode(file.read())
@@ -0,0 +1,264 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+from hashlib import blake2b
+from threading import Lock
+from xml.sax.saxutils import escape
+
+from graphviz import Digraph
+
+import lib
+from subtree_cache import SubtreeCache
+
+
+# ways of drawing a tree: graphviz (runs dot), or built in ones that don't
+# spawn anything, handy for the 60+ nodes of 6 IV trees
+STYLE_GRAPHVIZ = "graphviz"
+STYLE_SVG = "svg"
+STYLE_TEXT = "text"
+
+# dot processes running at the same time, whatever the number of sessions
+RENDER_WORKERS = 2
+
+# rendered bytes by tree hash, trees drawn the same share the entry
+render_cache = SubtreeCache(maxsize=256)
+
+_pool = None
+_pool_lock = Lock()
+# tree hash -> future of the render in progress, so the same tree is drawn once
+_pending = {}
+
+
+def _bank_ids(poke_bank):
+    # something `poke.id in` works on, an indexed bank already is one
+    if isinstance(poke_bank, lib.PokeBase):
+        return poke_bank
+    return set(poke.id for poke in poke_bank) if poke_bank else set()
+
+
+def node_names(poke, poke_bank=None):
+    """
+    {id(node): name} of the nodes of a tree as the drawings show them: bank
+    pokes by their id, the others by their slot ("#5", slots numbered like
+    arena trees, the parents of slot i are 2i+1 and 2i+2). The ids a solve
+    gives bred and wild pokes are new every time, so they are not shown.
+    """
+    return _node_names(poke, _bank_ids(poke_bank))
+
+
+def _node_names(poke, bank_ids):
+    names = {}
+    pending = [(poke, 0)]
+    while pending:
+        node, slot = pending.pop()
+        if node is None or id(node) in names:
+            continue
+        names[id(node)] = node.id if node.id in bank_ids else f"#{slot}"
+        pending.append((node.parent_female, 2 * slot + 2))
+        pending.append((node.parent_male, 2 * slot + 1))
+    return names
+
+
+def tree_hash(poke, poke_bank=None, style=STYLE_GRAPHVIZ, fmt="png"):
+    """
+    Canonical hash of what a drawing shows: every node (its name, see
+    node_names, IVs, braces, gender, nature, in bank or not) in tree order,
+    plus the style and format. The same plan found by two solves has the
+    same hash.
+    """
+    bank_ids = _bank_ids(poke_bank)
+    names = _node_names(poke, bank_ids)
+    digest = blake2b(f"{style}:{fmt}".encode(), digest_size=16)
+    for node in lib.tree_pokes(poke):
+        has_parents = node.parent_male is not None and node.parent_female is not None
+        digest.update(
+            f"|{names[id(node)]},{node.iv_mask},{node.braced_mask},{node.gender_code},"
+            f"{int(node.has_nature)},{int(node.id in bank_ids)},{int(has_parents)}".encode()
+        )
+    return digest.hexdigest()
+
+
+def visualize_breeding_tree(poke, poke_bank=None):
+    """The graphviz Digraph of a tree, bank pokes are filled. Returns (graph, [(wild poke, in bank)])."""
+    graph = Digraph(format="png", graph_attr={"rankdir": "TB"})
+    wild_pokes = []
+    # Create a set of Poké Bank IDs for quick lookup
+    pokebank_ids = _bank_ids(poke_bank)
+    names = _node_names(poke, pokebank_ids)
+
+    for node in lib.tree_pokes(poke):
+        # Check if the Pokémon's ID is in the Poké Bank IDs
+        in_bank = node.id in pokebank_ids
+        name = names[id(node)]
+
+        # Create a label for the node
+        poke_label = f"{name}\\nStats: {node.get_stats()}\\nGender: {node.gender}"
+
+        # Set node border color based on presence in Poké Bank
+        node_color = "green" if in_bank else "black"
+        node_style = "filled" if in_bank else "solid"
+        fill_color = "lightblue" if in_bank else "white"
+
+        graph.node(name, poke_label, style=node_style, fillcolor=fill_color, color=node_color)
+
+        if node.parent_male and node.parent_female:
+            graph.edge(names[id(node.parent_male)], name)
+            graph.edge(names[id(node.parent_female)], name)
+        else:
+            # Wild Pokémon (no parents)
+            wild_pokes.append((node, in_bank))
+
+    return graph, wild_pokes
+
+
+# sizes of the built in svg drawing
+_NODE_WIDTH = 150
+_NODE_HEIGHT = 54
+_GAP_X = 12
+_GAP_Y = 40
+
+
+def _layout(poke):
+    # parents above their offspring (like rankdir TB with edges parent ->
+    # offspring), leaves spread evenly and every offspring centered over its
+    # parents. Returns [(node, x, depth)] parents first, and the leaf count
+    positions = []
+    next_leaf = 0
+    # x of the nodes placed so far
+    xs = {}
+    pending = [(poke, 0, False)]
+    while pending:
+        node, depth, ready = pending.pop()
+        has_parents = node.parent_male is not None and node.parent_female is not None
+        if has_parents and not ready:
+            pending.append((node, depth, True))
+            pending.append((node.parent_female, depth + 1, False))
+            pending.append((node.parent_male, depth + 1, False))
+            continue
+        if has_parents:
+            x = (xs[id(node.parent_male)] + xs[id(node.parent_female)]) / 2
+        else:
+            x = next_leaf
+            next_leaf += 1
+        xs[id(node)] = x
+        positions.append((node, x, depth))
+    return positions, next_leaf
+
+
+def tree_to_svg(poke, poke_bank=None):
+    """Draws the tree as an svg document without graphviz."""
+    bank_ids = _bank_ids(poke_bank)
+    names = _node_names(poke, bank_ids)
+    positions, leaves = _layout(poke)
+    depth = max(d for _, _, d in positions)
+    width = leaves * (_NODE_WIDTH + _GAP_X) + _GAP_X
+    height = (depth + 1) * (_NODE_HEIGHT + _GAP_Y) + _GAP_Y
+
+    def corner(x, d):
+        # the root goes at the bottom, the wild pokes at the top
+        left = _GAP_X + x * (_NODE_WIDTH + _GAP_X)
+        top = _GAP_Y + (depth - d) * (_NODE_HEIGHT + _GAP_Y)
+        return left, top
+
+    where = {id(node): corner(x, d) for node, x, d in positions}
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width:.0f}" height="{height:.0f}" '
+        f'font-family="monospace" font-size="12">'
+    ]
+    for node, _, _ in positions:
+        if node.parent_male is not None and node.parent_female is not None:
+            left, top = where[id(node)]
+            for parent in (node.parent_male, node.parent_female):
+                p_left, p_top = where[id(parent)]
+                parts.append(
+                    f'<line x1="{p_left + _NODE_WIDTH / 2:.0f}" y1="{p_top + _NODE_HEIGHT:.0f}" '
+                    f'x2="{left + _NODE_WIDTH / 2:.0f}" y2="{top:.0f}" stroke="black"/>'
+                )
+    for node, _, _ in positions:
+        left, top = where[id(node)]
+        in_bank = node.id in bank_ids
+        fill = "lightblue" if in_bank else "white"
+        stroke = "green" if in_bank else "black"
+        parts.append(
+            f'<rect x="{left:.0f}" y="{top:.0f}" width="{_NODE_WIDTH}" height="{_NODE_HEIGHT}" '
+            f'rx="6" fill="{fill}" stroke="{stroke}"/>'
+        )
+        lines = (names[id(node)], f"Stats: {node.get_stats()}", f"Gender: {node.gender}")
+        for i, line in enumerate(lines):
+            parts.append(
+                f'<text x="{left + _NODE_WIDTH / 2:.0f}" y="{top + 16 + i * 14:.0f}" '
+                f'text-anchor="middle">{escape(line)}</text>'
+            )
+    parts.append('</svg>')
+    return "\n".join(parts)
+
+
+def tree_to_text(poke, poke_bank=None):
+    """The tree as an indented outline, parents under their offspring."""
+    bank_ids = _bank_ids(poke_bank)
+    names = _node_names(poke, bank_ids)
+    lines = []
+    stack = [(poke, 0, "")]
+    while stack:
+        node, depth, side = stack.pop()
+        mark = " [in Poké Bank]" if node.id in bank_ids else ""
+        lines.append(f"{'    ' * depth}{side}{names[id(node)]}: {node.get_stats()} {node.gender}{mark}")
+        if node.parent_male is not None and node.parent_female is not None:
+            stack.append((node.parent_female, depth + 1, "♀ "))
+            stack.append((node.parent_male, depth + 1, "♂ "))
+    return "\n".join(lines)
+
+
+def _draw(poke, poke_bank, style, fmt):
+    if style == STYLE_SVG:
+        return tree_to_svg(poke, poke_bank).encode()
+    if style == STYLE_TEXT:
+        return tree_to_text(poke, poke_bank).encode()
+    graph, _ = visualize_breeding_tree(poke, poke_bank)
+    # in memory, no file in the working directory
+    return graph.pipe(format=fmt)
+
+
+def render_tree(poke, poke_bank=None, style=STYLE_GRAPHVIZ, fmt="png"):
+    """Bytes of the drawing of a tree (png/svg from graphviz, or the built in svg/text), cached by tree hash."""
+    return submit_render(poke, poke_bank, style, fmt).result()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=RENDER_WORKERS, thread_name_prefix="render")
+        return _pool
+
+
+def submit_render(poke, poke_bank=None, style=STYLE_GRAPHVIZ, fmt="png"):
+    """
+    Renders a tree on the render pool, returns a future of the bytes. Cached
+    drawings come back as done futures and the same tree asked twice while
+    it's being drawn shares the same future.
+    """
+    key = tree_hash(poke, poke_bank, style, fmt)
+    cached = render_cache.get(key)
+    if cached is not None:
+        future = Future()
+        future.set_result(cached)
+        return future
+
+    def work():
+        data = _draw(poke, poke_bank, style, fmt)
+        render_cache.put(key, data)
+        return data
+
+    def forget(_):
+        with _pool_lock:
+            if _pending.get(key) is future:
+                del _pending[key]
+
+    pool = _get_pool()
+    with _pool_lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future
+        future = pool.submit(work)
+        _pending[key] = future
+    future.add_done_callback(forget)
+    return future
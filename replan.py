@@ -0,0 +1,221 @@
+"""
+Plans that follow the bank. IncrementalPlanner keeps the plan of each target
+with an index from bank keys (IV mask, gender) to the plans that use them or
+could use them, so a bank edit only re-plans the targets it can change, and
+gives back what changed in their trees.
+
+Removing bank pokes never makes an optimal plan cheaper, so only the plans
+using a removed poke change, and only at its node: another bank poke with
+the same key takes its place when there is one, which keeps the plan
+optimal. The plan is only searched again when there is none. Added pokes
+can make plans cheaper, those go through the solver caches: when the stock a
+target sees is the same (the key has more pokes than the tree could ask
+for) the plan is a cache hit and only the bank pokes get matched again,
+otherwise only the subtree states whose stock changed are searched again.
+"""
+import instrument
+import lib
+import subtree_cache
+
+
+def candidate_keys(target_key):
+    """Bank keys the tree of a target can use: the target key and every key with only some of its IVs."""
+    mask = target_key & lib.FULL_MASK
+    keys = {target_key}
+    sub = mask
+    while sub:
+        sub = (sub - 1) & mask
+        for gender_code in (lib.GENDER_FEMALE, lib.GENDER_MALE, lib.GENDER_UNKNOWN):
+            keys.add(lib.poke_key(sub, gender_code))
+    return keys
+
+
+def target_name(target):
+    return lib.key_label(target.key) + (" [Nat]" if target.has_nature else "")
+
+
+def tree_slots(root, poke_bank=None):
+    """
+    {slot: {"poke", "source"}} of a plan tree, slots numbered like arena
+    trees (the parents of slot i are 2i+1 and 2i+2). The source is the bank
+    poke id, "wild" or "bred".
+    """
+    bank = lib.as_poke_base(poke_bank)
+    slots = {}
+    pending = [(root, 0)]
+    while pending:
+        poke, slot = pending.pop()
+        if poke.parent_male is not None:
+            source = "bred"
+            pending.append((poke.parent_male, 2 * slot + 1))
+            pending.append((poke.parent_female, 2 * slot + 2))
+        else:
+            source = poke.id if poke.id in bank else "wild"
+        slots[slot] = {"poke": f"{poke.get_stats()} {poke.gender}", "source": source}
+    return slots
+
+
+def diff_slots(before, after):
+    """[{"slot", "before", "after"}] of the slots whose poke changed, None where the slot is empty."""
+    return [
+        {"slot": slot, "before": before.get(slot), "after": after.get(slot)}
+        for slot in sorted(before.keys() | after.keys())
+        if before.get(slot) != after.get(slot)
+    ]
+
+
+class IncrementalPlanner():
+    """
+    The plans of several targets against one bank, updated on bank deltas.
+    apply() edits the planner's bank in place, sync() moves to a new bank
+    (like the ones PokeStore.load gives, which must not be edited). Both
+    return {name: {"result", "diff"}} for the plans that were re-planned,
+    the result like lib.find_best_tree's with its "score" and the diff like
+    diff_slots (empty when the tree came out the same).
+    """
+    def __init__(self, poke_bank=None, breed_cost=lib.BREED_COST, wild_cost=lib.WILD_COST,
+                 max_steps=lib.MAX_SOLVER_STEPS, cache=None):
+        self.poke_bank = lib.as_poke_base(poke_bank)
+        self.breed_cost = breed_cost
+        self.wild_cost = wild_cost
+        self.max_steps = max_steps
+        self.cache = cache if cache is not None else subtree_cache.shared_cache
+        self.targets = {}
+        self.results = {}
+        # name -> tree_slots of its plan, what the next diff is taken against
+        self._slots = {}
+        # bank key -> names of the plans that use it or could
+        self._dependents = {}
+        # name -> {bank id: node} of the bank pokes its plan uses
+        self._bank_nodes = {}
+        # bank id -> names of the plans that use it
+        self._users = {}
+
+    def _solve(self, name):
+        solver = lib.TreeSolver(self.poke_bank, self.breed_cost, self.wild_cost, self.max_steps, self.cache)
+        result = solver.solve(self.targets[name])
+        root = result["poke"]
+        result["score"] = lib.similarity_score(self.poke_bank, [root.parent_male, root.parent_female])
+        self.results[name] = result
+        self._slots[name] = tree_slots(root, self.poke_bank)
+        self._drop_users(name)
+        nodes = self._bank_nodes[name] = {}
+        for poke in lib.tree_pokes(root):
+            if poke.parent_male is None and poke.id in self.poke_bank:
+                nodes[poke.id] = poke
+                self._users.setdefault(poke.id, set()).add(name)
+        return result
+
+    def _drop_users(self, name):
+        for poke_id in self._bank_nodes.pop(name, ()):
+            names = self._users.get(poke_id)
+            names.discard(name)
+            if not names:
+                del self._users[poke_id]
+
+    def _rematch(self, name, removed):
+        # gives the node of a removed bank poke another bank poke with its
+        # key that the plan doesn't use yet, False when there is none
+        nodes = self._bank_nodes[name]
+        node = nodes.get(removed.id)
+        for poke_id in self.poke_bank.iter_ids(removed.key):
+            if poke_id not in nodes:
+                del nodes[removed.id]
+                self._users[removed.id].discard(name)
+                if not self._users[removed.id]:
+                    del self._users[removed.id]
+                node.id = poke_id
+                nodes[poke_id] = node
+                self._users.setdefault(poke_id, set()).add(name)
+                return True
+        return False
+
+    def plan(self, target, name=None):
+        """Plans a target (again if it has a plan) under a name, by default its IV code. Returns the result."""
+        name = name or target_name(target)
+        self.forget(name)
+        self.targets[name] = target
+        for key in candidate_keys(target.key):
+            self._dependents.setdefault(key, set()).add(name)
+        return self._solve(name)
+
+    def forget(self, name):
+        target = self.targets.pop(name, None)
+        if target is None:
+            return
+        self.results.pop(name, None)
+        self._slots.pop(name, None)
+        self._drop_users(name)
+        for key in candidate_keys(target.key):
+            names = self._dependents.get(key)
+            names.discard(name)
+            if not names:
+                del self._dependents[key]
+
+    def affected(self, keys):
+        """Names of the plans that a change to these bank keys can touch."""
+        names = set()
+        for key in keys:
+            names.update(self._dependents.get(key, ()))
+        return names
+
+    def apply(self, added=(), removed=()):
+        """Adds pokes to the bank and removes others (pokes or ids), then updates the plans they touch."""
+        gone = []
+        for poke_id in removed:
+            poke = self.poke_bank.remove_poke(poke_id)
+            if poke is not None:
+                gone.append(poke)
+        keys = set()
+        for poke in added:
+            if self.poke_bank.add_poke(poke):
+                keys.add(poke.key)
+        return self._update(keys, gone)
+
+    def sync(self, poke_bank):
+        """Moves to a new version of the bank, the delta is found by poke id (an id whose key changed is both)."""
+        bank = lib.as_poke_base(poke_bank)
+        old = self.poke_bank
+        keys = set()
+        for poke in bank:
+            before = old.get(poke.id)
+            if before is None or before.key != poke.key:
+                keys.add(poke.key)
+        gone = []
+        for poke in old:
+            after = bank.get(poke.id)
+            if after is None or after.key != poke.key:
+                gone.append(poke)
+        self.poke_bank = bank
+        return self._update(keys, gone)
+
+    def _update(self, added_keys, removed):
+        updates = {}
+        with instrument.phase("replan"):
+            # added pokes can make a plan cheaper, those are searched again
+            replan = self.affected(added_keys)
+            rematched = set()
+            for poke in removed:
+                for name in sorted(self._users.get(poke.id, ())):
+                    if name in replan:
+                        continue
+                    if self._rematch(name, poke):
+                        rematched.add(name)
+                    else:
+                        replan.add(name)
+            for name in sorted(replan):
+                before = self._slots[name]
+                result = self._solve(name)
+                updates[name] = {"result": result, "diff": diff_slots(before, self._slots[name])}
+            for name in sorted(rematched - replan):
+                before = self._slots[name]
+                self._slots[name] = tree_slots(self.results[name]["poke"], self.poke_bank)
+                updates[name] = {"result": self.results[name], "diff": diff_slots(before, self._slots[name])}
+            # the plans keep their tree, the keys they see in the bank may have changed
+            for name in self.affected({poke.key for poke in removed}) - replan:
+                result = self.results[name]
+                root = result["poke"]
+                result["score"] = lib.similarity_score(self.poke_bank, [root.parent_male, root.parent_female])
+        instrument.count("plans_replanned", len(replan))
+        instrument.count("plans_rematched", len(rematched - replan))
+        return updates
@@ -0,0 +1,305 @@
+"""
+Local HTTP API of the breeding planner, asyncio and the standard library only.
+
+    python server.py --db poke_bank.db --port 8502 --workers 2
+
+    GET    /plan?target=...   plan of a target (same JSON as the main.py lines)
+    POST   /plan              same, with {"target": "+ + - - + - (f)"}
+    GET    /bank              every bank poke and the bank version
+    POST   /bank              adds a poke {"id", "stats", "gender"} (id optional) or a list of them
+    GET    /bank/<id>         one bank poke
+    DELETE /bank/<id>         removes a bank poke
+    GET    /metrics           latency histograms, queue depth, coalesced and rejected searches
+    GET    /health
+
+Searches run on a process pool. A request for a target that is already
+being planned (on the same bank version) waits for that search instead of
+starting another, and once max_pending searches are in flight new ones get
+a 503 with Retry-After. The bank_version of a plan is the one its search
+loaded, which can be newer than the one current when it was asked for.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import instrument
+import lib
+import main as cli
+import storage
+from subtree_cache import SubtreeCache
+
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8502
+DEFAULT_WORKERS = 2
+# searches in flight (running or queued) before new ones are turned down
+MAX_PENDING = 64
+MAX_BODY = 1 << 20
+
+_TARGET = re.compile(r"^\s*(?:[-+*]\s*){6}(?:\([mfMF]\))?\s*(?:\[Nat\])?\s*$")
+
+_ROUTES = ("plan", "bank", "metrics", "health")
+
+_REASONS = {
+    200: "OK", 201: "Created", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+    413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable",
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+# solver cache of a planning process, kept from one request to the next
+_cache = None
+
+
+def _plan_in_worker(db_path, code):
+    # (bank version, plan line) of a search, the version read with the bank
+    global _cache
+    if _cache is None:
+        _cache = SubtreeCache()
+    # the store keeps the loaded bank while its version doesn't change
+    version, bank = storage.open_store(db_path).load_with_version()
+    return version, cli.plan(code, bank, cache=_cache)
+
+
+def _target_key(code):
+    # equal targets written differently are the same search
+    poke = lib.Poke(code)
+    return poke.iv_mask, poke.braced_mask, poke.gender_code, poke.has_nature
+
+
+def _json_body(body):
+    try:
+        return json.loads(body or b"null")
+    except ValueError:
+        raise HTTPError(400, "body is not valid JSON")
+
+
+class PlanService():
+    """
+    The planner behind the HTTP API: one bank store, a process pool for the
+    searches and the metrics. Everything but the searches runs on the event
+    loop, so there's no locking.
+    """
+    def __init__(self, db_path=storage.DEFAULT_DB, workers=DEFAULT_WORKERS, max_pending=MAX_PENDING):
+        self.db_path = db_path
+        self.store = storage.open_store(db_path)
+        self.workers = workers
+        self.max_pending = max_pending
+        # spawned, not forked: the workers open their own sqlite connection
+        self.pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        # (target key, bank version) -> future of the search running for it
+        self._inflight = {}
+        self.latency = {}
+        self.coalesced = 0
+        self.rejected = 0
+
+    async def plan(self, code):
+        if not isinstance(code, str) or not _TARGET.match(code):
+            raise HTTPError(400, "target must be an IV code like '+ + - - + - (f)'")
+        # searches are shared per bank version seen here, the version given
+        # back is the one the search loaded
+        current = await asyncio.to_thread(self.store.version)
+        key = (_target_key(code), current)
+        future = self._inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            if len(self._inflight) >= self.max_pending:
+                self.rejected += 1
+                raise HTTPError(503, "too many searches in flight, retry later")
+            future = asyncio.get_running_loop().run_in_executor(self.pool, _plan_in_worker, self.db_path, code)
+            self._inflight[key] = future
+
+            def forget(_, key=key, future=future):
+                if self._inflight.get(key) is future:
+                    del self._inflight[key]
+            future.add_done_callback(forget)
+        # shielded: a client leaving doesn't cancel the search others wait for
+        version, line = await asyncio.shield(future)
+        return dict(line, target=code, bank_version=version)
+
+    async def list_bank(self):
+        version, bank = await asyncio.to_thread(self.store.load_with_version)
+        return {"bank_version": version, "pokes": [storage.poke_to_json(poke) for poke in bank]}
+
+    async def get_poke(self, poke_id):
+        bank = await asyncio.to_thread(self.store.load)
+        poke = bank.get(poke_id)
+        if poke is None:
+            raise HTTPError(404, f"no poke {poke_id} in the bank")
+        return storage.poke_to_json(poke)
+
+    async def add_pokes(self, data):
+        entries = data if isinstance(data, list) else [data]
+        pokes = []
+        for entry in entries:
+            if not isinstance(entry, dict) or not isinstance(entry.get("stats"), str) \
+                    or not _TARGET.match(entry["stats"]):
+                raise HTTPError(400, "pokes look like {\"id\", \"stats\": \"+ - - - - -\", \"gender\": \"(M)\"}")
+            pokes.append(storage.poke_from_json(dict(entry, id=entry.get("id") or lib.new_id())))
+        added = await asyncio.to_thread(self.store.add_many, pokes)
+        version = await asyncio.to_thread(self.store.version)
+        return {"added": added, "ids": [poke.id for poke in pokes], "bank_version": version}
+
+    async def remove_poke(self, poke_id):
+        removed = await asyncio.to_thread(self.store.remove, poke_id)
+        if not removed:
+            raise HTTPError(404, f"no poke {poke_id} in the bank")
+        version = await asyncio.to_thread(self.store.version)
+        return {"removed": poke_id, "bank_version": version}
+
+    def metrics(self):
+        in_flight = len(self._inflight)
+        return {
+            "latency_ms": {route: histogram.to_dict() for route, histogram in sorted(self.latency.items())},
+            "searches_in_flight": in_flight,
+            # searches waiting for a free worker
+            "queue_depth": max(0, in_flight - self.workers),
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "coalesced": self.coalesced,
+            "rejected": self.rejected,
+        }
+
+    async def dispatch(self, method, path, query, body):
+        """Runs one request, returns (route, status, payload)."""
+        parts = [part for part in path.split("/") if part]
+        # unknown paths share one histogram, whatever clients send
+        route = parts[0] if parts and parts[0] in _ROUTES else "other"
+        try:
+            if parts == ["plan"] and method == "GET":
+                return route, 200, await self.plan(query.get("target", [""])[0])
+            if parts == ["plan"] and method == "POST":
+                data = _json_body(body)
+                return route, 200, await self.plan(data.get("target") if isinstance(data, dict) else None)
+            if parts == ["bank"] and method == "GET":
+                return route, 200, await self.list_bank()
+            if parts == ["bank"] and method == "POST":
+                return route, 201, await self.add_pokes(_json_body(body))
+            if len(parts) == 2 and parts[0] == "bank" and method == "GET":
+                return route, 200, await self.get_poke(parts[1])
+            if len(parts) == 2 and parts[0] == "bank" and method == "DELETE":
+                return route, 200, await self.remove_poke(parts[1])
+            if parts == ["metrics"] and method == "GET":
+                return route, 200, self.metrics()
+            if parts == ["health"] and method == "GET":
+                return route, 200, {"status": "ok"}
+            if route in _ROUTES:
+                raise HTTPError(405, f"{method} not allowed on {path}")
+            raise HTTPError(404, f"nothing at {path}")
+        except HTTPError as error:
+            return route, error.status, {"error": str(error)}
+        except Exception as error:
+            return route, 500, {"error": f"{type(error).__name__}: {error}"}
+
+    async def handle(self, reader, writer):
+        """One connection, keep-alive requests answered in order."""
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except HTTPError as error:
+                    writer.write(_response(error.status, {"error": str(error)}, keep_alive=False))
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+                method, path, query, keep_alive, body = request
+                start = time.perf_counter()
+                route, status, payload = await self.dispatch(method, path, query, body)
+                self.latency.setdefault(route, instrument.Histogram()).observe(time.perf_counter() - start)
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def close(self):
+        self.pool.shutdown(cancel_futures=True)
+
+
+async def _read_request(reader):
+    # (method, path, query, keep alive, body), None once the client closed
+    line = await reader.readline()
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(400, "bad request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        raise HTTPError(400, "bad Content-Length")
+    if length > MAX_BODY:
+        raise HTTPError(413, f"body over {MAX_BODY} bytes")
+    body = await reader.readexactly(length) if length else b""
+    connection = headers.get("connection", "").lower()
+    keep_alive = connection == "keep-alive" if version == "HTTP/1.0" else connection != "close"
+    url = urlsplit(target)
+    return method.upper(), unquote(url.path), parse_qs(url.query), keep_alive, body
+
+
+def _response(status, payload, keep_alive=True):
+    body = json.dumps(payload).encode()
+    head = [
+        f"HTTP/1.1 {status} {_REASONS.get(status, '')}",
+        "Content-Type: application/json",
+        f"Content-Length: {len(body)}",
+        f"Connection: {'keep-alive' if keep_alive else 'close'}",
+    ]
+    if status == 503:
+        head.append("Retry-After: 1")
+    return ("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body
+
+
+async def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"planning API on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local HTTP API of the breeding planner")
+    parser.add_argument("--db", default=storage.DEFAULT_DB, help="bank store file")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="search processes")
+    parser.add_argument("--max-pending", type=int, default=MAX_PENDING,
+                        help="searches in flight before new ones get a 503")
+    args = parser.parse_args(argv)
+
+    service = PlanService(args.db, args.workers, args.max_pending)
+    try:
+        asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+"""
+Monte Carlo simulation of carrying out a breeding plan.
+
+lib.breed gives the IVs an offspring is sure to get. In the game the stats
+nobody braces come from a random parent, the gender is rolled and both
+parents are gone whatever comes out, so a breed that misses (wrong gender,
+an IV not passed) has to be done again from new parents: its whole subtree
+is bred again. simulate() plays a plan tree out like that many times, in
+NumPy batches, and gives the chance of every breed and the expected
+breeds, items and wild pokes with confidence intervals.
+"""
+import numpy as np
+
+import lib
+import snapshot
+
+
+DEFAULT_SAMPLES = 1000000
+BATCH_SIZE = 100000
+# cap on the attempts drawn for one node in a batch, the batch shrinks for unlikely breeds
+MAX_DRAWS = 8000000
+# 95% confidence intervals
+CI_Z = 1.96
+FEMALE_CHANCE = 0.5
+
+# rows of the totals of a simulated execution
+_ROWS = ("breeds", "braces", "everstones", "gender_picks", "pokes", "retries")
+_BREEDS, _BRACES, _EVERSTONES, _GENDER_PICKS, _POKES, _RETRIES = range(len(_ROWS))
+
+# what the expected "cost" adds up, same units as the solver by default
+DEFAULT_PRICES = {"breeds": lib.BREED_COST, "wild": lib.WILD_COST}
+
+
+def attempt_chance(node, female_chance=FEMALE_CHANCE, buy_gender=False, nature_chance=1.0):
+    """Chance that one breed of a snapshot node's parents gives the node (its IVs, gender and nature)."""
+    male, female = node.male, node.female
+    if male.braced_mask & ~male.iv_mask or female.braced_mask & ~female.iv_mask:
+        return 0.0
+    chance = 1.0
+    # braced stats always pass, the others come from one parent or the other
+    for stat in lib.mask_bits(node.iv_mask & ~(male.braced_mask | female.braced_mask)):
+        chance *= ((male.iv_mask >> stat & 1) + (female.iv_mask >> stat & 1)) / 2
+    if not buy_gender:
+        if node.gender_code == lib.GENDER_FEMALE:
+            chance *= female_chance
+        elif node.gender_code == lib.GENDER_MALE:
+            chance *= 1 - female_chance
+    if node.has_nature:
+        chance *= nature_chance
+    return chance
+
+
+def _breed_nodes(root):
+    # the distinct bred subtrees of a snapshot, parents before offspring
+    order = []
+    seen = set()
+    pending = [(root, False)]
+    while pending:
+        node, ready = pending.pop()
+        if node.male is None or node.digest in seen:
+            continue
+        if not ready:
+            pending.append((node, True))
+            pending.append((node.female, False))
+            pending.append((node.male, False))
+            continue
+        seen.add(node.digest)
+        order.append(node)
+    return order
+
+
+def _preorder(frozen):
+    # snapshot nodes in lib.tree_pokes order (preorder, male first)
+    pending = [frozen]
+    while pending:
+        node = pending.pop()
+        yield node
+        if node.male is not None:
+            pending.append(node.female)
+            pending.append(node.male)
+
+
+def _simulate_batch(nodes, chances, items, n, rng):
+    # totals of n executions of the root (last node) until it succeeds; a node
+    # takes a geometric number of attempts, and the parents of each attempt
+    # are drawn from the parents' own n simulated executions
+    # a leaf is always one poke, a pool of a single column
+    leaf = np.zeros((len(_ROWS), 1), dtype=np.int64)
+    leaf[_POKES] = 1
+    pools = {}
+    pool = leaf
+    for node in nodes:
+        attempts = rng.geometric(chances[node.digest], n)
+        starts = np.cumsum(attempts) - attempts
+        pool = np.zeros((len(_ROWS), n), dtype=np.int64)
+        for parent in (node.male, node.female):
+            parent_pool = pools.get(parent.digest, leaf)
+            if parent_pool.shape[1] == 1:
+                pool += parent_pool * attempts
+            else:
+                drawn = parent_pool[:, rng.integers(0, n, int(starts[-1] + attempts[-1]))]
+                pool += np.add.reduceat(drawn, starts, axis=1)
+        braces, everstones, gender_picks = items[node.digest]
+        pool[_BREEDS] += attempts
+        pool[_BRACES] += attempts * braces
+        pool[_EVERSTONES] += attempts * everstones
+        pool[_GENDER_PICKS] += attempts * gender_picks
+        pool[_RETRIES] += attempts - 1
+        pools[node.digest] = pool
+    return pool
+
+
+def _summary(values, z):
+    mean = float(values.mean())
+    half = z * float(values.std()) / len(values) ** 0.5
+    p50, p95 = np.percentile(values, [50, 95])
+    return {"mean": mean, "ci": (mean - half, mean + half), "p50": float(p50), "p95": float(p95)}
+
+
+def simulate(tree, poke_bank=None, samples=DEFAULT_SAMPLES, seed=None, female_chance=FEMALE_CHANCE,
+             buy_gender=False, nature_chance=1.0, prices=None, batch_size=BATCH_SIZE, z=CI_Z):
+    """
+    Plays a plan tree (lib.Poke) out `samples` times. Every breed rolls its
+    gender (female_chance, or buy_gender to pay for it instead: a gender
+    pick per attempt) and the stats that aren't braced, a miss breeds the
+    subtree again. Each attempt uses up the braces its parents hold and an
+    everstone when the nature is passed (nature_chance). Leaves are wild
+    pokes except the bank ones (first use only).
+    Returns a dict with the chance of each breed ("nodes", [(node, chance)]
+    offspring first), the chance of doing the plan without a miss and, for
+    breeds, braces, everstones, gender_picks, wild, retries and the priced
+    "cost", their mean with its confidence interval (z), p50 and p95. The
+    same seed gives the same numbers.
+    """
+    prices = DEFAULT_PRICES if prices is None else prices
+    bank = lib.as_poke_base(poke_bank)
+    frozen = snapshot.freeze(tree)
+    nodes = _breed_nodes(frozen)
+
+    chances = {}
+    items = {}
+    for node in nodes:
+        chance = attempt_chance(node, female_chance, buy_gender, nature_chance)
+        if not chance:
+            raise ValueError(f"{lib.key_label(node.key)} can never come out of its parents")
+        chances[node.digest] = chance
+        items[node.digest] = (
+            bool(node.male.braced_mask) + bool(node.female.braced_mask),
+            int(node.has_nature),
+            int(buy_gender and node.gender_code != lib.GENDER_UNKNOWN),
+        )
+    breed_chances = [
+        (poke, chances[frozen_node.digest])
+        for poke, frozen_node in zip(lib.tree_pokes(tree), _preorder(frozen))
+        if frozen_node.male is not None
+    ]
+    bank_leaves = sum(1 for poke in lib.tree_pokes(tree) if poke.parent_male is None and poke.id in bank)
+
+    rng = np.random.default_rng(seed)
+    if not nodes:
+        # a single poke, nothing to breed
+        totals = np.zeros((len(_ROWS), samples), dtype=np.int64)
+        totals[_POKES] = 1
+    else:
+        batch = max(1, min(batch_size, int(MAX_DRAWS * min(chances.values()))))
+        parts = []
+        done = 0
+        while done < samples:
+            n = min(batch, samples - done)
+            parts.append(_simulate_batch(nodes, chances, items, n, rng))
+            done += n
+        totals = np.concatenate(parts, axis=1)
+
+    metrics = {name: totals[row] for row, name in enumerate(_ROWS) if name != "pokes"}
+    metrics["wild"] = totals[_POKES] - bank_leaves
+    metrics["cost"] = sum(price * metrics[name] for name, price in prices.items())
+    first_try = float((totals[_RETRIES] == 0).mean())
+    half = z * (first_try * (1 - first_try) / samples) ** 0.5
+    return {
+        "samples": samples,
+        "seed": seed,
+        "nodes": breed_chances,
+        "success": {"mean": first_try, "ci": (max(0.0, first_try - half), min(1.0, first_try + half))},
+        **{name: _summary(np.asarray(values), z) for name, values in metrics.items()},
+    }
+
+
+def rank_by_expected_cost(trees, poke_bank=None, samples=20000, seed=0, **model):
+    """
+    Trees sorted by simulated expected cost, cheapest first, as
+    [(expected cost, tree, simulation)]. simulate's model options apply,
+    a few thousand samples are plenty to tell candidates apart.
+    """
+    ranked = []
+    for tree in trees:
+        result = simulate(tree, poke_bank, samples=samples, seed=seed, **model)
+        ranked.append((result["cost"]["mean"], tree, result))
+    ranked.sort(key=lambda item: item[0])
+    return ranked
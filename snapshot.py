@@ -0,0 +1,149 @@
+from hashlib import blake2b
+from heapq import heappush, heapreplace
+from weakref import WeakValueDictionary
+
+import lib
+
+
+# every live snapshot by digest: equal subtrees are the same object, so trees
+# that share parts share their memory
+_interned = WeakValueDictionary()
+
+
+class TreeSnapshot():
+    """
+    Immutable node of a breeding tree. Its digest is a canonical hash of the
+    whole subtree (IVs, braces, gender, nature and the parents' digests, ids
+    are left out), equal subtrees are interned so snapshots share structure.
+    Leaves have no parents.
+    """
+    __slots__ = ('iv_mask', 'braced_mask', 'gender_code', 'has_nature', 'male', 'female', 'digest', '__weakref__')
+
+    def __new__(cls, iv_mask, braced_mask, gender_code, has_nature=False, male=None, female=None):
+        digest = blake2b(bytes((iv_mask, braced_mask, gender_code, int(has_nature))), digest_size=16)
+        if male is not None:
+            digest.update(male.digest)
+            digest.update(female.digest)
+        digest = digest.digest()
+        node = _interned.get(digest)
+        if node is None:
+            node = object.__new__(cls)
+            for name, value in (('iv_mask', iv_mask), ('braced_mask', braced_mask), ('gender_code', gender_code),
+                                ('has_nature', bool(has_nature)), ('male', male), ('female', female),
+                                ('digest', digest)):
+                object.__setattr__(node, name, value)
+            _interned[digest] = node
+        return node
+
+    def __setattr__(self, name, value):
+        raise AttributeError("tree snapshots are immutable")
+
+    def __hash__(self):
+        return hash(self.digest)
+
+    def __eq__(self, other):
+        return isinstance(other, TreeSnapshot) and self.digest == other.digest
+
+    @property
+    def key(self):
+        return self.iv_mask | self.gender_code << lib.STAT_COUNT
+
+    @property
+    def hexdigest(self):
+        return self.digest.hex()
+
+
+def freeze(poke):
+    """Snapshot of a linked lib.Poke tree."""
+    frozen = {}
+    pending = [(poke, False)]
+    while pending:
+        node, ready = pending.pop()
+        has_parents = node.parent_male is not None and node.parent_female is not None
+        if has_parents and not ready:
+            # parents first, then come back to this one
+            pending.append((node, True))
+            pending.append((node.parent_male, False))
+            pending.append((node.parent_female, False))
+            continue
+        male = frozen[id(node.parent_male)] if has_parents else None
+        female = frozen[id(node.parent_female)] if has_parents else None
+        frozen[id(node)] = TreeSnapshot(node.iv_mask, node.braced_mask, node.gender_code,
+                                        node.has_nature if node is poke else False, male, female)
+    return frozen[id(poke)]
+
+
+def freeze_arena(tree):
+    """Snapshot of an arena.ArenaTree, built from the last slot up."""
+    frozen = {}
+    for slot in reversed(range(tree.size)):
+        if not tree.present[slot]:
+            continue
+        male, female = frozen.get(2 * slot + 1), frozen.get(2 * slot + 2)
+        frozen[slot] = TreeSnapshot(tree.iv[slot], tree.braced[slot], tree.gender[slot],
+                                    tree.has_nature if slot == 0 else False, male, female)
+    return frozen[0]
+
+
+def thaw(snapshot):
+    """A new linked lib.Poke tree (with new ids) from a snapshot."""
+    root = None
+    pending = [(snapshot, None, False)]
+    while pending:
+        node, offspring, is_male = pending.pop()
+        poke = lib.Poke()
+        poke.iv_mask = node.iv_mask
+        poke.braced_mask = node.braced_mask
+        poke.gender_code = node.gender_code
+        poke.has_nature = node.has_nature
+        if offspring is None:
+            root = poke
+        else:
+            poke.offspring = offspring
+            if is_male:
+                offspring.parent_male = poke
+            else:
+                offspring.parent_female = poke
+        if node.male is not None:
+            pending.append((node.female, poke, False))
+            pending.append((node.male, poke, True))
+    return root
+
+
+class TopTrees():
+    """
+    The k best scored trees seen, in a bounded min-heap: a candidate costs
+    O(log k) and trees with the same digest are kept once. On equal scores
+    the tree pushed first wins.
+    """
+    def __init__(self, k):
+        self.k = k
+        self._heap = []
+        self._digests = set()
+        self._pushed = 0
+
+    def __len__(self):
+        return len(self._heap)
+
+    def accepts(self, score):
+        """Whether a tree with this score would get in (to skip building snapshots for nothing)."""
+        return self.k > 0 and (len(self._heap) < self.k or score > self._heap[0][0])
+
+    def push(self, score, snapshot):
+        """Offers a tree, returns True if it made it into the top."""
+        if not self.accepts(score) or snapshot.digest in self._digests:
+            return False
+        # the negated push count breaks ties: the newest equal score leaves first
+        entry = (score, -self._pushed, snapshot.digest, snapshot)
+        self._pushed += 1
+        if len(self._heap) < self.k:
+            heappush(self._heap, entry)
+        else:
+            evicted = heapreplace(self._heap, entry)
+            self._digests.discard(evicted[2])
+        self._digests.add(snapshot.digest)
+        return True
+
+    def best(self):
+        """[(score, snapshot)] best first."""
+        return [(score, snapshot) for score, _, _, snapshot in sorted(self._heap, key=lambda e: (-e[0], -e[1]))]
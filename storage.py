@@ -0,0 +1,350 @@
+import csv
+import io
+import json
+import os
+import re
+import sqlite3
+from itertools import islice
+from threading import Lock
+
+import lib
+
+
+# bump when the table layout changes, older files get migrated on open
+SCHEMA_VERSION = 1
+
+DEFAULT_DB = "poke_bank.db"
+
+# bank export formats by file extension, anything else is read as text
+BANK_FILE_FORMATS = {".json": "json", ".jsonl": "jsonl", ".ndjson": "jsonl", ".csv": "csv", ".txt": "text"}
+# pokes per transaction of a bulk import, other writers get the lock in between
+IMPORT_CHUNK = 10000
+_READ_SIZE = 1 << 16
+_SPACE = re.compile(r"[\s,]*")
+
+_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS pokes (
+        id TEXT PRIMARY KEY,
+        iv_mask INTEGER NOT NULL,
+        braced_mask INTEGER NOT NULL DEFAULT 0,
+        gender INTEGER NOT NULL,
+        has_nature INTEGER NOT NULL DEFAULT 0
+    )""",
+    "CREATE INDEX IF NOT EXISTS pokes_key ON pokes (iv_mask, gender)",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO meta (name, value) VALUES ('bank_version', 0)",
+]
+
+
+def _poke_row(poke):
+    return (poke.id, poke.iv_mask, poke.braced_mask, poke.gender_code, int(poke.has_nature))
+
+
+def _row_poke(row):
+    poke = lib.Poke()
+    poke.id, poke.iv_mask, poke.braced_mask, poke.gender_code, has_nature = row
+    poke.has_nature = bool(has_nature)
+    return poke
+
+
+def poke_from_json(entry):
+    """
+    Reads one entry of the poke_bank.json format: {"id", "stats", "gender"}.
+    Without an id the poke gets a new one, without a gender the one of the
+    stats code is used.
+    """
+    if not isinstance(entry, dict):
+        raise ValueError(f"a poke is an object with a stats code, not {entry!r}")
+    stats = entry.get("stats")
+    if not isinstance(stats, str) or not stats.strip():
+        name = f"poke {entry['id']}" if entry.get("id") else "poke"
+        raise ValueError(f"{name} has no stats code")
+    poke = lib.Poke()
+    poke.id = entry.get("id") or poke.id
+    poke.iv_mask, poke.braced_mask, gender_code, poke.has_nature = lib.parse_code(stats)
+    # Ensure gender is properly set
+    gender = (entry.get("gender") or "").lower()
+    if "(m)" in gender:
+        poke.gender_code = lib.GENDER_MALE
+    elif "(f)" in gender:
+        poke.gender_code = lib.GENDER_FEMALE
+    elif not gender and gender_code is not None:
+        poke.gender_code = gender_code
+    else:
+        poke.gender_code = lib.GENDER_UNKNOWN
+    return poke
+
+
+def poke_to_json(poke):
+    return {"id": poke.id, "stats": poke.get_stats(), "gender": str(poke.gender)}
+
+
+class PokeStore():
+    """
+    The Poke bank on disk, one row per poke in a SQLite file with an index on
+    (iv_mask, gender). Adding or removing a poke touches a single row, every
+    write is its own transaction and the file runs in WAL mode, so several
+    sessions (or processes) can edit the same bank without losing writes.
+    Each write bumps the bank version, readers can use it to know if what
+    they loaded is still current.
+    """
+    def __init__(self, path=DEFAULT_DB, timeout=30.0):
+        self.path = path
+        # one connection shared by the threads of the process, sqlite does the
+        # locking between processes
+        self._lock = Lock()
+        # (bank version, PokeBase) of the last load
+        self._loaded = None
+        self._conn = sqlite3.connect(path, timeout=timeout, isolation_level=None, check_same_thread=False)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._migrate()
+
+    def _migrate(self):
+        version = self._conn.execute("PRAGMA user_version").fetchone()[0]
+        if version > SCHEMA_VERSION:
+            raise RuntimeError(f"{self.path} was written by a newer version (schema {version})")
+        if version < SCHEMA_VERSION:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for statement in _SCHEMA:
+                    self._conn.execute(statement)
+                self._conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _write(self, sql, rows):
+        # BEGIN IMMEDIATE takes the write lock up front, concurrent writers
+        # wait for it (up to timeout) instead of failing half way
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                cursor = self._conn.executemany(sql, rows)
+                changed = cursor.rowcount
+                if changed:
+                    self._conn.execute("UPDATE meta SET value = value + 1 WHERE name = 'bank_version'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return changed
+
+    def add(self, poke):
+        return self.add_many([poke])
+
+    def add_many(self, pokes):
+        """Adds pokes in one transaction, ids already in the bank are skipped. Returns how many were added."""
+        return self._write(
+            "INSERT OR IGNORE INTO pokes (id, iv_mask, braced_mask, gender, has_nature) VALUES (?, ?, ?, ?, ?)",
+            [_poke_row(poke) for poke in pokes],
+        )
+
+    def remove(self, poke_id):
+        return self.remove_many([poke_id])
+
+    def remove_many(self, poke_ids):
+        return self._write("DELETE FROM pokes WHERE id = ?", [(getattr(i, 'id', i),) for i in poke_ids])
+
+    def _read(self, sql, params=()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def version(self):
+        """Counter bumped by every write to the bank."""
+        return self._read("SELECT value FROM meta WHERE name = 'bank_version'")[0][0]
+
+    def __len__(self):
+        return self._read("SELECT COUNT(*) FROM pokes")[0][0]
+
+    def load(self):
+        """
+        The whole bank as an indexed lib.PokeBase, in insertion order. While
+        the bank version doesn't change the same PokeBase is given back
+        without reading the table again, so don't edit it: write through
+        the store instead.
+        """
+        return self.load_with_version()[1]
+
+    def load_with_version(self):
+        """(bank version, bank) of load, the version is the one of the rows read."""
+        with self._lock:
+            # one read transaction, so the rows match the version
+            self._conn.execute("BEGIN")
+            try:
+                version = self._conn.execute("SELECT value FROM meta WHERE name = 'bank_version'").fetchone()[0]
+                if self._loaded is not None and self._loaded[0] == version:
+                    return self._loaded
+                rows = self._conn.execute(
+                    "SELECT id, iv_mask, braced_mask, gender, has_nature FROM pokes ORDER BY rowid"
+                ).fetchall()
+            finally:
+                self._conn.execute("COMMIT")
+            self._loaded = (version, lib.PokeBase(_row_poke(row) for row in rows))
+            return self._loaded
+
+    def find(self, iv_mask, gender_code):
+        """Bank pokes with that IV mask and gender (uses the index)."""
+        rows = self._read(
+            "SELECT id, iv_mask, braced_mask, gender, has_nature FROM pokes "
+            "WHERE iv_mask = ? AND gender = ? ORDER BY rowid",
+            (iv_mask, gender_code),
+        )
+        return [_row_poke(row) for row in rows]
+
+    def stock(self):
+        """key -> count of the bank pokes with it, same as lib.bank_stock but counted by sqlite."""
+        rows = self._read("SELECT iv_mask, gender, COUNT(*) FROM pokes GROUP BY iv_mask, gender")
+        return {lib.poke_key(iv_mask, gender): count for iv_mask, gender, count in rows}
+
+    def import_json(self, path):
+        """Bulk loads a poke_bank.json file, returns how many pokes were new."""
+        return self.import_file(path, "json")
+
+    def import_file(self, source, file_format=None):
+        """
+        Streams a bank export (see iter_bank_file) into the bank, IMPORT_CHUNK
+        pokes per transaction. Returns how many pokes were new. On a bad
+        entry the chunks before it stay imported, the ValueError says how
+        many pokes that was.
+        """
+        pokes = iter_bank_file(source, file_format)
+        added = 0
+        while True:
+            try:
+                chunk = list(islice(pokes, IMPORT_CHUNK))
+            except ValueError as error:
+                raise ValueError(f"{error} ({added} new pokes imported before it)") from None
+            if not chunk:
+                return added
+            added += self.add_many(chunk)
+
+    def export_json(self, path=None):
+        """The bank in the poke_bank.json format, written to path when given."""
+        data = [poke_to_json(poke) for poke in self.load()]
+        if path is not None:
+            with open(path, "w") as file:
+                json.dump(data, file, indent=4)
+        return data
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def bank_file_format(name):
+    """Format of a bank export from its file name: json, jsonl, csv or text."""
+    return BANK_FILE_FORMATS.get(os.path.splitext(name)[1].lower(), "text")
+
+
+def _iter_json_array(file):
+    # entries of a top level JSON array, decoded one by one: the buffer only
+    # holds the entry being read and the rest of the last chunk
+    decoder = json.JSONDecoder()
+    buffer = file.read(_READ_SIZE)
+    pos = _SPACE.match(buffer).end()
+    if buffer[pos:pos + 1] != "[":
+        raise ValueError("a JSON bank file is an array of pokes")
+    pos += 1
+    while True:
+        # whitespace and the commas between entries
+        pos = _SPACE.match(buffer, pos).end()
+        if buffer[pos:pos + 1] == "]":
+            return
+        try:
+            entry, pos = decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError:
+            # the entry runs past the chunk, or the file is over
+            chunk = file.read(_READ_SIZE)
+            if not chunk:
+                raise ValueError("JSON bank file cut short or malformed")
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            continue
+        yield entry
+
+
+def _iter_entries(file, file_format):
+    # (where, entry) of the {"id", "stats", "gender"} entries of an export,
+    # where is "entry 3" in a JSON array and "line 3" in the other formats
+    if file_format == "json":
+        for number, entry in enumerate(_iter_json_array(file), 1):
+            yield f"entry {number}", entry
+    elif file_format == "jsonl":
+        for number, line in enumerate(file, 1):
+            if line.strip():
+                try:
+                    yield f"line {number}", json.loads(line)
+                except json.JSONDecodeError as error:
+                    raise ValueError(f"line {number}: {error}") from None
+    elif file_format == "csv":
+        reader = csv.DictReader(file)
+        fields = {(name or "").strip().lower(): name for name in reader.fieldnames or ()}
+        if "stats" not in fields:
+            raise ValueError("a CSV bank file needs a stats column (id and gender are optional)")
+        for row in reader:
+            yield f"line {reader.line_num}", {name: row[column] for name, column in fields.items() if row[column]}
+    else:
+        for number, line in enumerate(file, 1):
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield f"line {number}", {"stats": line}
+
+
+def _read_entries(file, file_format):
+    for where, entry in _iter_entries(file, file_format):
+        try:
+            yield poke_from_json(entry)
+        except ValueError as error:
+            raise ValueError(f"{where}: {error}") from None
+
+
+def iter_bank_file(source, file_format=None):
+    """
+    The pokes of a bank export, read as a stream so the memory doesn't grow
+    with the file: a poke_bank.json array or JSON lines of {"id", "stats",
+    "gender"}, a CSV with a stats column (id and gender optional) or text
+    with one IV code per line ("+ + - - - - (m)", # starts a comment).
+    source is a path or an open file (text or binary), the format comes from
+    the file name when not given. Pokes without an id get a new one, so the
+    same code twice is two pokes. An entry without a stats code raises a
+    ValueError naming its line (its position in a JSON array).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        file_format = file_format or bank_file_format(os.fspath(source))
+        with open(source, "r", encoding="utf-8", newline="") as file:
+            yield from _read_entries(file, file_format)
+        return
+    file_format = file_format or bank_file_format(getattr(source, "name", ""))
+    if isinstance(source.read(0), bytes):
+        source = io.TextIOWrapper(source, encoding="utf-8", newline="")
+    yield from _read_entries(source, file_format)
+
+
+def read_bank_file(source, file_format=None):
+    """A lib.PokeBase of a bank export (see iter_bank_file), ids seen twice are kept once."""
+    bank = lib.PokeBase()
+    bank.add_pokes(iter_bank_file(source, file_format))
+    return bank
+
+
+def load_bank_file(path):
+    """A lib.PokeBase from a bank file: an export (json, jsonl, csv or text) or a PokeStore .db file."""
+    if os.path.splitext(path)[1].lower() in BANK_FILE_FORMATS:
+        return read_bank_file(path)
+    return open_store(path).load()
+
+
+# stores opened by this process, Streamlit sessions share them
+_stores = {}
+_stores_lock = Lock()
+
+
+def open_store(path=DEFAULT_DB):
+    """The PokeStore of that file, opened once per process."""
+    with _stores_lock:
+        if path not in _stores:
+            _stores[path] = PokeStore(path)
+        return _stores[path]
@@ -0,0 +1,74 @@
+from collections import OrderedDict
+from threading import RLock
+
+
+class SubtreeCache():
+    """
+    Bounded LRU map for breeding subtree plans, shared by every search in the
+    process (Streamlit sessions run as threads of the same process).
+    Keys are the canonical subtree state: (IV mask, gender) key plus the bank
+    stock relevant to that subtree and the costs used.
+    """
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        # guards the map only, entries that searches keep working on (the
+        # solver option lists) lock themselves
+        self.lock = RLock()
+        self._entries = OrderedDict()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self.lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def get_or_create(self, key, factory):
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # built without the lock (factories can be slow or use the cache), when
+        # another thread put one in meanwhile that one is kept
+        value = factory()
+        with self.lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+            self.put(key, value)
+            return value
+
+    def clear(self):
+        with self.lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def __len__(self):
+        return len(self._entries)
+
+
+shared_cache = SubtreeCache()
@@ -0,0 +1,182 @@
+"""
+Table of the optimal tree of every target spec (IV mask x gender x nature)
+without a bank, built offline and memory-mapped by the app, so the first
+answer for a target is a lookup plus matching the bank into the template.
+
+    python templates.py    # writes templates.bin (the Dockerfile runs it)
+
+File layout, little endian:
+    header   magic b"PKTT", format version (u16), spec count (u16), blake2b-16 of everything after the header
+    index    per spec: offset of its tree (u32), levels (u8), 3 bytes of padding
+    trees    arena slots of each template: the iv, braced, gender and present
+             bytes, (1 << levels) - 1 of each. Specs that only differ by
+             the nature share the tree
+"""
+import mmap
+import os
+import struct
+import sys
+from hashlib import blake2b
+from threading import Lock
+
+import arena
+import lib
+from subtree_cache import SubtreeCache
+
+
+TEMPLATES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates.bin")
+# bump when the layout or the trees (solver costs) change, old files get rebuilt
+FORMAT_VERSION = 1
+
+_MAGIC = b"PKTT"
+_HEADER = struct.Struct("<4sHH16s")
+_ENTRY = struct.Struct("<IB3x")
+SPEC_COUNT = (lib.GENDER_UNKNOWN + 1) << lib.STAT_COUNT << 1
+
+
+class TemplateFileError(ValueError):
+    pass
+
+
+def spec_index(iv_mask, gender_code, has_nature=False):
+    return lib.poke_key(iv_mask, gender_code) << 1 | int(bool(has_nature))
+
+
+def build_table():
+    """The bytes of a template file, every tree from the solver with an empty bank."""
+    cache = SubtreeCache()
+    index = bytearray()
+    trees = bytearray()
+    start = _HEADER.size + SPEC_COUNT * _ENTRY.size
+    for key in range(SPEC_COUNT >> 1):
+        target = lib.Poke()
+        target.iv_mask, target.gender_code = key & lib.FULL_MASK, key >> lib.STAT_COUNT
+        tree = arena.ArenaTree.from_poke(lib.find_best_tree(target, cache=cache)["poke"])
+        entry = _ENTRY.pack(start + len(trees), tree.levels)
+        index += entry + entry
+        trees += tree.iv + tree.braced + tree.gender + tree.present
+    body = bytes(index + trees)
+    checksum = blake2b(body, digest_size=16).digest()
+    return _HEADER.pack(_MAGIC, FORMAT_VERSION, SPEC_COUNT, checksum) + body
+
+
+def write_table(path=TEMPLATES_FILE, data=None):
+    data = build_table() if data is None else data
+    # written next to the old one and moved over it, a running app keeps its map
+    with open(path + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(path + ".tmp", path)
+    return len(data)
+
+
+class TemplateTable():
+    """
+    A template file (or its bytes), checked once when opened: magic, format
+    version and checksum. Lookups copy a template out into a new ArenaTree.
+    """
+    def __init__(self, buffer):
+        if len(buffer) < _HEADER.size:
+            raise TemplateFileError("template file too short")
+        magic, version, count, checksum = _HEADER.unpack_from(buffer, 0)
+        if magic != _MAGIC:
+            raise TemplateFileError("not a template file")
+        if version != FORMAT_VERSION or count != SPEC_COUNT:
+            raise TemplateFileError(f"template file version {version}, this code reads {FORMAT_VERSION}")
+        if blake2b(memoryview(buffer)[_HEADER.size:], digest_size=16).digest() != checksum:
+            raise TemplateFileError("template file checksum doesn't match")
+        self._buffer = buffer
+
+    @classmethod
+    def open(cls, path=TEMPLATES_FILE):
+        with open(path, "rb") as file:
+            buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(buffer)
+        except TemplateFileError:
+            buffer.close()
+            raise
+
+    def tree(self, iv_mask, gender_code, has_nature=False):
+        """The template of a spec as a new arena tree (with new node ids)."""
+        entry = _HEADER.size + spec_index(iv_mask, gender_code, has_nature) * _ENTRY.size
+        offset, levels = _ENTRY.unpack_from(self._buffer, entry)
+        size = (1 << levels) - 1
+        tree = arena.ArenaTree(levels)
+        buffer = self._buffer
+        tree.iv[:] = buffer[offset:offset + size]
+        tree.braced[:] = buffer[offset + size:offset + 2 * size]
+        tree.gender[:] = buffer[offset + 2 * size:offset + 3 * size]
+        tree.present[:] = buffer[offset + 3 * size:offset + 4 * size]
+        tree.has_nature = bool(has_nature)
+        return tree
+
+
+_table = None
+_table_lock = Lock()
+
+
+def open_table(path=TEMPLATES_FILE):
+    """
+    The template table of the process, opened once. When the file is missing
+    or doesn't check out (corrupted, or from another format version) the
+    table is built again and written over it, or kept in memory when the
+    file can't be written.
+    """
+    global _table
+    with _table_lock:
+        if _table is None:
+            try:
+                _table = TemplateTable.open(path)
+            except (OSError, ValueError):
+                data = build_table()
+                try:
+                    write_table(path, data)
+                except OSError:
+                    pass
+                _table = TemplateTable(data)
+        return _table
+
+
+def template_plan(target, poke_bank=None, table=None):
+    """
+    First answer for a target: its template, with bank pokes put in place of
+    the nodes they fit (closest to the target first, the parents of a bank
+    poke are dropped). Gives a result dict like lib.find_best_tree, the tree
+    is only optimal when the bank has nothing to add.
+    """
+    table = table if table is not None else open_table()
+    bank = lib.as_poke_base(poke_bank)
+    tree = table.tree(target.iv_mask, target.gender_code, target.has_nature)
+    tree.bank_ids = {}
+    present = tree.present
+    # the bank may be shared by other sessions, it is only read
+    matching = lib.BankMatching(bank)
+    # slots are offspring first, so a slot is gone before its parents are looked at
+    for slot in range(1, len(present)):
+        if not present[slot]:
+            continue
+        if not present[(slot - 1) // 2] or (slot - 1) // 2 in tree.bank_ids:
+            present[slot] = 0
+            continue
+        poke_id = matching.consume(tree.key(slot))
+        if poke_id is not None:
+            tree.bank_ids[slot] = poke_id
+
+    breeds = sum(1 for slot in tree.slots() if tree.has_parents(slot))
+    wild = sum(1 for slot in tree.wild_slots() if slot not in tree.bank_ids)
+    root = tree.to_poke()
+    return {
+        "poke": root,
+        "cost": breeds * lib.BREED_COST + wild * lib.WILD_COST,
+        "exact": False,
+        "breeds": breeds,
+        "wild": wild,
+        "bank_used": len(tree.bank_ids),
+        "expanded": 0,
+        "score": lib.similarity_score(bank, [root.parent_male, root.parent_female]),
+    }
+
+
+if __name__ == "__main__":
+    size = write_table(sys.argv[1] if len(sys.argv) > 1 else TEMPLATES_FILE)
+    print(f"{SPEC_COUNT} specs, {size} bytes")
@@ -0,0 +1,30 @@
+import os
+import random
+import sys
+
+import pytest
+
+# the modules live at the top of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import lib  # noqa: E402
+
+
+def random_key(rng, min_ivs, max_ivs):
+    mask = sum(1 << i for i in rng.sample(range(lib.STAT_COUNT), rng.randint(min_ivs, max_ivs)))
+    return lib.poke_key(mask, rng.randint(lib.GENDER_FEMALE, lib.GENDER_MALE))
+
+
+def make_poke(key):
+    poke = lib.Poke()
+    poke.iv_mask, poke.gender_code = key & lib.FULL_MASK, key >> lib.STAT_COUNT
+    return poke
+
+
+def random_bank(rng, size, min_ivs=1, max_ivs=3):
+    return lib.PokeBase(make_poke(random_key(rng, min_ivs, max_ivs)) for _ in range(size))
+
+
+@pytest.fixture
+def rng():
+    return random.Random(7)
@@ -0,0 +1,32 @@
+import numpy as np
+
+import batch
+import lib
+
+from conftest import random_bank
+
+
+def test_top_trees_dont_depend_on_the_workers(rng):
+    bank = random_bank(rng, 200)
+    target = lib.Poke("+ + + + - - (f)")
+    runs = [
+        batch.search_random_trees(target, bank, n=20000, k=10, seed=3, workers=workers, chunk_size=4096)
+        for workers in (1, 2)
+    ]
+    assert [(tree["score"], tree["hash"]) for tree in runs[0]] == [(tree["score"], tree["hash"]) for tree in runs[1]]
+
+
+def test_top_trees_are_the_best_distinct_ones(rng):
+    bank = random_bank(rng, 200)
+    target = lib.Poke("+ + + - - - (m)")
+    trees = batch.search_random_trees(target, bank, n=5000, k=15, seed=1, chunk_size=1024)
+    scores = [tree["score"] for tree in trees]
+    assert scores == sorted(scores, reverse=True)
+    assert len({tree["hash"] for tree in trees}) == len(trees)
+    # the best tree generated comes first
+    all_scores = np.concatenate([
+        batch.score_trees(*batch.generate_trees(target, min(1024, 5000 - chunk * 1024), batch._chunk_rng(1, chunk))[::2],
+                          batch.bank_table(bank))
+        for chunk in range(5)
+    ])
+    assert scores[0] == all_scores.max()
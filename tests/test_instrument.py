@@ -0,0 +1,58 @@
+import threading
+import tracemalloc
+
+import pytest
+
+import instrument
+
+
+def work():
+    with instrument.phase("work"):
+        instrument.count("items", 3)
+        return [str(i) for i in range(1000)]
+
+
+@pytest.mark.parametrize("options", [{"memory": True}, {"profile": True}, {"memory": True, "profile": True}])
+def test_two_profiled_traces_at_once(options):
+    inside = threading.Barrier(2)
+    traces = [instrument.RequestTrace(f"request {i}", **options) for i in range(2)]
+    errors = []
+
+    def request(trace):
+        try:
+            with trace:
+                inside.wait(timeout=5)
+                work()
+                inside.wait(timeout=5)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=request, args=(trace,)) for trace in traces]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    assert sorted(trace.profiled for trace in traces) == [False, True]
+    for trace in traces:
+        assert trace.counters == {"items": 3}
+        assert trace.to_dict()["profiled"] == trace.profiled
+        if options.get("memory"):
+            assert (trace.memory_top is not None) == trace.profiled
+        if options.get("profile"):
+            assert (trace.profile_text is not None) == trace.profiled
+    assert not tracemalloc.is_tracing()
+    # the next request gets the profiler
+    with instrument.RequestTrace("next", **options) as trace:
+        work()
+    assert trace.profiled
+
+
+def test_tracemalloc_started_elsewhere_is_left_alone():
+    tracemalloc.start()
+    try:
+        with instrument.RequestTrace("request", memory=True) as trace:
+            work()
+        assert not trace.profiled and tracemalloc.is_tracing()
+    finally:
+        tracemalloc.stop()
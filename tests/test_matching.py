@@ -0,0 +1,78 @@
+import itertools
+import random
+import time
+
+import pytest
+
+import lib
+
+from conftest import make_poke, random_bank, random_key
+
+
+def fits(node_key, bank_key):
+    # a bank poke stands in for a tree poke of its gender with some of its IVs
+    return (bank_key >> lib.STAT_COUNT == node_key >> lib.STAT_COUNT
+            and node_key & ~bank_key & lib.FULL_MASK == 0)
+
+
+def brute_force_matched(keys, bank):
+    # most tree pokes that can get a bank poke, trying every assignment
+    options = [[None] + [key for key in bank.counts() if fits(node_key, key)] for node_key in keys]
+    best = 0
+    for assignment in itertools.product(*options):
+        taken = {}
+        for key in assignment:
+            if key is not None:
+                taken[key] = taken.get(key, 0) + 1
+        if all(count <= bank.count(key) for key, count in taken.items()):
+            best = max(best, sum(key is not None for key in assignment))
+    return best
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_optimal_assignment_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(60):
+        keys = [random_key(rng, 1, 3) for _ in range(rng.randint(1, 5))]
+        bank = random_bank(rng, rng.randint(0, 6), 1, 4)
+        assigned = lib.optimal_assignment(keys, bank)
+        taken = {}
+        for node_key, key in zip(keys, assigned):
+            if key is not None:
+                assert fits(node_key, key)
+                taken[key] = taken.get(key, 0) + 1
+        assert all(count <= bank.count(key) for key, count in taken.items())
+        assert sum(key is not None for key in assigned) == brute_force_matched(keys, bank)
+
+
+def test_matching_takes_the_bank_pokes_in_order():
+    key = lib.poke_key(0b000011, lib.GENDER_MALE)
+    bank = lib.PokeBase(make_poke(key) for _ in range(3))
+    ids = bank.ids(key)
+    first, second = lib.BankMatching(bank), lib.BankMatching(bank)
+    assert [first.consume(key) for _ in range(3)] == ids
+    assert first.consume(key) is None and first.available(key) == 0
+    # the bank and other matchings don't see what a matching took
+    assert second.available(key) == 3 and second.consume(key) == ids[0]
+    assert bank.ids(key) == ids and bank.count(key) == 3
+    assert first.consume(lib.poke_key(0b000001, lib.GENDER_FEMALE)) is None
+
+
+def match_time(size):
+    # best time of matching a few pokes of a key the bank has size pokes of
+    key = lib.poke_key(0b000111, lib.GENDER_FEMALE)
+    bank = lib.PokeBase(make_poke(key) for _ in range(size))
+    best = float('inf')
+    for _ in range(200):
+        start = time.perf_counter()
+        matching = lib.BankMatching(bank)
+        for _ in range(8):
+            matching.consume(key)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def test_matching_time_does_not_grow_with_the_bank():
+    small, large = match_time(100), match_time(100000)
+    # copying the ids of the key would be ~1000 times slower on the large bank
+    assert large < 10 * small + 20e-6
@@ -0,0 +1,113 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import lib
+import plan_codec
+import snapshot
+from subtree_cache import SubtreeCache
+
+from conftest import random_bank
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def bank(rng):
+    return random_bank(rng, 300)
+
+
+@pytest.fixture
+def plan(bank):
+    return lib.find_best_tree(lib.Poke("+ + + + + - (f) [Nat]"), bank, cache=SubtreeCache())
+
+
+def bank_ids(root, bank):
+    return sorted(poke.id for poke in lib.tree_pokes(root) if poke.id in bank)
+
+
+def test_binary_round_trip(plan, bank):
+    data = plan_codec.encode(plan, bank)
+    decoded = plan_codec.decode(data)
+    assert snapshot.freeze(decoded["poke"]) is snapshot.freeze(plan["poke"])
+    assert bank_ids(decoded["poke"], bank) == bank_ids(plan["poke"], bank)
+    for field in ("cost", "exact", "breeds", "wild", "bank_used"):
+        assert decoded[field] == plan[field]
+    assert decoded["poke"].has_nature
+    assert plan_codec.encode(decoded, bank) == data
+
+
+def test_json_round_trip(plan, bank):
+    data = plan_codec.to_json(plan, bank)
+    decoded = plan_codec.from_json(json.dumps(data))
+    assert snapshot.freeze(decoded["poke"]) is snapshot.freeze(plan["poke"])
+    assert decoded["hash"] == data["hash"] == plan_codec.plan_hash(plan, bank)
+
+
+def test_files_round_trip(plan, bank, tmp_path):
+    binary, text = str(tmp_path / "plan.bin"), str(tmp_path / "plan.json")
+    digest = plan_codec.save(binary, plan, bank)
+    assert plan_codec.save(text, plan, bank) == digest
+    assert plan_codec.load(binary)["hash"] == plan_codec.load(text)["hash"] == digest
+
+
+def test_same_plan_same_bytes(plan, bank):
+    # another search, new ids for the bred and wild pokes
+    again = lib.find_best_tree(lib.Poke("+ + + + + - (f) [Nat]"), bank, cache=SubtreeCache())
+    assert plan_codec.encode(again, bank) == plan_codec.encode(plan, bank)
+    assert plan_codec.plan_hash(again, bank) == plan_codec.plan_hash(plan, bank)
+
+
+def test_hash_is_stable_across_processes():
+    script = (
+        "import lib, plan_codec\n"
+        "root = lib.Poke('+ + + - - - (m)')\n"
+        "root.parent_male, root.parent_female = lib.Poke('+ + - - - - (m)'), lib.Poke('- + + - - - (f)')\n"
+        "print(plan_codec.plan_hash(root))\n"
+    )
+    hashes = {
+        subprocess.run([sys.executable, "-c", script], cwd=ROOT, capture_output=True, text=True, check=True).stdout
+        for _ in range(2)
+    }
+    assert len(hashes) == 1
+
+
+@pytest.mark.parametrize("damage", [
+    lambda data: data[:10],
+    lambda data: b"XXXX" + data[4:],
+    lambda data: data[:-1],
+    lambda data: data + b"x",
+    lambda data: data[:30] + bytes([data[30] ^ 1]) + data[31:],
+])
+def test_damaged_plans_are_refused(plan, bank, damage):
+    with pytest.raises(plan_codec.PlanFormatError):
+        plan_codec.decode(damage(plan_codec.encode(plan, bank)))
+
+
+def test_edited_json_is_refused(plan, bank):
+    data = plan_codec.to_json(plan, bank)
+    data["cost"] += 1
+    with pytest.raises(plan_codec.PlanFormatError):
+        plan_codec.from_json(data)
+
+
+@pytest.mark.parametrize("cost", [2.5, -1, 1 << 32, "3"])
+def test_costs_that_dont_fit_are_refused(plan, bank, cost):
+    with pytest.raises(ValueError, match="cost"):
+        plan_codec.encode(dict(plan, cost=cost), bank)
+    data = plan_codec.to_json(plan, bank)
+    data["cost"] = cost
+    with pytest.raises(plan_codec.PlanFormatError, match="cost"):
+        plan_codec.from_json(data)
+
+
+@pytest.mark.parametrize("field", ["nodes", "bank"])
+@pytest.mark.parametrize("slot", [-1, 1 << 20])
+def test_slots_outside_the_plan_are_refused(plan, bank, field, slot):
+    data = plan_codec.to_json(plan, bank)
+    data[field][-1][0] = slot
+    with pytest.raises(plan_codec.PlanFormatError, match="outside the plan"):
+        plan_codec.from_json(data)
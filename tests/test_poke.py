@@ -0,0 +1,33 @@
+import pytest
+
+import lib
+
+
+def test_stat_views_write_to_the_masks():
+    poke = lib.Poke("+ - - - - - (m)")
+    poke.stats[1].is_31 = True
+    poke.stats[2].is_braced = True
+    assert poke.get_stats() == "+ + * - - -"
+    poke.stats[2].is_31 = False
+    assert poke.get_stats() == "+ + - - - -"
+    poke.stats[0].str_to_stat("*")
+    assert (poke.iv_mask, poke.braced_mask) == (0b000011, 0b000001)
+    assert [str(stat) for stat in poke.stats] == ["*", "+", "-", "-", "-", "-"]
+
+
+def test_gender_and_nature_views_write_to_the_poke():
+    poke = lib.Poke("+ + - - - - (m)")
+    poke.gender.is_male = False
+    assert poke.gender_code == lib.GENDER_FEMALE and str(poke.gender) == "(f)"
+    poke.gender.str_to_gender("(?)")
+    assert poke.gender_code == lib.GENDER_UNKNOWN
+    poke.nature.has_nature = True
+    assert poke.has_nature and str(poke.nature) == "[Nat]"
+
+
+def test_stats_cant_be_replaced():
+    poke = lib.Poke("+ - - - - - (m)")
+    with pytest.raises(TypeError):
+        poke.stats[1] = lib.Stat(True)
+    with pytest.raises(AttributeError):
+        poke.stats = []
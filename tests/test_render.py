@@ -0,0 +1,60 @@
+import pytest
+
+import lib
+import render
+from subtree_cache import SubtreeCache
+
+from conftest import random_bank
+
+TARGET = "+ + + + + - (f)"
+
+
+@pytest.fixture
+def bank(rng):
+    return random_bank(rng, 40, 1, 3)
+
+
+def solve(bank):
+    return lib.find_best_tree(lib.Poke(TARGET), bank, cache=SubtreeCache())["poke"]
+
+
+def chain(length):
+    # a tree deeper than the recursion limit, each poke bred from a wild one
+    root = poke = lib.Poke("+ + - - - - (f)")
+    for _ in range(length):
+        poke.parent_male, poke.parent_female = lib.Poke("+ - - - - - (m)"), lib.Poke("+ + - - - - (f)")
+        poke = poke.parent_female
+    return root
+
+
+def test_same_plan_from_two_solves_has_the_same_hash(bank):
+    first, second = solve(bank), solve(bank)
+    assert {poke.id for poke in lib.tree_pokes(first)} != {poke.id for poke in lib.tree_pokes(second)}
+    for style in (render.STYLE_GRAPHVIZ, render.STYLE_SVG, render.STYLE_TEXT):
+        assert render.tree_hash(first, bank, style) == render.tree_hash(second, bank, style)
+    assert render.tree_to_svg(first, bank) == render.tree_to_svg(second, bank)
+    assert render.visualize_breeding_tree(first, bank)[0].source == render.visualize_breeding_tree(second, bank)[0].source
+
+
+def test_bank_pokes_change_the_hash(bank):
+    tree = solve(bank)
+    assert render.tree_hash(tree, bank) != render.tree_hash(tree)
+    names = render.node_names(tree, bank)
+    for poke in lib.tree_pokes(tree):
+        assert (names[id(poke)] == poke.id) == (poke.id in bank)
+
+
+def test_drawings_show_names_not_solve_ids(bank):
+    tree = solve(bank)
+    text = render.tree_to_text(tree, bank)
+    for poke in lib.tree_pokes(tree):
+        if poke.id not in bank:
+            assert poke.id not in text
+    assert text.startswith("#0: ")
+
+
+def test_deep_trees_are_drawn_without_recursion():
+    tree = chain(3000)
+    positions, leaves = render._layout(tree)
+    assert len(positions) == 2 * 3000 + 1 and leaves == 3001
+    assert render.tree_to_text(tree).count("\n") == 2 * 3000
@@ -0,0 +1,135 @@
+import random
+
+import pytest
+
+import lib
+import replan
+from subtree_cache import SubtreeCache
+
+from conftest import make_poke, random_bank, random_key
+
+TARGETS = ["+ + + + + + (f)", "+ + + + - - (m)", "- - + + + - (f) [Nat]", "+ - - - - - (m)"]
+
+
+def fresh_cost(target, bank):
+    return lib.find_best_tree(target, bank, cache=SubtreeCache())["cost"]
+
+
+def assert_same_as_fresh(planner):
+    for name, target in planner.targets.items():
+        assert planner.results[name]["cost"] == fresh_cost(target, planner.poke_bank)
+
+
+@pytest.fixture
+def planner(rng):
+    planner = replan.IncrementalPlanner(random_bank(rng, 150), cache=SubtreeCache())
+    for code in TARGETS:
+        planner.plan(lib.Poke(code))
+    return planner
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_bank_edits_match_a_fresh_solve(planner, seed):
+    rng = random.Random(seed)
+    for _ in range(8):
+        if rng.random() < 0.5:
+            planner.apply(added=[make_poke(random_key(rng, 1, 3))])
+        else:
+            # take out a bank poke one of the plans uses, when there is one
+            used = [
+                slot["source"]
+                for name in planner.results
+                for slot in replan.tree_slots(planner.results[name]["poke"], planner.poke_bank).values()
+                if slot["source"] not in ("wild", "bred")
+            ]
+            planner.apply(removed=[rng.choice(used) if used else next(iter(planner.poke_bank)).id])
+        assert_same_as_fresh(planner)
+
+
+def test_only_affected_plans_are_replanned(planner):
+    # a key with stats none of the 1 IV target has
+    poke = lib.Poke("- + - - - - (m)")
+    updates = planner.apply(added=[poke])
+    assert "+ - - - - - (m)" not in updates
+    assert set(updates) == planner.affected({poke.key})
+
+
+def test_sync_matches_a_fresh_solve(planner):
+    bank = lib.PokeBase(list(planner.poke_bank)[10:])
+    planner.sync(bank)
+    assert planner.poke_bank is bank
+    assert_same_as_fresh(planner)
+
+
+def test_forget_drops_the_index(planner):
+    for name in list(planner.targets):
+        planner.forget(name)
+    assert planner.targets == {} and planner._dependents == {}
+
+
+def used_ids(planner, name):
+    return [slot["source"] for slot in replan.tree_slots(planner.results[name]["poke"], planner.poke_bank).values()
+            if slot["source"] not in ("wild", "bred")]
+
+
+@pytest.fixture
+def solves(planner, monkeypatch):
+    # names the planner searched again
+    names = []
+    solve = planner._solve
+
+    def counted(name):
+        names.append(name)
+        return solve(name)
+    monkeypatch.setattr(planner, "_solve", counted)
+    return names
+
+
+def test_removing_an_unused_poke_changes_no_plan(planner, solves):
+    used = {poke_id for name in planner.targets for poke_id in used_ids(planner, name)}
+    unused = next(poke.id for poke in planner.poke_bank if poke.id not in used)
+    assert planner.apply(removed=[unused]) == {}
+    assert solves == []
+    assert_same_as_fresh(planner)
+
+
+def test_removed_poke_is_replaced_by_a_spare(planner, solves):
+    name = "+ + + + + + (f)"
+    used = used_ids(planner, name)
+    # a used poke whose key has a bank poke the plan doesn't use
+    poke, spare = next(
+        (planner.poke_bank.get(poke_id), other)
+        for poke_id in used
+        for other in planner.poke_bank.ids(planner.poke_bank.get(poke_id).key)
+        if other not in used
+    )
+    updates = planner.apply(removed=[poke.id])
+    assert solves == []
+    assert [(change["before"]["source"], change["after"]["source"]) for change in updates[name]["diff"]] == \
+        [(poke.id, spare)]
+    assert spare in used_ids(planner, name)
+    assert_same_as_fresh(planner)
+
+
+def test_removed_poke_without_a_spare_is_planned_again(planner, solves):
+    name = "+ + + + + + (f)"
+    poke = planner.poke_bank.get(used_ids(planner, name)[0])
+    planner.apply(removed=[other for other in planner.poke_bank.ids(poke.key) if other != poke.id])
+    del solves[:]
+    planner.apply(removed=[poke.id])
+    assert name in solves
+    assert poke.id not in used_ids(planner, name)
+    assert_same_as_fresh(planner)
+
+
+def test_sync_sees_an_id_whose_key_changed(planner):
+    name = "+ + + + + + (f)"
+    poke_id = used_ids(planner, name)[0]
+    bank = lib.PokeBase(list(planner.poke_bank))
+    bank.remove_poke(poke_id)
+    changed = lib.Poke("- - - - - - (m)")
+    changed.id = poke_id
+    bank.add_poke(changed)
+    planner.sync(bank)
+    assert poke_id not in used_ids(planner, name)
+    assert_same_as_fresh(planner)
@@ -0,0 +1,15 @@
+import lib
+import server
+import storage
+
+
+def test_plans_report_the_version_they_were_planned_on(tmp_path):
+    path = str(tmp_path / "bank.db")
+    store = storage.open_store(path)
+    store.add(lib.Poke("+ + - - - - (m)"))
+    version, _ = server._plan_in_worker(path, "+ + + - - - (f)")
+    assert version == store.version()
+    store.add(lib.Poke("- - + - - - (f)"))
+    # the search loads the bank as it is now, and says so
+    version, _ = server._plan_in_worker(path, "+ + + - - - (f)")
+    assert version == store.version()
@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+import lib
+import simulate
+import snapshot
+
+TARGET = "+ + + - - - (f)"
+
+
+def bred(code, male, female):
+    poke = lib.Poke(code)
+    poke.parent_male, poke.parent_female = male, female
+    male.offspring = female.offspring = poke
+    return poke
+
+
+def solver_like_tree():
+    # each breed braces two stats, 3 breeds and 4 wild pokes
+    root = lib.Poke(TARGET)
+    root.generate_random_parents(recursive=True, rng=random.Random(0))
+    return root
+
+
+def braced_leaves_tree():
+    # one breed of two braced pokes, only the gender can miss
+    return bred(TARGET, lib.Poke("* + - - - - (m)"), lib.Poke("- + * - - - (f)"))
+
+
+def unbraced_tree():
+    # one breed without braces, every stat comes from one parent only
+    return bred(TARGET, lib.Poke("+ + - - - - (m)"), lib.Poke("- - + - - - (f)"))
+
+
+def expected_cost(node):
+    # (breeds, pokes) expected from a snapshot node: a breed takes 1 / chance
+    # attempts on average, each from new parents
+    if node.male is None:
+        return 0.0, 1.0
+    chance = simulate.attempt_chance(node)
+    male_breeds, male_pokes = expected_cost(node.male)
+    female_breeds, female_pokes = expected_cost(node.female)
+    return (1 + male_breeds + female_breeds) / chance, (male_pokes + female_pokes) / chance
+
+
+def analytic_cost(tree):
+    breeds, pokes = expected_cost(snapshot.freeze(tree))
+    return breeds * lib.BREED_COST + pokes * lib.WILD_COST
+
+
+def test_same_seed_same_numbers():
+    tree = solver_like_tree()
+    first = simulate.simulate(tree, samples=20000, seed=3)
+    again = simulate.simulate(tree, samples=20000, seed=3)
+    other = simulate.simulate(tree, samples=20000, seed=4)
+    for name in ("breeds", "wild", "retries", "cost", "success"):
+        assert first[name] == again[name]
+    assert first["cost"]["mean"] != other["cost"]["mean"]
+
+
+@pytest.mark.parametrize("make_tree", [solver_like_tree, braced_leaves_tree, unbraced_tree])
+def test_mean_converges_to_the_expected_cost(make_tree):
+    tree = make_tree()
+    result = simulate.simulate(tree, samples=200000, seed=1)
+    expected = analytic_cost(tree)
+    low, high = result["cost"]["ci"]
+    assert abs(result["cost"]["mean"] - expected) < 0.02 * expected
+    assert low - 0.01 * expected <= expected <= high + 0.01 * expected
+
+
+def test_attempt_chances():
+    assert simulate.attempt_chance(snapshot.freeze(braced_leaves_tree())) == 0.5
+    assert simulate.attempt_chance(snapshot.freeze(unbraced_tree())) == 1 / 16
+    assert simulate.attempt_chance(snapshot.freeze(braced_leaves_tree()), buy_gender=True) == 1.0
+
+
+def test_ranking_is_by_expected_cost():
+    trees = [unbraced_tree(), solver_like_tree(), braced_leaves_tree()]
+    ranked = simulate.rank_by_expected_cost(trees, samples=20000)
+    assert [tree for _, tree, _ in ranked] == [trees[2], trees[1], trees[0]]
+    costs = [cost for cost, _, _ in ranked]
+    assert costs == sorted(costs)
+    assert costs == pytest.approx(sorted(analytic_cost(tree) for tree in trees), rel=0.05)
@@ -0,0 +1,121 @@
+import random
+import threading
+
+import pytest
+
+import lib
+from subtree_cache import SubtreeCache
+
+from conftest import make_poke, random_bank, random_key
+
+
+def brute_force_cost(keys, stock):
+    # cheapest cost of getting every key, trying each bank poke, wild catch and split
+    best = [float('inf')]
+
+    def search(frontier, cost):
+        if cost >= best[0]:
+            return
+        if not frontier:
+            best[0] = cost
+            return
+        key, rest = frontier[0], frontier[1:]
+        mask = key & lib.FULL_MASK
+        if stock.get(key, 0):
+            stock[key] -= 1
+            search(rest, cost)
+            stock[key] += 1
+        if lib.popcount(mask) <= 1:
+            search(rest, cost + lib.WILD_COST)
+        else:
+            for _, _, male, female in lib._SPLITS[mask]:
+                search(rest + (male, female), cost + lib.BREED_COST)
+
+    search(tuple(keys), 0)
+    return best[0]
+
+
+def check_tree(root, bank, used_ids):
+    # (breeds, wild) of a tree, checking its breeds and that bank pokes are used once
+    breeds = wild = 0
+    for poke in lib.tree_pokes(root):
+        if poke.parent_male is not None:
+            breeds += 1
+            male, female = poke.parent_male, poke.parent_female
+            assert male.gender_code == lib.GENDER_MALE and female.gender_code == lib.GENDER_FEMALE
+            assert male.iv_mask | female.iv_mask == poke.iv_mask
+        elif poke.id in bank:
+            assert poke.id not in used_ids
+            assert bank.get(poke.id).key == poke.key
+            used_ids.add(poke.id)
+        else:
+            wild += 1
+            assert lib.popcount(poke.iv_mask) <= 1
+    return breeds, wild
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_find_best_tree_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(40):
+        target = make_poke(random_key(rng, 2, 4))
+        bank = random_bank(rng, rng.randint(0, 8), 1, 3)
+        result = lib.find_best_tree(target, bank, cache=SubtreeCache())
+        assert result["exact"]
+        assert result["cost"] == brute_force_cost((target.key,), lib.bank_stock(bank))
+        breeds, wild = check_tree(result["poke"], bank, set())
+        assert breeds * lib.BREED_COST + wild * lib.WILD_COST == result["cost"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_plan_targets_matches_brute_force(seed):
+    rng = random.Random(seed)
+    for _ in range(25):
+        targets = [make_poke(random_key(rng, 2, 3)) for _ in range(rng.randint(1, 3))]
+        bank = random_bank(rng, rng.randint(0, 8), 1, 2)
+        result = lib.plan_targets(targets, bank, cache=SubtreeCache())
+        assert result["cost"] == brute_force_cost([target.key for target in targets], lib.bank_stock(bank))
+        assert [root.key for root in result["pokes"]] == [target.key for target in targets]
+        used_ids = set()
+        totals = [check_tree(root, bank, used_ids) for root in result["pokes"]]
+        assert sum(breeds + wild for breeds, wild in totals) == result["cost"]
+        assert len(used_ids) == result["bank_used"]
+
+
+def test_iter_best_trees_ends_with_the_best_tree(rng):
+    for _ in range(10):
+        target = make_poke(random_key(rng, 4, 6))
+        bank = random_bank(rng, 60)
+        best = lib.find_best_tree(target, bank, cache=SubtreeCache())
+        results = list(lib.iter_best_trees(target, bank, cache=SubtreeCache()))
+        costs = [result["cost"] for result in results]
+        assert costs == sorted(costs, reverse=True)
+        assert costs[-1] == best["cost"]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_realistic_banks_are_solved_exactly(seed):
+    # 6 IV targets against banks of a few hundred pokes with up to 4 IVs
+    rng = random.Random(seed)
+    for _ in range(5):
+        bank = random_bank(rng, rng.randint(200, 2000), 1, 4)
+        target = make_poke(lib.poke_key(lib.FULL_MASK, rng.randint(0, 1)))
+        assert lib.find_best_tree(target, bank, cache=SubtreeCache())["exact"]
+
+
+def test_sessions_sharing_the_cache_get_the_same_plans(rng):
+    bank = random_bank(rng, 300)
+    targets = [make_poke(random_key(rng, 4, 6)) for _ in range(6)]
+    expected = [lib.find_best_tree(target, bank, cache=SubtreeCache())["cost"] for target in targets]
+    cache = SubtreeCache()
+    results = {}
+
+    def session(index):
+        results[index] = [lib.find_best_tree(target, bank, cache=cache)["cost"] for target in targets]
+
+    threads = [threading.Thread(target=session, args=(index,)) for index in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert all(costs == expected for costs in results.values())
@@ -0,0 +1,116 @@
+import io
+import json
+
+import pytest
+
+import lib
+import storage
+
+ENTRIES = [
+    ("a1", "+ + - - - - ", "(m)"),
+    ("a2", "- - + + + - ", "(f)"),
+    ("a3", "+ - - - - + ", "(f)"),
+]
+
+
+def expected_keys():
+    return sorted(lib.Poke(stats + gender).key for _, stats, gender in ENTRIES)
+
+
+def write_export(path, file_format):
+    with open(path, "w") as file:
+        if file_format == "json":
+            json.dump([{"id": i, "stats": stats, "gender": gender} for i, stats, gender in ENTRIES], file)
+        elif file_format == "jsonl":
+            for i, stats, gender in ENTRIES:
+                file.write(json.dumps({"id": i, "stats": stats, "gender": gender}) + "\n")
+        elif file_format == "csv":
+            file.write("ID,Stats,Gender\n")
+            for i, stats, gender in ENTRIES:
+                file.write(f"{i},{stats},{gender}\n")
+        else:
+            file.write("# my bank\n\n")
+            for _, stats, gender in ENTRIES:
+                file.write(f"{stats}{gender}\n")
+
+
+@pytest.mark.parametrize("file_format, name", [
+    ("json", "bank.json"), ("jsonl", "bank.jsonl"), ("csv", "bank.csv"), ("text", "bank.txt"),
+])
+def test_each_format_reads_the_same_pokes(tmp_path, file_format, name):
+    path = str(tmp_path / name)
+    write_export(path, file_format)
+    assert storage.bank_file_format(name) == file_format
+    bank = storage.read_bank_file(path)
+    assert sorted(poke.key for poke in bank) == expected_keys()
+    if file_format != "text":
+        assert sorted(poke.id for poke in bank) == ["a1", "a2", "a3"]
+
+
+def test_binary_file_object(tmp_path):
+    path = str(tmp_path / "bank.json")
+    write_export(path, "json")
+    with open(path, "rb") as file:
+        bank = storage.read_bank_file(io.BytesIO(file.read()), "json")
+    assert sorted(poke.key for poke in bank) == expected_keys()
+
+
+def test_json_entries_split_across_reads(monkeypatch):
+    monkeypatch.setattr(storage, "_READ_SIZE", 7)
+    text = json.dumps([{"id": f"p{i}", "stats": "+ - - - - - (m)"} for i in range(50)])
+    assert len(storage.read_bank_file(io.StringIO(text), "json")) == 50
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', '[{"stats": "+ - - - - - (m)"}, {"stats"'])
+def test_malformed_json_is_refused(text):
+    with pytest.raises(ValueError):
+        list(storage.iter_bank_file(io.StringIO(text), "json"))
+
+
+def test_csv_without_stats_is_refused():
+    with pytest.raises(ValueError):
+        list(storage.iter_bank_file(io.StringIO("id,gender\nx,(m)\n"), "csv"))
+
+
+def test_import_file_into_a_store(tmp_path):
+    path = str(tmp_path / "bank.csv")
+    write_export(path, "csv")
+    store = storage.PokeStore(str(tmp_path / "bank.db"))
+    version = store.version()
+    assert store.import_file(path) == 3
+    # the same ids again replace the pokes
+    store.import_file(path)
+    assert len(store) == 3
+    assert store.version() > version
+    assert sorted(poke.key for poke in store.load()) == expected_keys()
+
+
+def test_load_with_version_matches_the_rows(tmp_path):
+    store = storage.PokeStore(str(tmp_path / "bank.db"))
+    store.add(lib.Poke("+ + - - - - (m)"))
+    version, bank = store.load_with_version()
+    assert version == store.version() and len(bank) == 1
+    store.add(lib.Poke("- - + - - - (f)"))
+    version, bank = store.load_with_version()
+    assert version == store.version() and len(bank) == 2
+    assert store.load() is bank
+
+
+@pytest.mark.parametrize("file_format, text, where", [
+    ("json", '[{"id": "a", "stats": "+ - - - - - (m)"}, {"id": "b"}]', "entry 2: poke b"),
+    ("jsonl", '{"stats": "+ - - - - - (m)"}\n\n{"stats": null}\n', "line 3"),
+    ("csv", "id,stats\na,+ - - - - -\nb,\n", "line 3: poke b"),
+])
+def test_entry_without_stats_is_named(file_format, text, where):
+    with pytest.raises(ValueError, match=where):
+        list(storage.iter_bank_file(io.StringIO(text), file_format))
+
+
+def test_import_error_counts_the_committed_chunks(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, "IMPORT_CHUNK", 2)
+    lines = ["+ - - - - - (m)", "- + - - - - (f)", "- - + - - - (m)", "[]"]
+    text = "\n".join(json.dumps({"stats": stats} if stats != "[]" else []) for stats in lines)
+    store = storage.PokeStore(str(tmp_path / "bank.db"))
+    with pytest.raises(ValueError, match=r"line 4: .*\(2 new pokes imported before it\)"):
+        store.import_file(io.StringIO(text), "jsonl")
+    assert len(store) == 2
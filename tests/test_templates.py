@@ -0,0 +1,84 @@
+import random
+
+import pytest
+
+import lib
+import templates
+from subtree_cache import SubtreeCache
+
+from conftest import make_poke, random_bank, random_key
+
+
+@pytest.fixture(scope="module")
+def data():
+    return templates.build_table()
+
+
+@pytest.fixture
+def fresh_table(monkeypatch):
+    # open_table keeps one table per process
+    monkeypatch.setattr(templates, "_table", None)
+
+
+def corrupt(data):
+    data = bytearray(data)
+    data[-1] ^= 0xFF
+    return bytes(data)
+
+
+def other_version(data):
+    magic, version, count, checksum = templates._HEADER.unpack_from(data, 0)
+    return templates._HEADER.pack(magic, version + 1, count, checksum) + data[templates._HEADER.size:]
+
+
+def test_table_checks_out(data):
+    table = templates.TemplateTable(data)
+    tree = table.tree(lib.FULL_MASK, lib.GENDER_FEMALE)
+    assert tree.key(0) == lib.poke_key(lib.FULL_MASK, lib.GENDER_FEMALE)
+
+
+@pytest.mark.parametrize("change, error", [
+    (corrupt, "checksum"),
+    (other_version, "version"),
+    (lambda data: b"NOPE" + data[4:], "not a template file"),
+    (lambda data: data[:10], "too short"),
+])
+def test_bad_tables_are_refused(data, change, error):
+    with pytest.raises(templates.TemplateFileError, match=error):
+        templates.TemplateTable(change(data))
+
+
+@pytest.mark.parametrize("change", [corrupt, other_version])
+def test_bad_file_is_rebuilt(tmp_path, data, fresh_table, change):
+    path = str(tmp_path / "templates.bin")
+    with open(path, "wb") as file:
+        file.write(change(data))
+    table = templates.open_table(path)
+    assert table.tree(0b000111, lib.GENDER_MALE).key(0) == lib.poke_key(0b000111, lib.GENDER_MALE)
+    # the file was written again, the next process maps it
+    templates.TemplateTable.open(path)
+
+
+def test_unwritable_file_falls_back_to_memory(tmp_path, fresh_table):
+    path = str(tmp_path / "missing" / "templates.bin")
+    table = templates.open_table(path)
+    assert isinstance(table, templates.TemplateTable)
+    assert templates.open_table(path) is table
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_template_plan_is_never_cheaper_than_the_exact_solve(data, seed):
+    rng = random.Random(seed)
+    table = templates.TemplateTable(data)
+    for _ in range(30):
+        target = make_poke(random_key(rng, 2, 6))
+        target.has_nature = rng.random() < 0.3
+        bank = random_bank(rng, rng.randint(0, 200), 1, 5)
+        plan = templates.template_plan(target, bank, table)
+        best = lib.find_best_tree(target, bank, cache=SubtreeCache())
+        assert plan["cost"] >= best["cost"]
+        if not len(bank):
+            assert plan["cost"] == best["cost"]
+        # the bank pokes are distinct and fit their slots
+        matched = [poke.id for poke in lib.tree_pokes(plan["poke"]) if poke.id in bank]
+        assert len(matched) == len(set(matched)) == plan["bank_used"]